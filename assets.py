@@ -0,0 +1,87 @@
+import gzip
+import hashlib
+import os
+
+from flask import Response, abort, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The page's stylesheet and script are read, hashed and compressed once at
+# import. They are served under content-hashed names (app.<hash>.js) that
+# never change, so browsers keep them for a year; index.html points at the
+# current names and is revalidated with its ETag on every load. Editing a
+# file under static/ takes a restart to show up.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+PAGE = 'index.html'
+FILES = ('app.css', 'app.js')
+MIMETYPES = {
+    '.css': 'text/css',
+    '.js': 'text/javascript',
+    '.html': 'text/html',
+}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+_assets = {}
+
+
+def _encodings(body):
+    encoded = {}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encoded['gzip'] = gzip.compress(body, 9, mtime=0)
+        if brotli is not None:
+            encoded['br'] = brotli.compress(body)
+    return encoded
+
+
+def _add(name, body):
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(body).hexdigest()[:12]
+    asset = {
+        'body': body,
+        'encoded': _encodings(body),
+        'etag': digest,
+        'mimetype': MIMETYPES.get(ext, 'application/octet-stream'),
+        'url': f'/static/{stem}.{digest}{ext}',
+    }
+    _assets[name] = dict(asset, cache=REVALIDATE)
+    _assets[f'{stem}.{digest}{ext}'] = dict(asset, cache=IMMUTABLE)
+    return asset
+
+
+def load():
+    _assets.clear()
+    with open(os.path.join(STATIC_DIR, PAGE), 'rb') as f:
+        page = f.read()
+    for name in FILES:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            asset = _add(name, f.read())
+        page = page.replace(f'"/static/{name}"'.encode(), f'"{asset["url"]}"'.encode())
+    _add(PAGE, page)
+
+
+def serve(name):
+    asset = _assets.get(name)
+    if asset is None:
+        abort(404)
+    encoding = None
+    for candidate in ('br', 'gzip'):
+        if candidate in asset['encoded'] and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+    response = Response(asset['encoded'][encoding] if encoding else asset['body'], mimetype=asset['mimetype'])
+    # Each encoding is its own representation, with its own strong ETag
+    response.set_etag(f"{asset['etag']}-{encoding}" if encoding else asset['etag'])
+    response.headers['Cache-Control'] = asset['cache']
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response.make_conditional(request)
+
+
+load()
@@ -0,0 +1,37 @@
+# python bench/kernels.py [rows]: best-of-5 time per function kernel on a
+# synthetic table with a 1000-value text key and two float columns. Types
+# are benchmarked with the parameters in their register(..., bench=) call.
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import registry
+from tables import NUM, TEXT, ColumnTable
+
+REPEAT = 5
+
+
+def main(rows):
+    rng = np.random.default_rng(0)
+    table = ColumnTable(['key', 'a', 'b'], [TEXT, NUM, NUM],
+                        [[f'k{i}' for i in rng.integers(0, 1000, rows)],
+                         rng.standard_normal(rows), rng.standard_normal(rows)])
+    lookup = ColumnTable(['key', 'label'], [TEXT, NUM], [[f'k{i}' for i in range(1000)], np.arange(1000.0)])
+    for name, spec in registry.FUNCTION_TYPES.items():
+        if spec['bench'] is None:
+            continue
+        tables = [table, lookup] if spec['inputs'] == 2 else [table]
+        best = float('inf')
+        for _ in range(REPEAT):
+            started = time.perf_counter()
+            out = registry.run(name, tables, spec['bench'])
+            best = min(best, time.perf_counter() - started)
+        print(f'{name:10} {best * 1000:9.2f} ms  {rows / best / 1e6:8.1f} M rows/s  -> {len(out)} rows')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
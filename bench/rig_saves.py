@@ -0,0 +1,58 @@
+# python bench/rig_saves.py [writers ...]: rig saves per second through
+# POST /api/workspaces/<id>/rigs with that many threads writing the same
+# 50 rigs, each thread with its own test client. The clock stops once the
+# write-behind queue is flushed, so every save has reached SQLite. The
+# databases live in a temporary directory that is gone afterwards.
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WRITES = 300
+RIG_COUNT = 50
+
+
+def run(app, writeback, count):
+    wid = f'bench-{count}'
+    app.app.test_client().post('/api/workspaces', json={'id': wid})
+    failed = []
+
+    def writer(n):
+        client = app.app.test_client()
+        for i in range(WRITES):
+            rig = {'id': f'rig-{(n * WRITES + i) % RIG_COUNT}', 'type': 'data',
+                   'x': i, 'y': n, 'data': {'value': i}}
+            response = client.post(f'/api/workspaces/{wid}/rigs', json=rig)
+            if response.status_code != 200:
+                failed.append(response.status_code)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writeback.writes.flush(wid)
+    elapsed = time.perf_counter() - started
+    saved = count * WRITES - len(failed)
+    print(f'{count:3} writers  {saved / elapsed:9.0f} saves/s  {len(failed)} failed')
+
+
+def main(writers):
+    with tempfile.TemporaryDirectory() as directory:
+        # Read by storage at import time
+        os.environ['RIGS_DB'] = os.path.join(directory, 'rigs.db')
+        os.environ['RIGS_WORKSPACE_DIR'] = os.path.join(directory, 'workspaces')
+        import app
+        import storage
+        import writeback
+        for count in writers:
+            run(app, writeback, count)
+        storage.close_db()
+
+
+if __name__ == '__main__':
+    main(tuple(int(n) for n in sys.argv[1:]) or (4, 8, 16))
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import storage
+
+MEMORY_BUDGET = int(os.environ.get('RIG_CACHE_BYTES', 64 * 1024 * 1024))
+# Set RIG_CACHE_DISK=1 to keep evicted results in rigs-cache.db next to rigs.db
+DISK_ENABLED = os.environ.get('RIG_CACHE_DISK', '') not in ('', '0')
+DISK_BUDGET = int(os.environ.get('RIG_CACHE_DISK_BYTES', 512 * 1024 * 1024))
+DISK_PATH = os.path.join(os.path.dirname(os.path.abspath(storage.DB_PATH)), 'rigs-cache.db')
+
+
+def node_key(workspace, rig, upstream_keys):
+    # A node's key covers its own stored data and its inputs' keys, so an edit
+    # changes the key of that rig and everything downstream of it, nothing else.
+    # Table cells live outside the rig JSON, so tables are also identified by
+    # workspace and id; their data carries rowsRev, which moves on every
+    # content change. Database rigs read their workspace's tables, so they
+    # carry the workspace too.
+    digest = hashlib.sha256()
+    digest.update(rig['type'].encode())
+    if rig['type'] in ('table', 'database'):
+        digest.update(f"{workspace}/{rig['id']}".encode())
+    digest.update(json.dumps(rig.get('data'), sort_keys=True, separators=(',', ':')).encode())
+    for key in upstream_keys:
+        digest.update(key.encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, budget=MEMORY_BUDGET, disk_path=None, disk_budget=DISK_BUDGET):
+        self.budget = budget
+        self.disk_path = disk_path
+        self.disk_budget = disk_budget
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {'hits': 0, 'diskHits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def _disk(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.disk_path, timeout=storage.BUSY_TIMEOUT)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('''CREATE TABLE IF NOT EXISTS results
+                            (key TEXT PRIMARY KEY, data BLOB, size INTEGER, used REAL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_used ON results(used)')
+            conn.commit()
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+        if self.disk_path:
+            conn = self._disk()
+            row = conn.execute('SELECT data FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+                conn.commit()
+                blob = zlib.decompress(row[0])
+                value = pickle.loads(blob)
+                self._remember(key, value, len(blob))
+                with self.lock:
+                    self.stats['diskHits'] += 1
+                return value
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        # Values may hold numpy arrays; the pickled size doubles as the byte cost
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(key, value, len(blob))
+        with self.lock:
+            self.stats['stores'] += 1
+        if self.disk_path:
+            conn = self._disk()
+            conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                         (key, zlib.compress(blob), len(blob), time.time()))
+            self._trim_disk(conn)
+            conn.commit()
+
+    def _remember(self, key, value, size):
+        if size > self.budget:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.budget:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.stats['evictions'] += 1
+
+    def _trim_disk(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        while total > self.disk_budget:
+            row = conn.execute('SELECT key, size FROM results ORDER BY used LIMIT 1').fetchone()
+            if row is None:
+                break
+            conn.execute('DELETE FROM results WHERE key = ?', (row[0],))
+            total -= row[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+        if self.disk_path:
+            conn = self._disk()
+            conn.execute('DELETE FROM results')
+            conn.commit()
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries), bytes=self.bytes,
+                         budget=self.budget, disk=bool(self.disk_path))
+        lookups = stats['hits'] + stats['diskHits'] + stats['misses']
+        stats['hitRate'] = round((stats['hits'] + stats['diskHits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+
+results = ResultCache(disk_path=DISK_PATH if DISK_ENABLED else None)
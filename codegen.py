@@ -0,0 +1,340 @@
+import hashlib
+import json
+import os
+import re
+import string
+
+import cache
+import storage
+
+# Coding-mode code generation: block graph -> tree -> source text.
+#
+# The diagram is read into a tree in one pass from the start block. A
+# block's first outgoing connection leads to the next statement. For a
+# condition, loop or function it leads into the body instead, and a second
+# connection leads to the statement after the body. Further connections
+# continue at the same level; a block reached twice is emitted once. The
+# end block closes the program wherever it is connected from.
+#
+# Each node of the tree is hashed together with its body, and the text of
+# a subtree is cached on that hash, its depth and the language. After an
+# edit, only the edited block's node and its ancestors are rendered again;
+# every other subtree comes from the cache. Templates are parsed once at
+# import. The whole program is also cached on a hash of the language and
+# the blocks' types, data and connections. Positions are not part of
+# either key, so dragging a block invalidates nothing.
+#
+# Block fields are pasted into source that /api/run executes, so each one is
+# checked for its role first: names must be identifiers, the operator one of
+# OPERATORS, a prompt is escaped into its string literal, and everything else
+# must be a plain expression (names, numbers, string literals, operators,
+# brackets and commas; no attributes, no '__' names, no statements).
+CACHE_BYTES = int(os.environ.get('RIG_CODEGEN_CACHE_BYTES', 16 * 1024 * 1024))
+# Only subtrees of up to this many blocks are cached whole; bigger ones are
+# emitted around their cached parts, which keeps deep nesting linear
+FRAGMENT_BLOCKS = 256
+LANGUAGES = ('python', 'javascript', 'java', 'cpp', 'csharp')
+COMPOUND = set(storage.COMPOUND_BLOCKS)
+EMPTY = '// No blocks connected. Add blocks and connect them to generate code.\n'
+
+# {indent} is the current nesting; other fields are keys of the block's data.
+# 'close' ends a body, 'empty' stands in for a body with nothing in it.
+TEMPLATES = {
+    'python': {
+        'start': '# Algorithm Start\n',
+        'end': '# Algorithm End\n',
+        'variable': '{indent}{name} = {value}\n',
+        'input': '{indent}{variable} = input("{prompt}")\n',
+        'output': '{indent}print({expression})\n',
+        'operation': '{indent}{result} = {left} {operator} {right}\n',
+        'condition': '{indent}if {condition}:\n',
+        'loop': '{indent}for {variable} in range({start}, {end}):\n',
+        'function': '{indent}def {name}({params}):\n',
+        'empty': '{indent}pass\n',
+    },
+    'javascript': {
+        'start': '// Algorithm Start\n',
+        'end': '// Algorithm End\n',
+        'variable': '{indent}let {name} = {value};\n',
+        'input': '{indent}let {variable} = prompt("{prompt}");\n',
+        'output': '{indent}console.log({expression});\n',
+        'operation': '{indent}let {result} = {left} {operator} {right};\n',
+        'condition': '{indent}if ({condition}) {{\n',
+        'loop': '{indent}for (let {variable} = {start}; {variable} < {end}; {variable}++) {{\n',
+        'function': '{indent}function {name}({params}) {{\n',
+        'close': '{indent}}}\n',
+    },
+    'java': {
+        'start': 'public class Algorithm {{\n    public static void main(String[] args) {{\n',
+        'end': '    }}\n}}\n',
+        'variable': '{indent}    int {name} = {value};\n',
+        'input': '{indent}    Scanner scanner = new Scanner(System.in);\n'
+                 '{indent}    System.out.println("{prompt}");\n'
+                 '{indent}    String {variable} = scanner.nextLine();\n',
+        'output': '{indent}    System.out.println({expression});\n',
+        'operation': '{indent}    int {result} = {left} {operator} {right};\n',
+        'condition': '{indent}    if ({condition}) {{\n',
+        'loop': '{indent}    for (int {variable} = {start}; {variable} < {end}; {variable}++) {{\n',
+        'function': '{indent}    public static void {name}({params}) {{\n',
+        'close': '{indent}    }}\n',
+    },
+    'cpp': {
+        'start': '#include <iostream>\nusing namespace std;\n\nint main() {{\n',
+        'end': '    return 0;\n}}\n',
+        'variable': '{indent}    int {name} = {value};\n',
+        'input': '{indent}    cout << "{prompt}";\n{indent}    cin >> {variable};\n',
+        'output': '{indent}    cout << {expression} << endl;\n',
+        'operation': '{indent}    int {result} = {left} {operator} {right};\n',
+        'condition': '{indent}    if ({condition}) {{\n',
+        'loop': '{indent}    for (int {variable} = {start}; {variable} < {end}; {variable}++) {{\n',
+        'function': '{indent}    void {name}({params}) {{\n',
+        'close': '{indent}    }}\n',
+    },
+    'csharp': {
+        'start': 'using System;\n\nclass Program {{\n    static void Main() {{\n',
+        'end': '    }}\n}}\n',
+        'variable': '{indent}        int {name} = {value};\n',
+        'input': '{indent}        Console.WriteLine("{prompt}");\n'
+                 '{indent}        string {variable} = Console.ReadLine();\n',
+        'output': '{indent}        Console.WriteLine({expression});\n',
+        'operation': '{indent}        int {result} = {left} {operator} {right};\n',
+        'condition': '{indent}        if ({condition}) {{\n',
+        'loop': '{indent}        for (int {variable} = {start}; {variable} < {end}; {variable}++) {{\n',
+        'function': '{indent}        static void {name}({params}) {{\n',
+        'close': '{indent}        }}\n',
+    },
+}
+
+
+class CodegenError(ValueError):
+    pass
+
+
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+PARAMETERS = re.compile(r'[ \t]*([A-Za-z_][A-Za-z0-9_]*[ \t]*(,[ \t]*[A-Za-z_][A-Za-z0-9_]*[ \t]*)*)?')
+OPERATORS = {'+', '-', '*', '/', '%', '**', '//'}
+# One token of a plain expression; string literals hold no backslashes.
+# Only spaces and tabs separate tokens: a newline would start a statement.
+TOKEN = re.compile(r'''[ \t]*(?:(?P<string>"[^"\\\n\r]*"|'[^'\\\n\r]*')|(?P<number>\d+(?:\.\d+)?)'''
+                   r'''|(?P<name>[A-Za-z_][A-Za-z0-9_]*)|(?P<op>\*\*|//|==|!=|<=|>=|[-+*/%<>(),\[\]]))''')
+BRACKETS = {'(': ')', '[': ']'}
+FIELDS = {
+    'name': 'identifier',
+    'variable': 'identifier',
+    'result': 'identifier',
+    'params': 'parameter list',
+    'operator': 'operator',
+    'prompt': 'text',
+}
+
+
+def _expression(text):
+    position, open_brackets = 0, []
+    while text[position:].strip(' \t'):
+        match = TOKEN.match(text, position)
+        if match is None:
+            return False
+        # A name run into a string would make a prefixed literal (f"...")
+        if match.group('string') and match.start('string') == position and position \
+                and (text[position - 1].isalnum() or text[position - 1] == '_'):
+            return False
+        if match.group('name') and '__' in match.group('name'):
+            return False
+        op = match.group('op')
+        if op in BRACKETS:
+            open_brackets.append(BRACKETS[op])
+        elif op in (')', ']') and (not open_brackets or open_brackets.pop() != op):
+            return False
+        position = match.end()
+    return not open_brackets
+
+
+def _field(field, value):
+    # The block's value as it may appear in generated source
+    text = _text(value)
+    kind = FIELDS.get(field, 'expression')
+    if kind == 'text':
+        return text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    if text == '':
+        return text
+    if kind == 'identifier':
+        ok = IDENTIFIER.fullmatch(text)
+    elif kind == 'parameter list':
+        ok = PARAMETERS.fullmatch(text)
+    elif kind == 'operator':
+        ok = text in OPERATORS
+    else:
+        ok = _expression(text)
+    if not ok:
+        raise CodegenError(f'{field} {text!r} is not a valid {kind}')
+    return text
+
+
+def _compile(template):
+    # Literal text and field names, alternating, so rendering is one join
+    parts, literal = [], ''
+    for text, field, _, _ in string.Formatter().parse(template):
+        literal += text
+        if field is not None:
+            parts += [literal, field]
+            literal = ''
+    return parts + [literal]
+
+
+COMPILED = {language: {kind: _compile(template) for kind, template in templates.items()}
+            for language, templates in TEMPLATES.items()}
+
+
+def _text(value):
+    # Data values print the way the page's template literals print them
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _render(parts, data, indent):
+    out = []
+    for i, part in enumerate(parts):
+        if i % 2 == 0:
+            out.append(part)
+        elif part == 'indent':
+            out.append(indent)
+        else:
+            out.append(_field(part, data[part]) if part in data else 'undefined')
+    return ''.join(out)
+
+
+def _ports(outgoing):
+    # Targets of a compound block's body and of what follows it. Connections
+    # saved before ports existed carry none; the first of those is the body.
+    if outgoing and not any(conn.get('port') for conn in outgoing):
+        return [outgoing[0]['target']], [conn['target'] for conn in outgoing[1:]]
+    return ([conn['target'] for conn in outgoing if conn.get('port') == 'body'],
+            [conn['target'] for conn in outgoing if conn.get('port') != 'body'])
+
+
+def build_tree(blocks, connections):
+    # Top-level nodes of the program. A node is a dict with the block, its
+    # nesting level and, for compound blocks, the list of body nodes.
+    by_id = {block['id']: block for block in blocks}
+    children = {}
+    for conn in connections:
+        children.setdefault(conn['source'], []).append(conn)
+    start = next((block for block in blocks if block.get('type') == 'start'), None)
+    if start is not None:
+        roots = [start['id']]
+    else:
+        targets = {conn['target'] for conn in connections}
+        roots = [block['id'] for block in blocks if block['id'] not in targets]
+        roots += [block['id'] for block in blocks if block['id'] in targets]
+    program, ending, nodes, placed = [], [], [], set()
+    # Explicit stack: deep nesting must not hit the recursion limit. Entries
+    # are (block id, list to append to, level); the body is pushed last so
+    # it is filled before the statements that follow its block.
+    stack = [(block_id, program, 0) for block_id in reversed(roots)]
+    while stack:
+        block_id, siblings, level = stack.pop()
+        block = by_id.get(block_id)
+        if block is None or block_id in placed:
+            continue
+        placed.add(block_id)
+        if block.get('type') == 'end':
+            siblings, level = ending, 0
+        node = {'block': block, 'level': level, 'body': None}
+        siblings.append(node)
+        nodes.append(node)
+        outgoing = children.get(block_id, [])
+        if block.get('type') in COMPOUND:
+            node['body'] = []
+            body, following = _ports(outgoing)
+            stack.extend((target, siblings, level) for target in reversed(following))
+            stack.extend((target, node['body'], level + 1) for target in reversed(body))
+        else:
+            stack.extend((conn['target'], siblings, level) for conn in reversed(outgoing))
+    # Every node comes after its ancestors in `nodes`, so walking it backwards
+    # hashes each body before the block that holds it
+    for node in reversed(nodes):
+        block = node['block']
+        digest = hashlib.sha256(json.dumps([block.get('type'), block.get('data')], sort_keys=True,
+                                           separators=(',', ':')).encode())
+        node['size'] = 1
+        for child in node['body'] or ():
+            digest.update(child['hash'].encode())
+            node['size'] += child['size']
+        node['hash'] = digest.hexdigest()
+    return program + ending
+
+
+fragments = cache.ResultCache(budget=CACHE_BYTES)
+
+
+def _emit(templates, language, program, out):
+    # One pass over the tree into `out`. A cached subtree is appended whole
+    # and not descended into; a small one is cached once its text is out.
+    stack = [('node', node) for node in reversed(program)]
+    starts = {}
+    while stack:
+        action, node = stack.pop()
+        key = f"{language}:{node['level']}:{node['hash']}"
+        if action == 'done':
+            fragments.put(key, ''.join(out[starts.pop(id(node)):]))
+            continue
+        if action == 'close':
+            indent = '    ' * node['level']
+            if not node['body'] and 'empty' in templates:
+                out.append(_render(templates['empty'], {}, indent + '    '))
+            if 'close' in templates:
+                out.append(_render(templates['close'], {}, indent))
+            continue
+        small = node['size'] <= FRAGMENT_BLOCKS
+        text = fragments.get(key) if small else None
+        if text is not None:
+            out.append(text)
+            continue
+        if small:
+            starts[id(node)] = len(out)
+            stack.append(('done', node))
+        block = node['block']
+        parts = templates.get(block.get('type'))
+        if parts:
+            out.append(_render(parts, block.get('data') or {}, '    ' * node['level']))
+        if node['body'] is not None:
+            stack.append(('close', node))
+            stack.extend(('node', child) for child in reversed(node['body']))
+
+
+def generate(language, blocks, connections):
+    templates = COMPILED.get(language) or COMPILED['python']
+    program = build_tree(blocks, connections)
+    if not program:
+        return EMPTY
+    out = []
+    _emit(templates, language, program, out)
+    return ''.join(out)
+
+
+def graph_key(language, blocks, connections):
+    graph = [language, [[block['id'], block.get('type'), block.get('data')] for block in blocks],
+             [[conn['source'], conn['target'], conn.get('port')] for conn in connections]]
+    return hashlib.sha256(json.dumps(graph, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+generated = cache.ResultCache(budget=CACHE_BYTES)
+
+
+def codegen(language, blocks, connections):
+    if language not in LANGUAGES:
+        raise CodegenError(f'Unknown language {language!r}')
+    try:
+        key = graph_key(language, blocks, connections)
+    except (KeyError, TypeError, AttributeError) as e:
+        raise CodegenError(f'Malformed block graph: {e}')
+    code = generated.get(key)
+    if code is None:
+        code = generate(language, blocks, connections)
+        generated.put(key, code)
+    return code, key
@@ -0,0 +1,296 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import storage
+import tables
+from tables import NUM, TEXT, ColumnTable
+
+# A database rig runs one read-only SELECT, either against a SQLite file in
+# DATABASE_DIR (rig.data.database) or, without one, against the workspace's
+# table rigs, each visible as a table named after its id with '-' as '_'
+# (rig-3 -> rig_3). Table rigs are copied into a private in-memory database
+# the first time a query names them, and again only when their rows change.
+#
+# Connections are kept per thread, each with its own prepared-statement
+# cache, so re-running or paging a query skips parsing and planning. An
+# authorizer allows reads only, and a progress handler aborts a query that
+# runs past QUERY_TIMEOUT.
+DATABASE_DIR = os.environ.get('RIG_DATABASE_DIR', 'databases')
+DATABASE_NAME = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}\.(db|sqlite|sqlite3)$')
+QUERY_TIMEOUT = float(os.environ.get('RIG_QUERY_TIMEOUT', 5))
+# Results handed to downstream rigs are capped at this many rows
+MAX_ROWS = int(os.environ.get('RIG_QUERY_MAX_ROWS', 1_000_000))
+PAGE_ROWS = 200
+MAX_PAGE_ROWS = 5000
+FETCH_ROWS = 4096
+STATEMENT_CACHE_SIZE = 128
+MAX_CONNECTIONS = 8
+# The progress handler runs every this many SQLite VM instructions
+PROGRESS_STEPS = 10000
+
+_local = threading.local()
+_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                 getattr(sqlite3, 'SQLITE_RECURSIVE', 33)}
+
+
+class QueryError(ValueError):
+    pass
+
+
+def list_databases():
+    if not os.path.isdir(DATABASE_DIR):
+        return []
+    return sorted(name for name in os.listdir(DATABASE_DIR) if DATABASE_NAME.match(name))
+
+
+def database_path(name):
+    if not isinstance(name, str) or not DATABASE_NAME.match(name):
+        raise QueryError(f'Invalid database name {name!r}')
+    path = os.path.join(DATABASE_DIR, name)
+    if not os.path.isfile(path):
+        raise QueryError(f'Database {name!r} not found in {DATABASE_DIR}')
+    return path
+
+
+def _read_only(action, *args):
+    return sqlite3.SQLITE_OK if action in _READ_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def _connection(key, open_conn):
+    # Same per-thread LRU as storage.get_db, keyed by file or workspace
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.conns = OrderedDict()
+        _local.pid = os.getpid()
+    conns = _local.conns
+    entry = conns.get(key)
+    if entry is not None:
+        conns.move_to_end(key)
+        return entry
+    entry = conns[key] = {'conn': open_conn(), 'loaded': {}}
+    while len(conns) > MAX_CONNECTIONS:
+        conns.popitem(last=False)[1]['conn'].close()
+    return entry
+
+
+def _open_file(path):
+    conn = sqlite3.connect(f'file:{os.path.abspath(path)}?mode=ro', uri=True, isolation_level=None,
+                           timeout=storage.BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute('PRAGMA query_only = ON')
+    return conn
+
+
+def _open_memory():
+    return sqlite3.connect(':memory:', isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
+
+
+def table_name(rig_id):
+    return rig_id.replace('-', '_')
+
+
+def _query(data):
+    return (data.get('query') or '').strip().rstrip(';').strip()
+
+
+def _mentioned(store, sql):
+    # The workspace's table rigs whose table name appears in the query
+    for (data,) in store.execute("SELECT data FROM rigs WHERE type = 'table'"):
+        rig = json.loads(data)
+        if re.search(rf'\b{re.escape(table_name(rig["id"]))}\b', sql, re.IGNORECASE):
+            yield rig
+
+
+def _table_version(rig):
+    data = rig.get('data') or {}
+    return data.get('columns'), data.get('rowCount'), data.get('rowsRev')
+
+
+def source_version(workspace, data):
+    # Part of the rig's cache key: changes whenever the data it reads may
+    # have, so results downstream of the rig are not served stale
+    try:
+        if data.get('database'):
+            path = database_path(data['database'])
+            return repr([(os.stat(p).st_mtime_ns, os.stat(p).st_size)
+                         for p in (path, path + '-wal') if os.path.exists(p)])
+        return repr([(rig['id'], _table_version(rig)) for rig in _mentioned(storage.get_db(workspace), _query(data))])
+    except (OSError, QueryError):
+        return ''
+
+
+def _identifier(name):
+    # A quoted SQL identifier; rig ids and column names are user text
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def _column_names(columns):
+    # SQL names for a rig's columns: unique regardless of case (as SQLite
+    # compares them), with blank ones named by position
+    names, seen = [], set()
+    for i, column in enumerate(columns):
+        name = str(column) if str(column).strip() else f'column_{i + 1}'
+        base, n = name, 2
+        while name.lower() in seen:
+            name, n = f'{base}_{n}', n + 1
+        seen.add(name.lower())
+        names.append(name)
+    return names
+
+
+def _load_tables(entry, workspace, sql):
+    # Copies in the table rigs the query mentions, a chunk at a time
+    conn = entry['conn']
+    store = storage.get_db(workspace)
+    for rig in list(_mentioned(store, sql)):
+        name = table_name(rig['id'])
+        data = rig.get('data') or {}
+        version = _table_version(rig)
+        if entry['loaded'].get(name) == version:
+            continue
+        columns = data.get('columns') or []
+        if not columns:
+            raise QueryError(f'Table rig {rig["id"]} has no columns')
+        first = storage.load_table(store, rig, None, 0, 0)
+        types = ['REAL' if dtype == NUM else 'TEXT' for dtype in first.dtypes]
+        insert = f'INSERT INTO {_identifier(name)} VALUES ({", ".join("?" * len(columns))})'
+        row_count = data.get('rowCount', 0)
+        entry['loaded'].pop(name, None)
+        conn.execute('BEGIN')
+        try:
+            conn.execute(f'DROP TABLE IF EXISTS {_identifier(name)}')
+            conn.execute(f'CREATE TABLE {_identifier(name)} (' + ', '.join(
+                f'{_identifier(column)} {kind}' for column, kind in zip(_column_names(columns), types)) + ')')
+            for start in range(0, row_count, tables.CHUNK_ROWS):
+                chunk = storage.load_table(store, rig, None, start, start + tables.CHUNK_ROWS)
+                # NaN binds as NULL, so numeric columns go in as they are
+                conn.executemany(insert, zip(*(column.tolist() if dtype == NUM else column
+                                               for dtype, column in zip(chunk.dtypes, chunk.columns))))
+        except sqlite3.Error as e:
+            # The connection is cached, so it must not stay in the transaction
+            conn.execute('ROLLBACK')
+            raise QueryError(f'Could not load table rig {rig["id"]}: {e}')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        entry['loaded'][name] = version
+
+
+def _prepare(workspace, data):
+    sql = _query(data)
+    if not sql:
+        raise QueryError('Database rig has no query')
+    if data.get('database'):
+        path = database_path(data['database'])
+        entry = _connection(('file', os.path.abspath(path)), lambda: _open_file(path))
+    else:
+        entry = _connection(('workspace', workspace), _open_memory)
+        entry['conn'].set_authorizer(None)
+        _load_tables(entry, workspace, sql)
+    return entry['conn'], sql
+
+
+def _execute(conn, sql, params=()):
+    deadline = time.monotonic() + QUERY_TIMEOUT
+    conn.set_authorizer(_read_only)
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    try:
+        return conn.execute(sql, params)
+    except sqlite3.Error as e:
+        _reset(conn)
+        raise _error(e)
+
+
+def _reset(conn):
+    conn.set_progress_handler(None, 0)
+    conn.set_authorizer(None)
+
+
+def _error(e):
+    if 'interrupted' in str(e):
+        return QueryError(f'Query took longer than {QUERY_TIMEOUT:g}s and was stopped')
+    if 'not authorized' in str(e):
+        return QueryError('Only read-only queries are allowed')
+    return QueryError(str(e))
+
+
+def _fetch(conn, cursor, size):
+    try:
+        return cursor.fetchmany(size)
+    except sqlite3.Error as e:
+        _reset(conn)
+        raise _error(e)
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return f'<{len(value)} bytes>'
+    return value
+
+
+def page(workspace, data, offset=0, limit=PAGE_ROWS):
+    # One page of the result, for the rig's preview. The query is wrapped in
+    # a LIMIT/OFFSET with bound parameters, so every page reuses one cached
+    # statement; one extra row tells whether there is a next page.
+    limit = max(1, min(int(limit), MAX_PAGE_ROWS))
+    offset = max(0, int(offset))
+    started = time.perf_counter()
+    conn, sql = _prepare(workspace, data)
+    cursor = _execute(conn, f'SELECT * FROM ({sql}) LIMIT ? OFFSET ?', (limit + 1, offset))
+    rows = _fetch(conn, cursor, limit + 1)
+    _reset(conn)
+    columns = [column[0] for column in cursor.description or ()]
+    return {
+        'columns': columns,
+        'rows': [[_cell(v) for v in row] for row in rows[:limit]],
+        'offset': offset,
+        'more': len(rows) > limit,
+        'ms': round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def _column(values):
+    # A fetched chunk of one column: float64 if every value is a number
+    if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+        return NUM, np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return TEXT, [_cell(v) for v in values]
+
+
+def load(workspace, data):
+    # The whole result as a column table for downstream rigs. Rows are
+    # fetched FETCH_ROWS at a time and turned into column chunks at once,
+    # so the full result never exists as Python rows.
+    conn, sql = _prepare(workspace, data)
+    cursor = _execute(conn, sql)
+    names = [column[0] for column in cursor.description or ()]
+    chunks = [[] for _ in names]
+    total = 0
+    while True:
+        rows = _fetch(conn, cursor, FETCH_ROWS)
+        if not rows:
+            break
+        total += len(rows)
+        if total > MAX_ROWS:
+            _reset(conn)
+            raise QueryError(f'Query returned more than {MAX_ROWS} rows')
+        for i, values in enumerate(zip(*rows)):
+            chunks[i].append(_column(values))
+    _reset(conn)
+    dtypes, columns = [], []
+    for parts in chunks:
+        if all(dtype == NUM for dtype, _ in parts):
+            dtypes.append(NUM)
+            columns.append(np.concatenate([c for _, c in parts]) if parts else np.array([], dtype=np.float64))
+        else:
+            dtypes.append(TEXT)
+            columns.append([cell for dtype, c in parts for cell in
+                            ([tables.decode_number(v) for v in c.tolist()] if dtype == NUM else c)])
+    return ColumnTable(names, dtypes, columns)
@@ -0,0 +1,252 @@
+import json
+import time
+from collections import deque
+
+import numpy as np
+
+import cache
+import database
+import neural
+import registry
+import sandbox
+import scheduler
+import storage
+from tables import NUM, TEXT, ColumnTable
+
+
+class GraphError(Exception):
+    pass
+
+
+class SkipRig(Exception):
+    pass
+
+
+def load_graph(conn):
+    rigs = {}
+    for (data,) in conn.execute('SELECT data FROM rigs'):
+        rig = json.loads(data)
+        rigs[rig['id']] = rig
+    edges = conn.execute('SELECT source, target FROM connections').fetchall()
+    return rigs, edges
+
+
+def upstream_map(rigs, edges):
+    upstream = {rig_id: [] for rig_id in rigs}
+    for source, target in edges:
+        if source in rigs and target in rigs:
+            upstream[target].append(source)
+    return upstream
+
+
+def ancestors(targets, upstream):
+    seen = set()
+    stack = [t for t in targets if t in upstream]
+    while stack:
+        rig_id = stack.pop()
+        if rig_id not in seen:
+            seen.add(rig_id)
+            stack.extend(upstream[rig_id])
+    return seen
+
+
+def descendants(rig_id, upstream):
+    downstream = {}
+    for target, sources in upstream.items():
+        for source in sources:
+            downstream.setdefault(source, []).append(target)
+    seen = set()
+    stack = list(downstream.get(rig_id, []))
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            stack.extend(downstream.get(node, []))
+    return seen
+
+
+def topo_order(upstream):
+    # Kahn's algorithm; ties keep insertion order so runs are reproducible
+    indegree = {rig_id: len(sources) for rig_id, sources in upstream.items()}
+    downstream = {rig_id: [] for rig_id in upstream}
+    for rig_id, sources in upstream.items():
+        for source in sources:
+            downstream[source].append(rig_id)
+    ready = deque(rig_id for rig_id, n in indegree.items() if n == 0)
+    order = []
+    while ready:
+        rig_id = ready.popleft()
+        order.append(rig_id)
+        for target in downstream[rig_id]:
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                ready.append(target)
+    if len(order) != len(upstream):
+        raise GraphError('Rig graph contains a cycle')
+    return order
+
+
+def as_table(value):
+    if isinstance(value, ColumnTable):
+        return value
+    if isinstance(value, dict) and 'columns' in value and 'rows' in value:
+        return ColumnTable.from_rows(value['columns'], value['rows'])
+    return None
+
+
+def is_table(value):
+    return as_table(value) is not None
+
+
+def to_json(value):
+    if isinstance(value, ColumnTable):
+        return value.to_json()
+    if isinstance(value, list):
+        return [to_json(v) for v in value]
+    return value
+
+
+def concat_tables(tables):
+    # Line inputs up by column name so several upstream tables can feed one function
+    if len(tables) == 1:
+        return tables[0]
+    names = []
+    for table in tables:
+        names += [name for name in table.names if name not in names]
+    dtypes, columns = [], []
+    for name in names:
+        parts = []
+        for table in tables:
+            if name in table.names:
+                i = table.index(name)
+                parts.append((table.dtypes[i], table.columns[i]))
+            else:
+                parts.append((NUM, np.full(len(table), np.nan)))
+        if all(dtype == NUM for dtype, _ in parts):
+            dtypes.append(NUM)
+            columns.append(np.concatenate([column for _, column in parts]))
+        else:
+            dtypes.append(TEXT)
+            columns.append([cell for dtype, column in parts for cell in
+                            (ColumnTable([name], [dtype], [column]).cells(0))])
+    return ColumnTable(names, dtypes, columns)
+
+
+def run_custom(data, inputs):
+    # Python custom code runs in the sandbox pool and sees the upstream
+    # outputs as JSON; JavaScript custom code still runs in the browser.
+    if data.get('language', 'javascript') != 'python':
+        raise SkipRig('JavaScript custom functions run in the browser')
+    output, _ = sandbox.pool.run(data.get('code') or '', [to_json(value) for value in inputs])
+    return as_table(output) or output
+
+
+def run_rig(rig, inputs, conn=None, workspace=None):
+    data = rig.get('data') or {}
+    if rig['type'] == 'table':
+        return storage.load_table(conn, rig)
+    if rig['type'] == 'database':
+        return database.load(workspace, data)
+    if rig['type'] == 'data':
+        return as_table(data) or data
+    if rig['type'] == 'function':
+        function_type = data.get('functionType', 'sum')
+        if function_type == 'custom':
+            return run_custom(data, inputs)
+        tables = [as_table(value) for value in inputs if is_table(value)]
+        if not tables:
+            raise ValueError('Function rig has no upstream table input')
+        spec = registry.FUNCTION_TYPES.get(function_type)
+        if spec and spec['inputs'] == 1:
+            tables = [concat_tables(tables)]
+        return registry.run(function_type, tables, data.get('params') or {})
+    if rig['type'] == 'neural':
+        # Predictions of the trained model for the upstream rows
+        model = neural.load_model(conn, rig['id'])
+        if model is None:
+            raise SkipRig('Neural rig has not been trained yet')
+        tables = [as_table(value) for value in inputs if is_table(value)]
+        if not tables:
+            raise ValueError('Neural rig has no upstream table input')
+        return neural.predict(model, concat_tables(tables))
+    if rig['type'] == 'chart':
+        return inputs[0] if len(inputs) == 1 else inputs
+    raise SkipRig(f"Rig type {rig['type']!r} does not run server-side")
+
+
+def run_node(rig, inputs, conn=None, workspace=None):
+    # Module-level so the process backend can pickle it; only rigs run
+    # inline (tables, databases, neural) need the workspace.
+    started = time.perf_counter()
+    try:
+        result = {'status': 'success', 'output': run_rig(rig, inputs, conn, workspace)}
+    except SkipRig as e:
+        result = {'status': 'skipped', 'error': str(e)}
+    except Exception as e:
+        result = {'status': 'error', 'error': str(e)}
+    result['ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def graph_keys(workspace, rigs, upstream, order):
+    keys = {}
+    for rig_id in order:
+        upstream_keys = [keys[s] for s in upstream[rig_id]]
+        if rigs[rig_id]['type'] == 'database':
+            upstream_keys.append(database.source_version(workspace, rigs[rig_id].get('data') or {}))
+        keys[rig_id] = cache.node_key(workspace, rigs[rig_id], upstream_keys)
+    return keys
+
+
+def run(workspace, targets=None, backend=None, max_workers=None, on_result=None, cancelled=None):
+    # Run the whole graph, or only what the requested rigs depend on.
+    # Independent branches run concurrently; sources run inline. Function
+    # results are memoized on the rig's data plus its inputs' keys, and
+    # upstream rigs are skipped when every consumer was a cache hit.
+    conn = storage.get_db(workspace)
+    rigs, edges = load_graph(conn)
+    upstream = upstream_map(rigs, edges)
+    if targets:
+        keep = ancestors(targets, upstream)
+        upstream = {rig_id: [s for s in sources if s in keep]
+                    for rig_id, sources in upstream.items() if rig_id in keep}
+    order = topo_order(upstream)
+    keys = graph_keys(workspace, rigs, upstream, order)
+    hits = {}
+    for rig_id in order:
+        if rigs[rig_id]['type'] == 'function':
+            output = cache.results.get(keys[rig_id])
+            if output is not None:
+                hits[rig_id] = {'status': 'success', 'output': output, 'ms': 0.0, 'cached': True}
+    if targets:
+        wanted = set(targets)
+        consumers = {rig_id: [] for rig_id in order}
+        for rig_id in order:
+            for source in upstream[rig_id]:
+                consumers[source].append(rig_id)
+        needed = set()
+        for rig_id in reversed(order):
+            if rig_id in hits or rig_id in wanted or any(c in needed and c not in hits for c in consumers[rig_id]):
+                needed.add(rig_id)
+        order = [rig_id for rig_id in order if rig_id in needed]
+        upstream = {rig_id: [s for s in upstream[rig_id] if s in needed] if rig_id not in hits else []
+                    for rig_id in order}
+    results = scheduler.run_dag(upstream, order, run_node, rigs, backend, max_workers,
+                                offload=lambda rig_id: rigs[rig_id]['type'] == 'function',
+                                done=hits, inline=lambda rig, inputs: run_node(rig, inputs, conn, workspace),
+                                on_result=on_result, cancelled=cancelled)
+    for rig_id, result in results.items():
+        if rig_id not in hits and rigs[rig_id]['type'] == 'function' and result['status'] == 'success':
+            cache.results.put(keys[rig_id], result['output'])
+    return order, results
+
+
+def result_json(result):
+    return dict(result, output=to_json(result['output'])) if 'output' in result else result
+
+
+def execute(workspace, targets=None, backend=None, max_workers=None, on_result=None, cancelled=None):
+    # on_result, when given, receives (rig_id, JSON result) as each rig finishes
+    report = (lambda rig_id, result: on_result(rig_id, result_json(result))) if on_result else None
+    order, results = run(workspace, targets, backend, max_workers, report, cancelled)
+    return order, {rig_id: result_json(result) for rig_id, result in results.items()}
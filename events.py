@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+import time
+
+import storage
+
+# Each client stream sends the changes since the revision it last saw. A
+# commit in this process wakes the streams of that workspace at once; other
+# workers' commits are picked up by re-reading the revision every
+# POLL_SECONDS. A stream only computes its next delta once the previous one
+# has been written to the socket, so a slow client never builds a queue: it
+# gets one bigger delta later, in which repeated updates of a rig (a drag)
+# collapse into its latest version.
+POLL_SECONDS = float(os.environ.get('RIG_EVENTS_POLL', 1.0))
+BATCH_SECONDS = int(os.environ.get('RIG_EVENTS_BATCH_MS', 50)) / 1000.0
+HEARTBEAT_SECONDS = 15
+# Streams end after this long and the browser reconnects, so a worker
+# thread is never held indefinitely by one tab
+STREAM_SECONDS = int(os.environ.get('RIG_EVENTS_STREAM_SECONDS', 300))
+# Change and job streams a process serves at once. Each holds a server
+# thread, so by default they may take half of gunicorn's threads and API
+# requests always have the other half; streams beyond this get 503 and
+# are told to retry after RETRY_SECONDS.
+MAX_STREAMS = int(os.environ.get('RIG_MAX_STREAMS', max(1, int(os.environ.get('GUNICORN_THREADS', 16)) // 2)))
+RETRY_SECONDS = 5
+
+_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+_changed = threading.Condition()
+_versions = {}
+
+
+def notify(workspace):
+    with _changed:
+        _versions[workspace] = _versions.get(workspace, 0) + 1
+        _changed.notify_all()
+
+
+storage.commit_listeners.append(notify)
+
+
+def acquire_stream():
+    return _slots.acquire(blocking=False)
+
+
+def release_stream():
+    _slots.release()
+
+
+def _version(workspace):
+    with _changed:
+        return _versions.get(workspace, 0)
+
+
+def _wait(workspace, seen, timeout):
+    with _changed:
+        _changed.wait_for(lambda: _versions.get(workspace, 0) != seen, timeout)
+
+
+def _event(name, data, event_id=None):
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+def stream(workspace, since):
+    conn = storage.get_db(workspace)
+    started = last_sent = time.monotonic()
+    yield f'retry: {int(POLL_SECONDS * 1000)}\n\n'
+    while time.monotonic() - started < STREAM_SECONDS:
+        seen = _version(workspace)
+        if storage.current_rev(conn) > since:
+            changes = storage.changes_since(conn, since)
+            since = changes['rev']
+            yield _event('changes', changes, since)
+            last_sent = time.monotonic()
+            # Let a burst of edits pile up into the next delta
+            time.sleep(BATCH_SECONDS)
+            continue
+        if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+            yield ': ping\n\n'
+            last_sent = time.monotonic()
+        _wait(workspace, seen, POLL_SECONDS)
@@ -0,0 +1,20 @@
+import os
+
+# Picked up automatically by `gunicorn app:app` from the working directory.
+# Each open /events or /jobs/<id>/events stream holds a thread for up to
+# RIG_EVENTS_STREAM_SECONDS, so workers are threaded. A worker serves at most
+# RIG_MAX_STREAMS streams (default: half of GUNICORN_THREADS) and answers
+# further ones with 503, keeping the rest of its threads for API requests.
+# Size GUNICORN_THREADS for the number of open tabs: with
+# one worker and the defaults, 8 tabs at once get live updates.
+# One worker: queued writes are only visible to reads in the process that
+# queued them (see writeback.py)
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+
+def worker_exit(server, worker):
+    # Persist rig saves still held by the write-behind queue
+    import writeback
+    writeback.writes.flush_all()
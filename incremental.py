@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+
+import cache
+import engine
+import registry
+import storage
+from tables import ColumnTable
+
+# Running (sum, count) per input column for sum/average rigs, keyed by the
+# rig's cache key. A cell edit moves the key forward, so the state follows it.
+MAX_STATES = 1024
+INCREMENTAL_FUNCTIONS = {'sum', 'average'}
+
+_states = OrderedDict()
+_lock = threading.Lock()
+
+
+class PatchError(Exception):
+    pass
+
+
+def _load_state(key):
+    with _lock:
+        return _states.pop(key, None)
+
+
+def _store_state(key, state):
+    with _lock:
+        _states[key] = state
+        while len(_states) > MAX_STATES:
+            _states.popitem(last=False)
+
+
+def _aggregate(table):
+    acc = {name: [0.0, 0] for name in table.names}
+    for name, values in registry.numeric_values(table).items():
+        acc[name] = [float(values.sum()), len(values)]
+    return {'columns': list(table.names), 'acc': acc}
+
+
+def _output(state, function_type):
+    columns = [name for name in state['columns'] if state['acc'][name][1]]
+    if function_type == 'sum':
+        row = [state['acc'][name][0] for name in columns]
+    else:
+        row = [state['acc'][name][0] / state['acc'][name][1] for name in columns]
+    return ColumnTable.from_rows(columns, [row])
+
+
+def _apply_delta(state, column, old, new):
+    entry = state['acc'].setdefault(column, [0, 0])
+    if column not in state['columns']:
+        state['columns'].append(column)
+    old, new = registry.to_number(old), registry.to_number(new)
+    if old is not None:
+        entry[0] -= old
+        entry[1] -= 1
+    if new is not None:
+        entry[0] += new
+        entry[1] += 1
+
+
+def _check_shape(cells, columns, add_columns):
+    for name, items, kind in (('cells', cells, dict), ('columns', columns, dict), ('addColumns', add_columns, str)):
+        if not isinstance(items, (list, tuple)) or not all(isinstance(item, kind) for item in items):
+            raise PatchError(f'{name} must be a list of {"objects" if kind is dict else "names"}')
+
+
+def _check_patch(data, cells, columns):
+    row_count = data.get('rowCount', 0)
+    names = data.get('columns', [])
+    for cell in cells:
+        row, col = cell.get('row'), cell.get('col')
+        if not isinstance(row, int) or not isinstance(col, int) \
+                or not 0 <= row < row_count or not 0 <= col < len(names):
+            raise PatchError(f'Cell ({row}, {col}) is outside the table')
+    for column in columns:
+        col = column.get('col')
+        if not isinstance(col, int) or not 0 <= col < len(names):
+            raise PatchError(f'Column {col} is outside the table')
+
+
+def patch_table(workspace, rig_id, cells=(), columns=(), append_rows=0, add_columns=()):
+    # Persist the edit, then bring sum/average rigs fed by this table up to
+    # date from their running aggregates and re-run only the downstream cone.
+    _check_shape(cells, columns, add_columns)
+    with storage.transaction(workspace) as conn:
+        rigs, edges = engine.load_graph(conn)
+        rig = rigs.get(rig_id)
+        if rig is None or rig['type'] != 'table':
+            raise PatchError(f'{rig_id} is not a table rig')
+        upstream = engine.upstream_map(rigs, edges)
+        order = engine.topo_order(upstream)
+        old_keys = engine.graph_keys(workspace, rigs, upstream, order)
+        data = rig.setdefault('data', {})
+        if not isinstance(append_rows, int) or append_rows < 0:
+            raise PatchError('appendRows must be a non-negative integer')
+        _check_patch(dict(data, rowCount=data.get('rowCount', 0) + append_rows,
+                          columns=data.get('columns', []) + list(add_columns)), cells, columns)
+        previous = storage.patch_table(conn, rig, [(c['row'], c['col'], c.get('value')) for c in cells],
+                                       [(c['col'], c.get('name')) for c in columns],
+                                       append_rows, add_columns)
+        deltas = [(data['columns'][c['col']], old, c.get('value')) for c, old in zip(cells, previous)]
+        rev = storage.current_rev(conn)
+    new_keys = engine.graph_keys(workspace, rigs, upstream, order)
+
+    cone = engine.descendants(rig_id, upstream)
+    for target in cone:
+        data = rigs[target].get('data') or {}
+        if rigs[target]['type'] != 'function' or rig_id not in upstream[target] \
+                or data.get('functionType', 'sum') not in INCREMENTAL_FUNCTIONS:
+            continue
+        structural = columns or append_rows or add_columns
+        state = _load_state(old_keys[target]) if not structural else None
+        if state is not None:
+            for column, old, new in deltas:
+                _apply_delta(state, column, old, new)
+        else:
+            _, inputs = engine.run(workspace, upstream[target])
+            if any(inputs[s]['status'] != 'success' for s in upstream[target]):
+                continue
+            tables = [engine.as_table(inputs[s]['output']) for s in upstream[target]
+                      if engine.is_table(inputs[s]['output'])]
+            state = _aggregate(engine.concat_tables(tables))
+        _store_state(new_keys[target], state)
+        cache.results.put(new_keys[target], _output(state, data.get('functionType', 'sum')))
+
+    results = {}
+    if cone:
+        _, results = engine.execute(workspace, sorted(cone))
+        results = {node: result for node, result in results.items() if node in cone}
+    return rev, results
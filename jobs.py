@@ -0,0 +1,286 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import engine
+import events
+import neural
+import scheduler
+import storage
+import writeback
+
+# Long runs go to a small per-process pool so request threads return at once.
+# Job rows live in the workspace database, so any worker can report on or
+# cancel a job another worker is running. Each row records the process that
+# owns it; a queued or running job whose owner has exited (the pool went
+# with it) is marked failed the next time it is read.
+WORKERS = int(os.environ.get('RIG_JOB_WORKERS', 2))
+MAX_JOBS = int(os.environ.get('RIG_MAX_JOBS', 200))
+# Progress and partial results are written at most this often
+PROGRESS_SECONDS = 0.25
+# How often a running job looks for a cancel flag set by another worker
+CANCEL_POLL_SECONDS = 0.2
+FINISHED = ('succeeded', 'failed', 'cancelled')
+COLUMNS = 'id, kind, status, params, created, started, finished, progress, results, error, cancel, seq, owner'
+# pid plus a per-process token, so a restarted worker that gets the same pid
+# does not adopt its predecessor's jobs
+_token = uuid.uuid4().hex
+
+_pools = {}
+_pools_lock = threading.Lock()
+_changed = threading.Condition()
+_cancelled = {}  # job id -> True once this process has seen its cancel flag
+
+
+class JobError(Exception):
+    pass
+
+
+class MissingJob(JobError):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _pool():
+    with _pools_lock:
+        pool = _pools.get(os.getpid())
+        if pool is None:
+            pool = _pools[os.getpid()] = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='job')
+    return pool
+
+
+def _notify():
+    with _changed:
+        _changed.notify_all()
+
+
+def _owner():
+    return f'{os.getpid()}:{_token}'
+
+
+def _alive(owner):
+    pid, _, token = (owner or '').partition(':')
+    if not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return token == _token
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reap(conn, job):
+    # Fails a job that can no longer finish because its owner is gone
+    if job['status'] in FINISHED or _alive(job['owner']):
+        return job
+    error = 'The worker process running this job exited'
+    conn.execute("UPDATE jobs SET status = 'failed', finished = ?, error = ?, seq = seq + 1 "
+                 "WHERE id = ? AND status IN ('queued', 'running')", (time.time(), error, job['id']))
+    _notify()
+    return dict(job, status='failed', error=error, seq=job['seq'] + 1)
+
+
+def _row(row):
+    job = dict(zip(COLUMNS.split(', '), row))
+    for key in ('params', 'progress', 'results'):
+        job[key] = json.loads(job[key]) if job[key] else None
+    job['cancel'] = bool(job['cancel'])
+    return job
+
+
+class Job:
+    # Handed to a job kind's runner: report() for progress, result() for a
+    # finished node, check() to stop early once the job is cancelled.
+    def __init__(self, workspace, job_id, params):
+        self.workspace = workspace
+        self.id = job_id
+        self.params = params
+        self.progress = {}
+        self.results = {}
+        self.saved = 0.0
+        self.polled = 0.0
+
+    def _save(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.saved < PROGRESS_SECONDS:
+            return
+        self.saved = now
+        storage.get_db(self.workspace).execute(
+            'UPDATE jobs SET progress = ?, results = ?, seq = seq + 1 WHERE id = ?',
+            (json.dumps(self.progress), json.dumps(self.results), self.id))
+        _notify()
+
+    def report(self, **progress):
+        self.progress.update(progress)
+        self._save()
+
+    def result(self, node, result):
+        self.results[node] = result
+        self.progress['done'] = len(self.results)
+        self._save()
+
+    def cancelled(self):
+        if _cancelled.get(self.id):
+            return True
+        now = time.monotonic()
+        if now - self.polled >= CANCEL_POLL_SECONDS:
+            self.polled = now
+            row = storage.get_db(self.workspace).execute('SELECT cancel FROM jobs WHERE id = ?',
+                                                         (self.id,)).fetchone()
+            if row and row[0]:
+                _cancelled[self.id] = True
+        return bool(_cancelled.get(self.id))
+
+    def check(self):
+        if self.cancelled():
+            raise Cancelled()
+
+
+def run_execute(job):
+    params = job.params
+    targets = params.get('rigs')
+    job.report(done=0)
+    engine.execute(job.workspace, targets, params.get('backend'), params.get('maxWorkers'),
+                   on_result=job.result, cancelled=job.cancelled)
+    job.check()
+
+
+def run_train(job):
+    # Trains a neural rig on its upstream tables; the loss curve streams as
+    # progress and the rig records a summary of the stored model.
+    rig_id = job.params.get('rig')
+    conn = storage.get_db(job.workspace)
+    rigs, edges = engine.load_graph(conn)
+    rig = rigs.get(rig_id)
+    if rig is None or rig['type'] != 'neural':
+        raise JobError(f'{rig_id} is not a neural rig')
+    sources = engine.upstream_map(rigs, edges)[rig_id]
+    if not sources:
+        # engine.run treats no targets as the whole graph
+        raise JobError('Neural rig has no upstream table input')
+    _, inputs = engine.run(job.workspace, sources)
+    tables = [engine.as_table(inputs[s]['output']) for s in sources
+              if inputs[s]['status'] == 'success' and engine.is_table(inputs[s]['output'])]
+    if not tables:
+        raise JobError('Neural rig has no upstream table input')
+    table = engine.concat_tables(tables)
+    job.report(rows=len(table))
+    # Job params override the rig's own settings only where they are given
+    settings = dict(rig.get('data') or {},
+                    **{k: job.params[k] for k in neural.DEFAULTS if job.params.get(k) is not None})
+    model = neural.train(table, settings, job.report, job.check)
+    with storage.transaction(job.workspace) as conn:
+        meta = neural.save_model(conn, rig_id, model)
+    summary = {k: meta[k] for k in ('inputs', 'targets', 'rows', 'seconds')}
+    summary.update(version=job.id, finalLoss=meta['curve'][-1])
+    writeback.writes.merge(job.workspace, rig_id, {'data': {'model': summary}})
+    job.report(model=summary)
+
+
+KINDS = {
+    'execute': run_execute,
+    'train': run_train,
+}
+
+
+def _finish(job, status, error=None):
+    job._save(force=True)
+    storage.get_db(job.workspace).execute(
+        'UPDATE jobs SET status = ?, finished = ?, error = ?, seq = seq + 1 WHERE id = ?',
+        (status, time.time(), error, job.id))
+    _cancelled.pop(job.id, None)
+    _notify()
+
+
+def _run(workspace, job_id, kind, params):
+    job = Job(workspace, job_id, params)
+    conn = storage.get_db(workspace)
+    started = conn.execute("UPDATE jobs SET status = 'running', started = ?, seq = seq + 1 "
+                           "WHERE id = ? AND status = 'queued'", (time.time(), job_id)).rowcount
+    if not started:
+        return
+    _notify()
+    try:
+        KINDS[kind](job)
+    except Cancelled:
+        _finish(job, 'cancelled')
+    except Exception as e:
+        _finish(job, 'cancelled' if job.cancelled() else 'failed', str(e))
+    else:
+        _finish(job, 'cancelled' if job.cancelled() else 'succeeded')
+
+
+def submit(workspace, kind, params):
+    if kind not in KINDS:
+        raise JobError(f'Unknown job kind {kind!r}')
+    if not isinstance(params, dict):
+        raise JobError('Job params must be an object')
+    if kind == 'execute':
+        try:
+            scheduler.check_options(params.get('backend'), params.get('maxWorkers'))
+        except ValueError as e:
+            raise JobError(str(e))
+    job_id = uuid.uuid4().hex
+    with storage.transaction(workspace) as conn:
+        conn.execute("INSERT INTO jobs (id, kind, status, params, created, owner) VALUES (?, ?, 'queued', ?, ?, ?)",
+                     (job_id, kind, json.dumps(params), time.time(), _owner()))
+        conn.execute(f"DELETE FROM jobs WHERE status IN {FINISHED} AND id NOT IN "
+                     '(SELECT id FROM jobs ORDER BY created DESC LIMIT ?)', (MAX_JOBS,))
+    _pool().submit(_run, workspace, job_id, kind, params)
+    return get(workspace, job_id)
+
+
+def get(workspace, job_id):
+    conn = storage.get_db(workspace)
+    row = conn.execute(f'SELECT {COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if row is None:
+        raise MissingJob(f'Job {job_id} not found')
+    return _reap(conn, _row(row))
+
+
+def list_jobs(workspace):
+    # Without the (possibly large) partial results
+    conn = storage.get_db(workspace)
+    return [dict(_reap(conn, _row(row)), results=None) for row in conn.execute(
+        f'SELECT {COLUMNS} FROM jobs ORDER BY created DESC').fetchall()]
+
+
+def cancel(workspace, job_id):
+    # A queued job is cancelled on the spot; a running one stops at its next
+    # check, finishing any nodes already in flight.
+    conn = storage.get_db(workspace)
+    get(workspace, job_id)
+    conn.execute('UPDATE jobs SET cancel = 1, seq = seq + 1 WHERE id = ?', (job_id,))
+    conn.execute("UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                 (time.time(), job_id))
+    _notify()
+    return get(workspace, job_id)
+
+
+def stream(workspace, job_id):
+    # Server-Sent Events: a 'progress' event whenever the job row changes,
+    # then one 'done' event. Other workers' updates are seen by polling.
+    # Like the change stream it ends after events.STREAM_SECONDS and the
+    # browser reconnects, starting with the job's current state.
+    seq = None
+    started = time.monotonic()
+    while time.monotonic() - started < events.STREAM_SECONDS:
+        job = get(workspace, job_id)
+        if job['seq'] != seq:
+            seq = job['seq']
+            finished = job['status'] in FINISHED
+            yield f"event: {'done' if finished else 'progress'}\ndata: {json.dumps(job)}\n\n"
+            if finished:
+                return
+        with _changed:
+            _changed.wait(CANCEL_POLL_SECONDS)
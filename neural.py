@@ -0,0 +1,198 @@
+import io
+import json
+import time
+
+import numpy as np
+
+from tables import NUM, ColumnTable
+
+# A neural rig is an MLP whose layer sizes are rig.data.layers: the first is
+# the number of input columns, the last the number of target columns. Hidden
+# layers use rig.data.activation, the output layer is linear (mse) or a
+# softmax (crossentropy). Training is mini-batch Adam in float32 over the
+# whole batch at once, so a small network over a million rows takes seconds.
+ACTIVATIONS = {
+    'relu': (lambda z: np.maximum(z, 0), lambda a: (a > 0).astype(a.dtype)),
+    'tanh': (np.tanh, lambda a: 1 - a * a),
+    'sigmoid': (lambda z: 1 / (1 + np.exp(-z)), lambda a: a * (1 - a)),
+}
+LOSSES = ('mse', 'crossentropy')
+DEFAULTS = {
+    'epochs': 5,
+    'batchSize': 1024,
+    'learningRate': 0.01,
+    'loss': 'mse',
+    'seed': 0,
+}
+BETA1, BETA2, EPSILON = 0.9, 0.999, 1e-8
+
+
+class TrainingError(ValueError):
+    pass
+
+
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def _columns(table, names, count, skip=()):
+    # Named columns, or the first `count` numeric columns not already used
+    if names:
+        missing = [name for name in names if name not in table.names]
+        if missing:
+            raise TrainingError(f'Unknown column {missing[0]!r}')
+    else:
+        names = [name for name, dtype in zip(table.names, table.dtypes)
+                 if dtype == NUM and name not in skip][:count]
+    if len(names) != count:
+        raise TrainingError(f'Expected {count} numeric columns, found {len(names)}')
+    columns = []
+    for name in names:
+        i = table.index(name)
+        if table.dtypes[i] != NUM:
+            raise TrainingError(f'Column {name!r} is not numeric')
+        columns.append(table.columns[i])
+    return names, np.column_stack(columns).astype(np.float32)
+
+
+def init_weights(layers, activation, rng):
+    weights = []
+    for fan_in, fan_out in zip(layers, layers[1:]):
+        scale = np.sqrt((2.0 if activation == 'relu' else 1.0) / fan_in)
+        weights.append((rng.standard_normal((fan_in, fan_out)).astype(np.float32) * scale,
+                        np.zeros(fan_out, dtype=np.float32)))
+    return weights
+
+
+def forward(weights, x, activation, loss='mse'):
+    act = ACTIVATIONS[activation][0]
+    outputs = [x]
+    for i, (w, b) in enumerate(weights):
+        z = outputs[-1] @ w + b
+        outputs.append(act(z) if i < len(weights) - 1 else z)
+    if loss == 'crossentropy':
+        outputs[-1] = _softmax(outputs[-1])
+    return outputs
+
+
+def train(table, settings, progress=None, check=None):
+    # settings: layers, activation and the DEFAULTS keys, plus optional
+    # 'inputs'/'targets' column names. progress(**fields) gets the 1-based
+    # epoch, the per-epoch loss curve and the running loss of the current
+    # epoch, after every epoch and every half second; check() may raise to
+    # stop early.
+    settings = dict(DEFAULTS, **{k: v for k, v in settings.items() if v is not None})
+    layers = [int(n) for n in settings.get('layers') or []]
+    activation = settings.get('activation', 'relu')
+    loss = settings['loss']
+    if len(layers) < 2 or min(layers) < 1:
+        raise TrainingError('A network needs at least an input and an output layer')
+    if activation not in ACTIVATIONS:
+        raise TrainingError(f'Unknown activation {activation!r}')
+    if loss not in LOSSES:
+        raise TrainingError(f'Unknown loss {loss!r}')
+    inputs, x = _columns(table, settings.get('inputs'), layers[0])
+    targets, y = _columns(table, settings.get('targets'), layers[-1], skip=inputs)
+    keep = ~(np.isnan(x).any(axis=1) | np.isnan(y).any(axis=1))
+    x, y = x[keep], y[keep]
+    if not len(x):
+        raise TrainingError('No complete rows to train on')
+    mean, std = x.mean(axis=0), x.std(axis=0)
+    std[std == 0] = 1
+    x = (x - mean) / std
+
+    rng = np.random.default_rng(int(settings['seed']))
+    weights = init_weights(layers, activation, rng)
+    moments = [[np.zeros_like(p) for p in layer for _ in (0, 1)] for layer in weights]
+    grad_act = ACTIVATIONS[activation][1]
+    lr = float(settings['learningRate'])
+    batch_size = max(1, int(settings['batchSize']))
+    epochs = max(1, int(settings['epochs']))
+    step = 0
+    curve = []
+    reported = time.monotonic()
+    started = time.perf_counter()
+    for epoch in range(epochs):
+        order = rng.permutation(len(x))
+        total = 0.0
+        for start in range(0, len(x), batch_size):
+            batch = order[start:start + batch_size]
+            xb, yb = x[batch], y[batch]
+            outputs = forward(weights, xb, activation, loss)
+            diff = outputs[-1] - yb
+            if loss == 'mse':
+                total += float(np.square(diff).sum())
+                delta = diff * (2.0 / len(batch))
+            else:
+                total += float(-(yb * np.log(outputs[-1] + 1e-12)).sum())
+                delta = diff / len(batch)
+            step += 1
+            correction = np.sqrt(1 - BETA2 ** step) / (1 - BETA1 ** step)
+            for i in range(len(weights) - 1, -1, -1):
+                w, b = weights[i]
+                grads = (outputs[i].T @ delta, delta.sum(axis=0))
+                if i:
+                    delta = (delta @ w.T) * grad_act(outputs[i])
+                m_w, v_w, m_b, v_b = moments[i]
+                for param, grad, m, v in ((w, grads[0], m_w, v_w), (b, grads[1], m_b, v_b)):
+                    m *= BETA1
+                    m += (1 - BETA1) * grad
+                    v *= BETA2
+                    v += (1 - BETA2) * grad * grad
+                    param -= lr * correction * m / (np.sqrt(v) + EPSILON)
+            if progress and time.monotonic() - reported >= 0.5:
+                reported = time.monotonic()
+                progress(epoch=epoch + 1, epochs=epochs, loss=curve,
+                         batchLoss=total / (start + len(batch)) / y.shape[1])
+            if check:
+                check()
+        curve.append(total / len(x) / y.shape[1])
+        if progress:
+            progress(epoch=epoch + 1, epochs=epochs, loss=curve, batchLoss=curve[-1])
+    return {
+        'layers': layers,
+        'activation': activation,
+        'loss': loss,
+        'inputs': inputs,
+        'targets': targets,
+        'rows': int(len(x)),
+        'curve': curve,
+        'seconds': round(time.perf_counter() - started, 3),
+        'weights': weights,
+        'mean': mean,
+        'std': std,
+    }
+
+
+def save_model(conn, rig_id, model):
+    # Weights go into an .npz blob: raw float32 arrays, not JSON numbers
+    arrays = {'mean': model['mean'], 'std': model['std']}
+    for i, (w, b) in enumerate(model['weights']):
+        arrays[f'w{i}'], arrays[f'b{i}'] = w, b
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    meta = {k: v for k, v in model.items() if k not in ('weights', 'mean', 'std')}
+    conn.execute('INSERT OR REPLACE INTO models VALUES (?, ?, ?)',
+                 (rig_id, json.dumps(meta), buffer.getvalue()))
+    return meta
+
+
+def load_model(conn, rig_id):
+    row = conn.execute('SELECT meta, weights FROM models WHERE rig_id = ?', (rig_id,)).fetchone()
+    if row is None:
+        return None
+    model = json.loads(row[0])
+    with np.load(io.BytesIO(row[1])) as arrays:
+        model['mean'], model['std'] = arrays['mean'], arrays['std']
+        model['weights'] = [(arrays[f'w{i}'], arrays[f'b{i}']) for i in range(len(model['layers']) - 1)]
+    return model
+
+
+def predict(model, table):
+    # One column per target, named pred_<target>
+    _, x = _columns(table, model['inputs'], len(model['inputs']))
+    out = forward(model['weights'], (x - model['mean']) / model['std'], model['activation'], model['loss'])[-1]
+    return ColumnTable([f'pred_{name}' for name in model['targets']], [NUM] * out.shape[1],
+                       [out[:, i].astype(np.float64) for i in range(out.shape[1])])
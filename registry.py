@@ -0,0 +1,363 @@
+import math
+import operator
+
+import numpy as np
+
+from tables import NUM, TEXT, ColumnTable
+
+# Function rig types. Each is declared once with its parameter schema and a
+# kernel that works on whole columns; the page builds its function picker
+# and parameter fields from describe(), so a new operation only needs a
+# register() call here. Kernels take the upstream table (all inputs lined
+# up by column name) or, when a type declares several inputs, the list of
+# upstream tables in connection order.
+
+# Comparison and arithmetic operators double as numpy ufuncs on float columns
+COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'contains': lambda a, b: str(b) in str(a),
+}
+
+ARITHMETIC = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '**': operator.pow,
+}
+
+
+def to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else value
+    if isinstance(value, str):
+        value = value.strip()
+        for cast in (int, float):
+            try:
+                return cast(value)
+            except ValueError:
+                pass
+    return None
+
+
+def numeric_values(table):
+    # Numeric cells per column: float columns are masked in one pass, text
+    # columns fall back to parsing the cells that look like numbers.
+    columns = {}
+    for name, dtype, column in zip(table.names, table.dtypes, table.columns):
+        if dtype == NUM:
+            values = column[~np.isnan(column)]
+        else:
+            values = [to_number(cell) for cell in column]
+            values = np.array([v for v in values if v is not None], dtype=np.float64)
+        if len(values):
+            columns[name] = values
+    return columns
+
+
+def _scalar_table(columns, values):
+    return ColumnTable(columns, [NUM] * len(columns), [np.array([v], dtype=np.float64) for v in values])
+
+
+def fn_sum(table, params):
+    columns = numeric_values(table)
+    return _scalar_table(list(columns), [float(np.sum(v)) for v in columns.values()])
+
+
+def fn_average(table, params):
+    columns = numeric_values(table)
+    return _scalar_table(list(columns), [float(np.mean(v)) for v in columns.values()])
+
+
+def fn_filter(table, params):
+    # Without a condition, filter drops blank rows (new tables start with some)
+    column = params.get('column')
+    if column is None:
+        mask = np.zeros(len(table), dtype=bool)
+        for dtype, values in zip(table.dtypes, table.columns):
+            if dtype == NUM:
+                mask |= ~np.isnan(values)
+            else:
+                mask |= np.array([cell not in ('', None) for cell in values], dtype=bool)
+        return table.take(mask)
+    if column not in table.names:
+        raise ValueError(f'Unknown column {column!r}')
+    op = params.get('op', '==')
+    compare = COMPARISONS.get(op)
+    if compare is None:
+        raise ValueError(f'Unknown filter operator {op!r}')
+    i = table.index(column)
+    expected = params.get('value')
+    expected_number = to_number(expected)
+    if table.dtypes[i] == NUM and expected_number is not None and op != 'contains':
+        with np.errstate(invalid='ignore'):
+            return table.take(compare(table.columns[i], expected_number))
+    mask = np.zeros(len(table), dtype=bool)
+    for j, cell in enumerate(table.cells(i)):
+        cell_number = to_number(cell)
+        try:
+            if cell_number is not None and expected_number is not None and op != 'contains':
+                mask[j] = compare(cell_number, expected_number)
+            else:
+                mask[j] = compare('' if cell is None else str(cell), '' if expected is None else str(expected))
+        except TypeError:
+            pass
+    return table.take(mask)
+
+
+def fn_map(table, params):
+    # Without an operation, map just turns numeric strings into numbers
+    op = params.get('op')
+    apply = ARITHMETIC.get(op)
+    if op is not None and apply is None:
+        raise ValueError(f'Unknown map operator {op!r}')
+    operand = to_number(params.get('operand'))
+    if apply is None or operand is None:
+        apply = None
+    targets = [params['column']] if params.get('column') else table.names
+    dtypes, columns = list(table.dtypes), list(table.columns)
+    for name in targets:
+        if name not in table.names:
+            continue
+        i = table.index(name)
+        if dtypes[i] == NUM:
+            if apply is not None:
+                with np.errstate(all='ignore'):
+                    column = apply(columns[i], operand)
+                # inf has no JSON form; like the text path's errors it is blank
+                column[np.isinf(column)] = np.nan
+                columns[i] = column
+            continue
+        cells = []
+        for cell in columns[i]:
+            number = to_number(cell)
+            if number is not None:
+                try:
+                    cell = apply(number, operand) if apply else number
+                except (ArithmeticError, OverflowError):
+                    cell = ''
+                if isinstance(cell, complex) or (isinstance(cell, float) and not math.isfinite(cell)):
+                    cell = ''
+            cells.append(cell)
+        columns[i] = cells
+    return ColumnTable(table.names, dtypes, columns)
+
+
+def fn_min(table, params):
+    columns = numeric_values(table)
+    return _scalar_table(list(columns), [float(np.min(v)) for v in columns.values()])
+
+
+def fn_max(table, params):
+    columns = numeric_values(table)
+    return _scalar_table(list(columns), [float(np.max(v)) for v in columns.values()])
+
+
+def _numbers(table, i):
+    # A column as float64, NaN where a cell is not a number
+    if table.dtypes[i] == NUM:
+        return table.columns[i]
+    return np.array([np.nan if v is None else v for v in map(to_number, table.columns[i])], dtype=np.float64)
+
+
+def _keys(table, i):
+    # Key cells in one comparable array: floats for number columns, text otherwise
+    if table.dtypes[i] == NUM:
+        return table.columns[i]
+    return np.array(['' if cell is None else str(cell) for cell in table.columns[i]])
+
+
+def _missing(keys):
+    return np.isnan(keys) if keys.dtype.kind == 'f' else keys == ''
+
+
+GROUP_AGGREGATES = ('sum', 'average', 'min', 'max', 'count')
+
+
+def fn_groupby(table, params):
+    # Sort once by group, then reduce every value column over the runs
+    by = params['by']
+    if by not in table.names:
+        raise ValueError(f'Unknown column {by!r}')
+    agg = params.get('agg', 'sum')
+    key_index = table.index(by)
+    keys = _keys(table, key_index)
+    keep = ~_missing(keys)
+    groups, inverse = np.unique(keys[keep], return_inverse=True)
+    names = [name for name, dtype in zip(table.names, table.dtypes) if name != by and dtype == NUM]
+    if params.get('columns'):
+        names = [name for name in params['columns'] if name != by]
+    out_names, out_dtypes, out_columns = [by], [table.dtypes[key_index]], [groups]
+    if table.dtypes[key_index] != NUM:
+        out_columns = [groups.tolist()]
+    order = np.argsort(inverse, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0]) if len(order) else np.array([], dtype=int)
+    for name in names:
+        if name not in table.names:
+            raise ValueError(f'Unknown column {name!r}')
+        values = _numbers(table, table.index(name))[keep]
+        present = ~np.isnan(values)
+        counts = np.bincount(inverse, weights=present, minlength=len(groups))
+        if agg == 'count':
+            result = counts
+        elif agg in ('sum', 'average'):
+            result = np.bincount(inverse, weights=np.where(present, values, 0), minlength=len(groups))
+            if agg == 'average':
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    result = np.where(counts > 0, result / np.maximum(counts, 1), np.nan)
+            else:
+                result = np.where(counts > 0, result, np.nan)
+        else:
+            reduce = np.fmin if agg == 'min' else np.fmax
+            result = reduce.reduceat(values[order], starts) if len(starts) else np.array([])
+        out_names.append(name)
+        out_dtypes.append(NUM)
+        out_columns.append(np.asarray(result, dtype=np.float64))
+    return ColumnTable(out_names, out_dtypes, out_columns)
+
+
+def _pick(dtype, column, index):
+    # Rows by index; -1 gives an empty cell (unmatched side of a left join)
+    if dtype == NUM:
+        picked = column[np.maximum(index, 0)] if len(column) else np.full(len(index), np.nan)
+        return np.where(index >= 0, picked, np.nan)
+    return [column[i] if i >= 0 else '' for i in index.tolist()]
+
+
+def fn_join(tables, params):
+    # Sort-merge join: the right keys are sorted once, and every left key
+    # finds its run of matches with two binary searches.
+    left, right = tables
+    left_on = params.get('leftOn') or params['on']
+    right_on = params.get('rightOn') or params['on']
+    for table, name in ((left, left_on), (right, right_on)):
+        if name not in table.names:
+            raise ValueError(f'Unknown column {name!r}')
+    left_keys, right_keys = _keys(left, left.index(left_on)), _keys(right, right.index(right_on))
+    if left_keys.dtype.kind != right_keys.dtype.kind:
+        # Number on one side, text on the other: compare as text
+        left_keys = np.array([str(v) for v in left.cells(left.index(left_on))])
+        right_keys = np.array([str(v) for v in right.cells(right.index(right_on))])
+    order = np.argsort(right_keys, kind='stable')
+    sorted_keys = right_keys[order]
+    lo = np.searchsorted(sorted_keys, left_keys, side='left')
+    hi = np.searchsorted(sorted_keys, left_keys, side='right')
+    counts = np.where(_missing(left_keys), 0, hi - lo)
+    how = params.get('how', 'inner')
+    if how == 'left':
+        emitted = np.maximum(counts, 1)
+    else:
+        emitted = counts
+    left_index = np.repeat(np.arange(len(left)), emitted)
+    offsets = np.arange(emitted.sum()) - np.repeat(np.cumsum(emitted) - emitted, emitted)
+    matched = np.repeat(counts > 0, emitted)
+    right_index = np.where(matched, order[np.minimum(np.repeat(lo, emitted) + offsets, max(len(order) - 1, 0))]
+                           if len(order) else -1, -1)
+    names, dtypes, columns = [], [], []
+    for i, name in enumerate(left.names):
+        names.append(name)
+        dtypes.append(left.dtypes[i])
+        columns.append(_pick(left.dtypes[i], left.columns[i], left_index))
+    for i, name in enumerate(right.names):
+        if name == right_on:
+            continue
+        names.append(name if name not in names else f'{name}_right')
+        dtypes.append(right.dtypes[i])
+        columns.append(_pick(right.dtypes[i], right.columns[i], right_index))
+    return ColumnTable(names, dtypes, columns)
+
+
+FUNCTION_TYPES = {}
+PARAM_TYPES = ('column', 'columns', 'number', 'string', 'choice')
+
+
+def register(name, kernel, label, params=(), inputs=1, code=False, bench=None):
+    # params: dicts with name, type (one of PARAM_TYPES), label, and
+    # optionally required, choices, default. inputs > 1 means the kernel
+    # gets that many separate tables. code marks types whose behaviour is
+    # the rig's own code (custom). bench holds parameters for bench/kernels.py.
+    for param in params:
+        if param['type'] not in PARAM_TYPES:
+            raise ValueError(f"Unknown parameter type {param['type']!r}")
+    FUNCTION_TYPES[name] = {
+        'name': name,
+        'label': label,
+        'params': list(params),
+        'inputs': inputs,
+        'output': 'table',
+        'code': code,
+        'kernel': kernel,
+        'bench': bench,
+    }
+
+
+def describe():
+    return [{k: v for k, v in spec.items() if k not in ('kernel', 'bench')} for spec in FUNCTION_TYPES.values()]
+
+
+def check_params(spec, params):
+    # Fills defaults and coerces numbers; raises ValueError on bad input
+    params = dict(params or {})
+    for param in spec['params']:
+        name = param['name']
+        value = params.get(name)
+        if value in (None, '') or value == []:
+            if 'default' in param:
+                params[name] = param['default']
+            elif param.get('required'):
+                raise ValueError(f"{spec['label']} needs {param['label'].lower()}")
+            else:
+                params.pop(name, None)
+            continue
+        if param['type'] == 'number' and to_number(value) is None:
+            raise ValueError(f"{param['label']} must be a number")
+        if param['type'] == 'choice' and value not in param['choices']:
+            raise ValueError(f"{param['label']} must be one of {', '.join(param['choices'])}")
+        if param['type'] == 'columns' and isinstance(value, str):
+            params[name] = [v.strip() for v in value.split(',') if v.strip()]
+    return params
+
+
+def run(function_type, tables, params):
+    spec = FUNCTION_TYPES.get(function_type)
+    if spec is None or spec['kernel'] is None:
+        raise ValueError(f'Function type {function_type!r} is not available server-side')
+    if spec['inputs'] > 1 and len(tables) != spec['inputs']:
+        raise ValueError(f"{spec['label']} needs {spec['inputs']} table inputs, got {len(tables)}")
+    return spec['kernel'](tables if spec['inputs'] > 1 else tables[0], check_params(spec, params))
+
+
+COLUMN = {'name': 'column', 'type': 'column', 'label': 'Column'}
+register('sum', fn_sum, 'Sum', bench={})
+register('average', fn_average, 'Average', bench={})
+register('min', fn_min, 'Min', bench={})
+register('max', fn_max, 'Max', bench={})
+register('filter', fn_filter, 'Filter', [
+    COLUMN,
+    {'name': 'op', 'type': 'choice', 'label': 'Operator', 'choices': list(COMPARISONS), 'default': '=='},
+    {'name': 'value', 'type': 'string', 'label': 'Value'},
+], bench={'column': 'a', 'op': '>', 'value': '0'})
+register('map', fn_map, 'Map', [
+    COLUMN,
+    {'name': 'op', 'type': 'choice', 'label': 'Operator', 'choices': list(ARITHMETIC)},
+    {'name': 'operand', 'type': 'number', 'label': 'Operand'},
+], bench={'column': 'a', 'op': '*', 'operand': 2})
+register('groupby', fn_groupby, 'Group by', [
+    {'name': 'by', 'type': 'column', 'label': 'Group column', 'required': True},
+    {'name': 'agg', 'type': 'choice', 'label': 'Aggregate', 'choices': list(GROUP_AGGREGATES), 'default': 'sum'},
+    {'name': 'columns', 'type': 'columns', 'label': 'Value columns'},
+], bench={'by': 'key', 'agg': 'average'})
+register('join', fn_join, 'Join', [
+    {'name': 'on', 'type': 'column', 'label': 'Key column', 'required': True},
+    {'name': 'how', 'type': 'choice', 'label': 'Keep', 'choices': ['inner', 'left'], 'default': 'inner'},
+], inputs=2, bench={'on': 'key'})
+register('custom', None, 'Custom', code=True)
+
@@ -0,0 +1,382 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+
+# Custom function rigs written in Python run in a pool of long-lived worker
+# processes running this file's source (`python -I -c <source>`), as an
+# unprivileged user when the server runs as root. Each worker
+# drops to tight resource limits, cannot open sockets or import anything
+# outside ALLOWED_MODULES, and keeps the functions it has compiled keyed by
+# the code's hash, so re-running an unchanged rig skips compilation. A task
+# that overruns its timeout gets its worker killed and replaced.
+#
+# Builtin and import restrictions keep honest code honest, but the allowed
+# modules re-export os and sys, and through them every module global. What
+# contains the rest is an audit hook, installed before any task runs and
+# impossible to remove from Python. It refuses sockets, every os.* event
+# (processes, deletes, listings, ...), ctypes, frame and gc introspection,
+# and opening any file but a read of the standard library. Everything it
+# looks at is bound in its closure, so rebinding globals or builtins does
+# not loosen it. Then come the separate uid, the process boundary and the
+# rlimits.
+#
+# The same workers run whole coding-mode programs (stream_program): module
+# code with input() fed from a list and print() output sent back in chunks
+# while it runs. Programs are cached as code objects and get fresh globals
+# on every run.
+WORKERS = int(os.environ.get('RIG_SANDBOX_WORKERS', 2))
+TIMEOUT = float(os.environ.get('RIG_SANDBOX_TIMEOUT', 5))
+MEMORY_MB = int(os.environ.get('RIG_SANDBOX_MEMORY_MB', 256))
+# Total CPU seconds a worker may use before it is replaced
+CPU_SECONDS = int(os.environ.get('RIG_SANDBOX_CPU_SECONDS', 120))
+# Workers started by root switch to this user ('' keeps root's)
+USER = os.environ.get('RIG_SANDBOX_USER', 'nobody')
+# Whole programs (/api/run) stay off unless this is set: the audit hook and
+# field checks narrow what a diagram can do, but a worker is still a Python
+# process on the host
+RUN_PROGRAMS = os.environ.get('RIG_RUN_PROGRAMS', '') not in ('', '0')
+MAX_TASKS = 1000
+MAX_COMPILED = 256
+# A program's output is capped at this many characters and sent back in
+# chunks at most this far apart
+MAX_OUTPUT_CHARS = 1024 * 1024
+OUTPUT_SECONDS = 0.05
+ALLOWED_MODULES = {
+    'bisect', 'collections', 'datetime', 'decimal', 'fractions', 'functools', 'heapq',
+    'itertools', 'json', 'math', 'operator', 'random', 're', 'statistics', 'string',
+}
+SAFE_BUILTINS = {
+    'abs', 'all', 'any', 'bool', 'dict', 'divmod', 'enumerate', 'filter', 'float', 'format',
+    'frozenset', 'int', 'isinstance', 'len', 'list', 'map', 'max', 'min', 'print', 'range',
+    'repr', 'reversed', 'round', 'set', 'slice', 'sorted', 'str', 'sum', 'tuple', 'zip',
+    'ArithmeticError', 'Exception', 'KeyError', 'IndexError', 'TypeError', 'ValueError',
+    'ZeroDivisionError', 'True', 'False', 'None',
+}
+
+
+class SandboxError(Exception):
+    pass
+
+
+def code_key(code):
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+log = logging.getLogger(__name__)
+
+
+def _credentials():
+    if os.geteuid() != 0 or not USER:
+        return {}
+    import pwd
+    user = pwd.getpwnam(USER)
+    return {'user': user.pw_uid, 'group': user.pw_gid, 'extra_groups': []}
+
+
+def _start():
+    # This file's source goes in with -c, so the worker user needs no access
+    # to the app's files
+    with open(os.path.abspath(__file__)) as f:
+        command = [sys.executable, '-I', '-c', f.read()]
+    options = dict(stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                   cwd='/', env={'PATH': '/usr/bin:/bin'})
+    credentials = _credentials()
+    try:
+        return subprocess.Popen(command, **options, **credentials)
+    except PermissionError:
+        if not credentials:
+            raise
+        # e.g. an interpreter under /root that the user cannot run; the
+        # audit hook still applies
+        log.warning('sandbox worker cannot run as %r, running it as root', USER)
+        return subprocess.Popen(command, **options)
+
+
+class Worker:
+    def __init__(self):
+        self.process = _start()
+        self.tasks = 0
+        self.buffer = b''
+
+    def exchange(self, message, timeout):
+        # Yields the task's streamed output chunks, then returns its reply
+        self.tasks += 1
+        self.process.stdin.write(json.dumps(message).encode() + b'\n')
+        self.process.stdin.flush()
+        deadline = time.monotonic() + timeout
+        fd = self.process.stdout.fileno()
+        while True:
+            while b'\n' not in self.buffer:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    raise TimeoutError()
+                chunk = os.read(fd, 1 << 16)
+                if not chunk:
+                    raise SandboxError('Sandbox worker exited (resource limit reached?)')
+                self.buffer += chunk
+            line, self.buffer = self.buffer.split(b'\n', 1)
+            reply = json.loads(line)
+            if 'chunk' not in reply:
+                return reply
+            yield reply['chunk']
+
+    def alive(self):
+        return self.process.poll() is None and self.tasks < MAX_TASKS
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+class SandboxPool:
+    def __init__(self, size=WORKERS):
+        self.size = size
+        self.idle = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.stats = {'runs': 0, 'compiled': 0, 'cached': 0, 'timeouts': 0, 'restarts': 0}
+
+    def _idle(self):
+        # Workers are pre-started on first use; a forked server process
+        # starts its own. Last in, first out keeps hot caches busy.
+        with self.lock:
+            if self.pid != os.getpid():
+                self.idle = queue.LifoQueue()
+                for _ in range(self.size):
+                    self.idle.put(Worker())
+                self.pid = os.getpid()
+            return self.idle
+
+    def _task(self, message, timeout=None):
+        # Generator over the task's output chunks; returns the reply. A
+        # caller that stops iterating early gets the worker replaced.
+        idle = self._idle()
+        worker = idle.get()
+        finished = False
+        try:
+            reply = yield from worker.exchange(message, timeout or TIMEOUT)
+            finished = True
+        except TimeoutError:
+            finished = True
+            worker.kill()
+            worker = Worker()
+            with self.lock:
+                self.stats['timeouts'] += 1
+            raise SandboxError(f'Custom code timed out after {timeout or TIMEOUT}s')
+        except (SandboxError, OSError, ValueError):
+            finished = True
+            worker.kill()
+            worker = Worker()
+            with self.lock:
+                self.stats['restarts'] += 1
+            raise SandboxError('Custom code crashed its worker (memory or CPU limit?)')
+        finally:
+            if not finished or not worker.alive():
+                worker.kill()
+                worker = Worker()
+            idle.put(worker)
+        with self.lock:
+            self.stats['runs'] += 1
+            self.stats['cached' if reply.get('cached') else 'compiled'] += 1
+        if reply['status'] != 'success':
+            raise SandboxError(reply['error'])
+        return reply
+
+    def run(self, code, inputs, timeout=None):
+        reply = _finish(self._task({'key': code_key(code), 'code': code, 'input': inputs}, timeout))
+        return reply['output'], reply.get('stdout', '')
+
+    def stream_program(self, code, stdin=(), timeout=None):
+        # Runs a whole program: yields its output as it is printed and
+        # returns the final reply ({'cached': ...})
+        message = {'mode': 'program', 'key': code_key('program\0' + code), 'code': code,
+                   'stdin': [str(value) for value in stdin]}
+        return (yield from self._task(message, timeout))
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, workers=self.size, timeout=TIMEOUT)
+
+
+def _finish(task):
+    # Runs a task to the end, dropping any output chunks, and returns its
+    # reply. A for loop would swallow the StopIteration that carries it.
+    while True:
+        try:
+            next(task)
+        except StopIteration as stop:
+            return stop.value
+
+
+pool = SandboxPool()
+
+
+# Audit events refused in a worker, by name or by prefix (ending in '.')
+BLOCKED_EVENTS = (
+    'socket.', 'ctypes.', 'subprocess.', 'shutil.', 'os.', 'pty.', 'fcntl.', 'mmap.', 'signal.',
+    'resource.', 'glob.', 'gc.', 'sqlite3.', 'urllib.', 'webbrowser.', 'sys.addaudithook',
+    'sys._getframe', 'sys._current_frames', 'sys.settrace', 'sys.setprofile', 'sys.setrecursionlimit',
+    'object.__getattr__', 'object.__setattr__', 'object.__delattr__', 'code.__new__', 'function.__new__',
+)
+_WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC
+
+
+def _audit_hook(blocked, write_flags, readable):
+    # Everything the hook uses is bound here; it never looks up a global or
+    # a builtin, which user code could rebind
+    denied = PermissionError
+    text = str
+    kind = type
+
+    def hook(event, args):
+        if event.startswith(blocked):
+            raise denied(event + ' is not allowed in custom code')
+        if event == 'open':
+            # io.open passes a mode string, os.open and FileIO flags
+            path, mode, flags = args
+            if kind(path) is not text or not path.startswith(readable) or '/..' in path:
+                raise denied('Opening files is not allowed in custom code')
+            if (flags or 0) & write_flags or (kind(mode) is text and (
+                    'w' in mode or 'a' in mode or 'x' in mode or '+' in mode)):
+                raise denied('Writing files is not allowed in custom code')
+    return hook
+
+
+def _limit():
+    import resource
+    limits = [
+        (resource.RLIMIT_AS, MEMORY_MB * 1024 * 1024),
+        (resource.RLIMIT_CPU, CPU_SECONDS),
+        (resource.RLIMIT_FSIZE, 0),
+        (resource.RLIMIT_NPROC, 0),
+    ]
+    for limit, value in limits:
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+
+
+def _serve():
+    import builtins
+    import io
+    import socket
+    from collections import OrderedDict
+
+    # Keep the protocol pipes private, then shut the process off from the
+    # outside before any user code runs
+    channel_in = os.fdopen(os.dup(0), 'rb')
+    channel_out = os.fdopen(os.dup(1), 'wb')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    for module in ALLOWED_MODULES:
+        __import__(module)
+
+    def blocked(*args, **kwargs):
+        raise PermissionError('Network access is disabled in custom code')
+
+    socket.socket = socket.create_connection = socket.socketpair = blocked
+    real_import = builtins.__import__
+
+    allowed = frozenset(ALLOWED_MODULES)
+
+    def guarded_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name.split('.')[0] not in allowed:
+            raise ImportError(f'Import of {name!r} is not allowed in custom code')
+        return real_import(name, globals, locals, fromlist, level)
+
+    safe = {name: getattr(builtins, name) for name in SAFE_BUILTINS}
+    safe['__import__'] = guarded_import
+    _limit()
+    # Only the standard library may be read, for imports it makes lazily
+    sys.addaudithook(_audit_hook(tuple(BLOCKED_EVENTS), _WRITE_FLAGS, (os.path.dirname(os.__file__) + os.sep,)))
+
+    class Output:
+        # A program's print() target, sent back in chunks while it runs
+        def __init__(self):
+            self.parts = []
+            self.total = 0
+            self.sent = time.monotonic()
+
+        def write(self, text):
+            if self.total >= MAX_OUTPUT_CHARS:
+                return
+            if self.total + len(text) > MAX_OUTPUT_CHARS:
+                text = text[:MAX_OUTPUT_CHARS - self.total] + '\n[output truncated]\n'
+            self.total += len(text)
+            self.parts.append(text)
+            if time.monotonic() - self.sent >= OUTPUT_SECONDS:
+                self.flush()
+
+        def flush(self):
+            if self.parts:
+                channel_out.write(json.dumps({'chunk': ''.join(self.parts)}).encode() + b'\n')
+                channel_out.flush()
+                self.parts = []
+            self.sent = time.monotonic()
+
+    def feeder(values, out):
+        values = iter(values)
+
+        def input(prompt=''):
+            out.write(str(prompt))
+            try:
+                return next(values)
+            except StopIteration:
+                raise EOFError('input() ran out of stdin values') from None
+        return input
+
+    compiled = OrderedDict()
+    for line in channel_in:
+        message = json.loads(line)
+        program = message.get('mode') == 'program'
+        cached = message['key'] in compiled
+        stdout = Output() if program else io.StringIO()
+        try:
+            if cached:
+                compiled.move_to_end(message['key'])
+            else:
+                if program:
+                    compiled[message['key']] = compile(message['code'], '<program>', 'exec')
+                else:
+                    # The rig's code is the body of fn(input)
+                    body = ''.join('    ' + row + '\n' for row in message['code'].splitlines()) or '    pass\n'
+                    scope = {'__builtins__': dict(safe)}
+                    exec(compile('def fn(input):\n' + body, '<custom>', 'exec'), scope)
+                    compiled[message['key']] = scope
+                while len(compiled) > MAX_COMPILED:
+                    compiled.popitem(last=False)
+            # print() output goes back with the result, or as it happens
+            # for a program
+            output = lambda *a, **k: print(*a, file=stdout, **{n: v for n, v in k.items() if n != 'file'})
+            if program:
+                scope = {'__builtins__': dict(safe, print=output, input=feeder(message['stdin'], stdout)),
+                         '__name__': '__main__'}
+                exec(compiled[message['key']], scope)
+                reply = {'status': 'success'}
+            else:
+                scope = compiled[message['key']]
+                scope['__builtins__']['print'] = output
+                reply = {'status': 'success', 'output': scope['fn'](message['input'])}
+                reply = json.loads(json.dumps(reply, default=str))
+        except BaseException as e:
+            reply = {'status': 'error', 'error': f'{type(e).__name__}: {e}'}
+        reply['cached'] = cached
+        if program:
+            stdout.flush()
+        else:
+            reply['stdout'] = stdout.getvalue()[-10000:]
+        channel_out.write(json.dumps(reply).encode() + b'\n')
+        channel_out.flush()
+
+
+if __name__ == '__main__':
+    _serve()
@@ -0,0 +1,102 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+# 'thread' suits cheap kernels and anything that releases the GIL; 'process'
+# sidesteps the GIL for CPU-bound map/filter over large tables at the cost of
+# pickling inputs across the process boundary.
+BACKEND = os.environ.get('RIG_EXECUTOR_BACKEND', 'thread')
+MAX_WORKERS = int(os.environ.get('RIG_EXECUTOR_WORKERS', os.cpu_count() or 4))
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def check_options(backend, max_workers):
+    # Request options are checked up front, not deep inside a run
+    if backend is not None and backend not in ('thread', 'process'):
+        raise ValueError(f'Unknown executor backend {backend!r}')
+    if max_workers is not None and (isinstance(max_workers, bool) or not isinstance(max_workers, int)
+                                    or max_workers < 1):
+        raise ValueError(f'maxWorkers must be a positive integer, not {max_workers!r}')
+
+
+def get_pool(backend):
+    # Pools are shared by all requests in a worker and rebuilt after a fork
+    key = (backend, os.getpid())
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if backend == 'process':
+                pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+            elif backend == 'thread':
+                pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='rig')
+            else:
+                raise ValueError(f'Unknown executor backend {backend!r}')
+            _pools[key] = pool
+    return pool
+
+
+def run_dag(upstream, order, fn, payloads, backend=None, max_workers=None, offload=None,
+            done=None, inline=None, on_result=None, cancelled=None):
+    # Runs fn(payload, inputs) for each node once its upstream nodes are done.
+    # fn returns a dict with a 'status' key; nodes whose upstream did not
+    # succeed are skipped. At most max_workers nodes of this call are in
+    # flight at once, and only nodes accepted by offload go to the pool.
+    # Nodes already in done (e.g. cache hits) are not run again, and nodes
+    # kept out of the pool run through inline when it is given. on_result
+    # sees each result as it lands; once cancelled() is true no further
+    # nodes start and the rest are reported as cancelled.
+    pool = get_pool(backend or BACKEND)
+    limit = max(1, min(max_workers or MAX_WORKERS, MAX_WORKERS))
+    offload = offload or (lambda node: True)
+    inline = inline or fn
+
+    downstream = {node: [] for node in order}
+    waiting = {}
+    for node in order:
+        waiting[node] = len(upstream[node])
+        for source in upstream[node]:
+            downstream[source].append(node)
+    ready = deque(node for node in order if waiting[node] == 0)
+    results = {}
+    in_flight = {}
+
+    def finish(node, result):
+        results[node] = result
+        if on_result:
+            on_result(node, result)
+        for target in downstream[node]:
+            waiting[target] -= 1
+            if waiting[target] == 0:
+                ready.append(target)
+
+    while ready or in_flight:
+        while ready and len(in_flight) < limit:
+            node = ready.popleft()
+            if cancelled and cancelled():
+                finish(node, {'status': 'cancelled', 'error': 'Run was cancelled'})
+                continue
+            if done and node in done:
+                finish(node, done[node])
+                continue
+            failed = [s for s in upstream[node] if results[s]['status'] != 'success']
+            if failed:
+                finish(node, {'status': 'skipped', 'error': f'Upstream rig {failed[0]} did not run'})
+                continue
+            inputs = [results[s]['output'] for s in upstream[node]]
+            if offload(node):
+                in_flight[pool.submit(fn, payloads[node], inputs)] = node
+            else:
+                finish(node, inline(payloads[node], inputs))
+        if in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'status': 'error', 'error': str(e)}
+                finish(node, result)
+    return results
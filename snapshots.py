@@ -0,0 +1,132 @@
+import json
+import os
+import time
+import zlib
+
+import storage
+
+# A snapshot is two zlib blobs: the workspace document (rigs without their
+# cells, connections, code blocks, block connections, canvas offset) and the
+# table cells keyed by rig id. Reading the latest document is one row and one
+# decompress; the cells are only read back on rollback.
+MAX_SNAPSHOTS = int(os.environ.get('RIGS_MAX_SNAPSHOTS', 50))
+COMPRESSION_LEVEL = 6
+KINDS = ('rigs', 'connections', 'codeBlocks', 'blockConnections')
+COLUMNS = 'id, rev, created, label, size'
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def _meta(row):
+    return dict(zip(('id', 'rev', 'created', 'label', 'size'), row))
+
+
+def create(conn, canvas, label=None):
+    # Everything comes from the database except the canvas offset, which
+    # only the client knows.
+    rigs, edges = [], []
+    cells = {}
+    for (data,) in conn.execute('SELECT data FROM rigs'):
+        rig = json.loads(data)
+        if rig['type'] == 'table':
+            cells[rig['id']] = list(storage.iter_table_rows(conn, rig))
+        rigs.append(rig)
+    for (data,) in conn.execute('SELECT data FROM connections'):
+        edges.append(json.loads(data))
+    document = {
+        'rigs': rigs,
+        'connections': edges,
+        'codeBlocks': [json.loads(data) for (data,) in conn.execute('SELECT data FROM code_blocks')],
+        'blockConnections': [json.loads(data) for (data,) in conn.execute('SELECT data FROM block_connections')],
+        'offset': canvas.get('offset') or {'x': 0, 'y': 0},
+    }
+    data = _pack(document)
+    rev = storage.current_rev(conn)
+    cursor = conn.execute('INSERT INTO snapshots (rev, created, label, size, data, tables) '
+                          'VALUES (?, ?, ?, ?, ?, ?)',
+                          (rev, time.time(), label, len(data), data, _pack(cells)))
+    conn.execute('DELETE FROM snapshots WHERE id NOT IN '
+                 '(SELECT id FROM snapshots ORDER BY id DESC LIMIT ?)', (MAX_SNAPSHOTS,))
+    return _meta(conn.execute(f'SELECT {COLUMNS} FROM snapshots WHERE id = ?',
+                              (cursor.lastrowid,)).fetchone())
+
+
+def list_snapshots(conn):
+    return [_meta(row) for row in conn.execute(f'SELECT {COLUMNS} FROM snapshots ORDER BY id DESC')]
+
+
+def resolve(conn, snapshot_id):
+    # 'latest' or a numeric id
+    if snapshot_id == 'latest':
+        row = conn.execute('SELECT id FROM snapshots ORDER BY id DESC LIMIT 1').fetchone()
+    else:
+        row = conn.execute('SELECT id FROM snapshots WHERE id = ?',
+                           (int(snapshot_id) if str(snapshot_id).isdigit() else -1,)).fetchone()
+    if row is None:
+        raise SnapshotError(f'Snapshot {snapshot_id} not found')
+    return row[0]
+
+
+def load_blob(conn, snapshot_id):
+    return conn.execute('SELECT data FROM snapshots WHERE id = ?',
+                        (resolve(conn, snapshot_id),)).fetchone()[0]
+
+
+def load(conn, snapshot_id):
+    return _unpack(load_blob(conn, snapshot_id))
+
+
+def diff(old, new):
+    # Ids added, removed and changed per kind, plus whether the offset moved
+    result = {}
+    for kind in KINDS:
+        before = {item['id']: item for item in old.get(kind, [])}
+        after = {item['id']: item for item in new.get(kind, [])}
+        result[kind] = {
+            'added': [item_id for item_id in after if item_id not in before],
+            'removed': [item_id for item_id in before if item_id not in after],
+            'changed': [item_id for item_id in after if item_id in before and after[item_id] != before[item_id]],
+        }
+    result['offset'] = old.get('offset') != new.get('offset')
+    return result
+
+
+def restore(conn, snapshot_id):
+    # Rewrites rigs, code blocks and their connections to match the
+    # snapshot inside the caller's transaction and returns the document.
+    data, cells = conn.execute('SELECT data, tables FROM snapshots WHERE id = ?',
+                               (resolve(conn, snapshot_id),)).fetchone()
+    document, cells = _unpack(data), _unpack(cells)
+    keep_rigs = {rig['id'] for rig in document['rigs']}
+    keep_edges = {edge['id'] for edge in document['connections']}
+    storage.delete_connections(conn, [row[0] for row in conn.execute('SELECT id FROM connections')
+                                      if row[0] not in keep_edges])
+    storage.delete_rigs(conn, [row[0] for row in conn.execute('SELECT id FROM rigs')
+                               if row[0] not in keep_rigs])
+    rigs = []
+    for rig in document['rigs']:
+        if rig['type'] == 'table':
+            data = {k: v for k, v in rig['data'].items() if k not in ('rowCount', 'rowsRev')}
+            rig = dict(rig, data=dict(data, rows=cells.get(rig['id'], [])))
+        rigs.append(rig)
+    storage.save_rigs(conn, rigs)
+    storage.save_connections(conn, document['connections'])
+    keep_blocks = {block['id'] for block in document.get('codeBlocks', [])}
+    keep_links = {link['id'] for link in document.get('blockConnections', [])}
+    storage.delete_block_connections(conn, [row[0] for row in conn.execute('SELECT id FROM block_connections')
+                                            if row[0] not in keep_links])
+    storage.delete_blocks(conn, [row[0] for row in conn.execute('SELECT id FROM code_blocks')
+                                 if row[0] not in keep_blocks])
+    storage.save_blocks(conn, document.get('codeBlocks', []))
+    storage.save_block_connections(conn, document.get('blockConnections', []))
+    return document
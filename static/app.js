@@ -0,0 +1,1446 @@
+let rigs = [];
+let connections = [];
+let codeBlocks = [];
+let blockConnections = [];
+let selectedRig = null;
+let selectedBlock = null;
+let draggedRig = null;
+let draggedBlock = null;
+let canvasOffset = { x: 0, y: 0 };
+let isPanning = false;
+let panStart = { x: 0, y: 0 };
+let connectionStart = null;
+let blockConnectionStart = null;
+let rigCounter = 0;
+let lastRev = 0;
+let eventSource = null;
+let functionTypes = []; // from /api/function-types
+let databases = []; // SQLite files database rigs can query, from /api/databases
+let blockCounter = 0;
+let autoConnect = false;
+let contextMenuTarget = null;
+let currentMode = 'rig'; // 'rig' or 'coding'
+let tableRows = {}; // rigId -> rows fetched so far (sparse)
+let tableRowRequests = {};
+const ROW_HEIGHT = 40;
+const VISIBLE_ROWS = 10;
+const ROW_PAGE = 200;
+// A dragged block sends its position at most this often; the server
+// coalesces what arrives within its write-behind window
+const BLOCK_DRAG_MS = 100;
+let blockDragSent = 0;
+// A stream the server turned away (503, all slots busy) is retried this late
+const STREAM_RETRY_MS = 5000;
+// Blocks whose right-hand connector starts their body; the bottom one is
+// always what follows the block
+const COMPOUND_BLOCKS = ['condition', 'loop', 'function'];
+const BODY_COLOR = '#ffaa00';
+// ?workspace=<id> opens another workspace; each one has its own database
+const WORKSPACE = new URLSearchParams(location.search).get('workspace') || 'default';
+const API = `/api/workspaces/${encodeURIComponent(WORKSPACE)}`;
+const STORAGE_KEY = WORKSPACE === 'default' ? 'workspace' : `workspace-${WORKSPACE}`;
+
+const canvas = document.getElementById('canvas');
+const svg = document.getElementById('connections-svg');
+const contextMenu = document.getElementById('context-menu');
+const codePanel = document.getElementById('code-panel');
+const blockPalette = document.getElementById('block-palette');
+
+document.addEventListener('DOMContentLoaded', () => {
+    loadFunctionTypes();
+    fetch('/api/databases').then(r => r.json()).then(names => { databases = names; }).catch(() => {});
+    openWorkspace().then(loadWorkspace);
+    setupEventListeners();
+});
+
+function openWorkspace() {
+    // A workspace named in the URL is created on first visit; the API
+    // answers 404 for one that does not exist
+    if (WORKSPACE === 'default') return Promise.resolve();
+    return fetch('/api/workspaces', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ id: WORKSPACE })
+    }).catch(() => {});
+}
+
+function setupEventListeners() {
+    canvas.addEventListener('mousedown', (e) => {
+        if (e.target === canvas) {
+            isPanning = true;
+            panStart = { x: e.clientX - canvasOffset.x, y: e.clientY - canvasOffset.y };
+        }
+    });
+
+    document.addEventListener('mousemove', (e) => {
+        if (isPanning) {
+            canvasOffset.x = e.clientX - panStart.x;
+            canvasOffset.y = e.clientY - panStart.y;
+            canvas.style.transform = `translate(${canvasOffset.x}px, ${canvasOffset.y}px)`;
+            updateConnections();
+            updateBlockConnections();
+        }
+    });
+
+    document.addEventListener('mouseup', () => {
+        isPanning = false;
+    });
+
+    document.addEventListener('click', (e) => {
+        if (!contextMenu.contains(e.target)) {
+            contextMenu.style.display = 'none';
+        }
+    });
+
+    document.addEventListener('keydown', (e) => {
+        if ((e.ctrlKey || e.metaKey) && e.key === 's') {
+            e.preventDefault();
+            saveWorkspace();
+        }
+        if (e.key === 'Delete' && (selectedRig || selectedBlock)) {
+            deleteItem();
+        }
+        if ((e.ctrlKey || e.metaKey) && e.key === 'g') {
+            e.preventDefault();
+            if (currentMode === 'coding') generateCode();
+        }
+    });
+}
+
+function toggleMode() {
+    currentMode = currentMode === 'rig' ? 'coding' : 'rig';
+    const modeToggle = document.getElementById('mode-toggle');
+    const rigNav = document.getElementById('rig-mode-nav');
+    const codingNav = document.getElementById('coding-mode-nav');
+    
+    if (currentMode === 'coding') {
+        modeToggle.textContent = '💻 Coding Mode';
+        modeToggle.classList.add('active');
+        rigNav.style.display = 'none';
+        codingNav.style.display = 'flex';
+        blockPalette.classList.add('visible');
+        
+        // Hide rigs, show blocks
+        document.querySelectorAll('.rig').forEach(r => r.style.display = 'none');
+        document.querySelectorAll('.code-block').forEach(b => b.style.display = 'flex');
+    } else {
+        modeToggle.textContent = '🎨 Rig Mode';
+        modeToggle.classList.remove('active');
+        rigNav.style.display = 'flex';
+        codingNav.style.display = 'none';
+        blockPalette.classList.remove('visible');
+        codePanel.classList.remove('visible');
+        
+        // Show rigs, hide blocks
+        document.querySelectorAll('.rig').forEach(r => r.style.display = 'block');
+        document.querySelectorAll('.code-block').forEach(b => b.style.display = 'none');
+    }
+    updateConnections();
+    updateBlockConnections();
+}
+
+// CODE BLOCKS FUNCTIONALITY
+function addCodeBlock(type) {
+    const blockId = `block-${++blockCounter}`;
+    const block = {
+        id: blockId,
+        type: type,
+        x: 150 + Math.random() * 400,
+        y: 100 + Math.random() * 300,
+        data: getBlockDefaultData(type)
+    };
+    codeBlocks.push(block);
+    createCodeBlockElement(block);
+    saveBlockToBackend(block);
+}
+
+function getBlockDefaultData(type) {
+    switch(type) {
+        case 'start':
+            return { label: 'Start' };
+        case 'end':
+            return { label: 'End' };
+        case 'variable':
+            return { name: 'x', value: '0' };
+        case 'input':
+            return { variable: 'input', prompt: 'Enter value' };
+        case 'output':
+            return { expression: 'result' };
+        case 'operation':
+            return { left: 'a', operator: '+', right: 'b', result: 'c' };
+        case 'condition':
+            return { condition: 'x > 0' };
+        case 'loop':
+            return { type: 'for', variable: 'i', start: '0', end: '10', step: '1' };
+        case 'function':
+            return { name: 'myFunction', params: 'x, y' };
+        default:
+            return {};
+    }
+}
+
+function createCodeBlockElement(block) {
+    const blockEl = document.createElement('div');
+    blockEl.className = `code-block ${block.type}`;
+    blockEl.id = block.id;
+    blockEl.style.left = block.x + 'px';
+    blockEl.style.top = block.y + 'px';
+    blockEl.style.display = currentMode === 'coding' ? 'flex' : 'none';
+
+    blockEl.innerHTML = getBlockContent(block);
+
+    // Add connectors
+    const topConnector = document.createElement('div');
+    topConnector.className = 'block-connector top';
+    topConnector.onclick = (e) => handleBlockConnectorClick(e, block.id, 'top');
+    blockEl.appendChild(topConnector);
+
+    const bottomConnector = document.createElement('div');
+    bottomConnector.className = 'block-connector bottom';
+    bottomConnector.onclick = (e) => handleBlockConnectorClick(e, block.id, 'bottom');
+    blockEl.appendChild(bottomConnector);
+
+    if (COMPOUND_BLOCKS.includes(block.type)) {
+        const bodyConnector = document.createElement('div');
+        bodyConnector.className = 'block-connector body';
+        bodyConnector.title = 'Body';
+        bodyConnector.onclick = (e) => handleBlockConnectorClick(e, block.id, 'body');
+        blockEl.appendChild(bodyConnector);
+    }
+
+    blockEl.addEventListener('mousedown', (e) => startBlockDrag(e, block));
+    blockEl.addEventListener('contextmenu', (e) => {
+        e.preventDefault();
+        showContextMenu(e, block);
+    });
+    blockEl.addEventListener('click', (e) => {
+        if (e.target === blockEl || e.target.classList.contains('block-icon')) {
+            selectBlock(block.id);
+        }
+    });
+
+    canvas.appendChild(blockEl);
+}
+
+function getBlockContent(block) {
+    switch(block.type) {
+        case 'start':
+            return '<div class="block-icon">🟢</div><div>Start</div>';
+        case 'end':
+            return '<div class="block-icon">🔴</div><div>End</div>';
+        case 'variable':
+            return `<div class="block-icon">📦</div><input class="block-input" value="${block.data.name}" onchange="updateBlockData('${block.id}', 'name', this.value)" placeholder="var"> = <input class="block-input" value="${block.data.value}" onchange="updateBlockData('${block.id}', 'value', this.value)" placeholder="value">`;
+        case 'input':
+            return `<div class="block-icon">⌨️</div><input class="block-input" value="${block.data.variable}" onchange="updateBlockData('${block.id}', 'variable', this.value)" placeholder="var"> = input("<input class="block-input" value="${block.data.prompt}" onchange="updateBlockData('${block.id}', 'prompt', this.value)" placeholder="prompt">")`;
+        case 'output':
+            return `<div class="block-icon">🖨️</div>print(<input class="block-input" value="${block.data.expression}" onchange="updateBlockData('${block.id}', 'expression', this.value)" placeholder="expression">)`;
+        case 'operation':
+            return `<div class="block-icon">➕</div><input class="block-input" value="${block.data.result}" onchange="updateBlockData('${block.id}', 'result', this.value)" placeholder="result"> = <input class="block-input" value="${block.data.left}" onchange="updateBlockData('${block.id}', 'left', this.value)" style="width:40px"> <select class="block-input" style="width:50px" onchange="updateBlockData('${block.id}', 'operator', this.value)">
+                <option ${block.data.operator === '+' ? 'selected' : ''}>+</option>
+                <option ${block.data.operator === '-' ? 'selected' : ''}>-</option>
+                <option ${block.data.operator === '*' ? 'selected' : ''}>*</option>
+                <option ${block.data.operator === '/' ? 'selected' : ''}>/</option>
+                <option ${block.data.operator === '%' ? 'selected' : ''}>%</option>
+                <option ${block.data.operator === '**' ? 'selected' : ''}>**</option>
+            </select> <input class="block-input" value="${block.data.right}" onchange="updateBlockData('${block.id}', 'right', this.value)" style="width:40px">`;
+        case 'condition':
+            return `<div class="block-icon">❓</div>if <input class="block-input" value="${block.data.condition}" onchange="updateBlockData('${block.id}', 'condition', this.value)" placeholder="condition">`;
+        case 'loop':
+            return `<div class="block-icon">🔄</div>for <input class="block-input" value="${block.data.variable}" onchange="updateBlockData('${block.id}', 'variable', this.value)" style="width:30px"> in range(<input class="block-input" value="${block.data.start}" onchange="updateBlockData('${block.id}', 'start', this.value)" style="width:30px">, <input class="block-input" value="${block.data.end}" onchange="updateBlockData('${block.id}', 'end', this.value)" style="width:30px">)`;
+        case 'function':
+            return `<div class="block-icon">⚙️</div>def <input class="block-input" value="${block.data.name}" onchange="updateBlockData('${block.id}', 'name', this.value)" placeholder="function">(<input class="block-input" value="${block.data.params}" onchange="updateBlockData('${block.id}', 'params', this.value)" placeholder="params">)`;
+        default:
+            return 'Block';
+    }
+}
+
+function updateBlockData(blockId, field, value) {
+    const block = codeBlocks.find(b => b.id === blockId);
+    if (block) {
+        block.data[field] = value;
+        patchBlockOnBackend(blockId, { data: { [field]: value } });
+    }
+}
+
+function startBlockDrag(e, block) {
+    if (e.target.classList.contains('block-input') || e.target.tagName === 'SELECT') return;
+    draggedBlock = block;
+    const blockEl = document.getElementById(block.id);
+    const rect = blockEl.getBoundingClientRect();
+    draggedBlock.offsetX = e.clientX - rect.left;
+    draggedBlock.offsetY = e.clientY - rect.top;
+    document.addEventListener('mousemove', doBlockDrag);
+    document.addEventListener('mouseup', stopBlockDrag);
+}
+
+function doBlockDrag(e) {
+    if (!draggedBlock) return;
+    const blockEl = document.getElementById(draggedBlock.id);
+    draggedBlock.x = e.clientX - draggedBlock.offsetX - canvasOffset.x;
+    draggedBlock.y = e.clientY - draggedBlock.offsetY - canvasOffset.y;
+    blockEl.style.left = draggedBlock.x + 'px';
+    blockEl.style.top = draggedBlock.y + 'px';
+    updateBlockConnections();
+    if (Date.now() - blockDragSent >= BLOCK_DRAG_MS) {
+        blockDragSent = Date.now();
+        patchBlockOnBackend(draggedBlock.id, { x: draggedBlock.x, y: draggedBlock.y });
+    }
+}
+
+function stopBlockDrag() {
+    if (draggedBlock) patchBlockOnBackend(draggedBlock.id, { x: draggedBlock.x, y: draggedBlock.y });
+    draggedBlock = null;
+    document.removeEventListener('mousemove', doBlockDrag);
+    document.removeEventListener('mouseup', stopBlockDrag);
+}
+
+function selectBlock(blockId) {
+    document.querySelectorAll('.code-block').forEach(b => b.classList.remove('selected'));
+    selectedBlock = blockId;
+    document.getElementById(blockId).classList.add('selected');
+}
+
+function handleBlockConnectorClick(e, blockId, position) {
+    e.stopPropagation();
+    if (!blockConnectionStart) {
+        blockConnectionStart = { blockId, position };
+    } else {
+        if (blockConnectionStart.blockId !== blockId) {
+            createBlockConnection(blockConnectionStart.blockId, blockId,
+                                  blockConnectionStart.position === 'body' ? 'body' : 'next');
+        }
+        blockConnectionStart = null;
+    }
+}
+
+function createBlockConnection(sourceId, targetId, port = 'next') {
+    const connId = `bconn-${sourceId}-${targetId}`;
+    if (blockConnections.find(c => c.id === connId)) return;
+    const connection = { id: connId, source: sourceId, target: targetId, port };
+    blockConnections.push(connection);
+    updateBlockConnections();
+    saveBlockConnectionToBackend(connection);
+}
+
+function updateBlockConnections() {
+    if (currentMode !== 'coding') return;
+    
+    // Clear existing block connections from SVG
+    const existingPaths = svg.querySelectorAll('path[data-type="block"]');
+    existingPaths.forEach(path => path.remove());
+
+    blockConnections.forEach(conn => {
+        const sourceBlock = codeBlocks.find(b => b.id === conn.source);
+        const targetBlock = codeBlocks.find(b => b.id === conn.target);
+        if (!sourceBlock || !targetBlock) return;
+
+        const sourceEl = document.getElementById(sourceBlock.id);
+        const targetEl = document.getElementById(targetBlock.id);
+        if (!sourceEl || !targetEl) return;
+
+        const sourceRect = sourceEl.getBoundingClientRect();
+        const targetRect = targetEl.getBoundingClientRect();
+        const canvasRect = canvas.getBoundingClientRect();
+
+        const body = conn.port === 'body';
+        const color = body ? BODY_COLOR : '#00ff88';
+        const x1 = (body ? sourceRect.right : sourceRect.left + sourceRect.width / 2) - canvasRect.left;
+        const y1 = (body ? sourceRect.top + sourceRect.height / 2 : sourceRect.bottom) - canvasRect.top;
+        const x2 = targetRect.left + targetRect.width / 2 - canvasRect.left;
+        const y2 = targetRect.top - canvasRect.top;
+
+        const path = document.createElementNS('http://www.w3.org/2000/svg', 'path');
+        const dy = Math.abs(y2 - y1);
+        const curve = `M ${x1} ${y1} C ${x1} ${y1 + dy * 0.5}, ${x2} ${y2 - dy * 0.5}, ${x2} ${y2}`;
+        path.setAttribute('d', curve);
+        path.setAttribute('stroke', color);
+        path.setAttribute('stroke-width', '3');
+        path.setAttribute('fill', 'none');
+        path.setAttribute('opacity', '0.7');
+        path.setAttribute('data-type', 'block');
+        
+        // Add arrow marker
+        const marker = document.createElementNS('http://www.w3.org/2000/svg', 'marker');
+        marker.setAttribute('id', `arrow-${conn.id}`);
+        marker.setAttribute('markerWidth', '10');
+        marker.setAttribute('markerHeight', '10');
+        marker.setAttribute('refX', '5');
+        marker.setAttribute('refY', '5');
+        marker.setAttribute('orient', 'auto');
+        const polygon = document.createElementNS('http://www.w3.org/2000/svg', 'polygon');
+        polygon.setAttribute('points', '0 0, 10 5, 0 10');
+        polygon.setAttribute('fill', color);
+        marker.appendChild(polygon);
+        svg.appendChild(marker);
+        
+        path.setAttribute('marker-end', `url(#arrow-${conn.id})`);
+        svg.appendChild(path);
+    });
+}
+
+let codegenRequest = 0;
+
+function generateCode() {
+    // Rendered server-side; a reply to an older request is dropped
+    const language = document.getElementById('language-select').value;
+    const request = ++codegenRequest;
+    const output = document.getElementById('code-output');
+    codePanel.classList.add('visible');
+    fetch('/api/codegen', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            language,
+            blocks: codeBlocks.map(b => ({ id: b.id, type: b.type, data: b.data })),
+            connections: blockConnections.map(c => ({ source: c.source, target: c.target, port: c.port }))
+        })
+    }).then(r => r.json()).then(result => {
+        if (request !== codegenRequest) return;
+        output.textContent = result.error ? `// Error: ${result.error}` : result.code;
+    });
+}
+
+function runProgram() {
+    // The Python version of the diagram runs on the server; its output
+    // streams back as Server-Sent Events over the POST response
+    const output = document.getElementById('run-output');
+    const stdin = document.getElementById('run-stdin').value.split('\n');
+    if (stdin[stdin.length - 1] === '') stdin.pop();
+    output.style.display = 'block';
+    output.textContent = '';
+    fetch('/api/run', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+        body: JSON.stringify({
+            stdin,
+            blocks: codeBlocks.map(b => ({ id: b.id, type: b.type, data: b.data })),
+            connections: blockConnections.map(c => ({ source: c.source, target: c.target, port: c.port }))
+        })
+    }).then(response => {
+        if (!response.ok) {
+            return response.json().then(result => { output.textContent = `[error: ${result.error}]`; });
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        const read = () => reader.read().then(({ done, value }) => {
+            if (done) return;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            events.forEach(text => {
+                const event = (text.match(/^event: (.*)$/m) || [])[1];
+                const data = JSON.parse((text.match(/^data: (.*)$/m) || [])[1]);
+                if (event === 'stdout') {
+                    output.textContent += data;
+                } else if (event === 'done') {
+                    output.textContent += data.status === 'success'
+                        ? `\n[finished in ${data.ms} ms]` : `\n[error: ${data.error}]`;
+                }
+            });
+            return read();
+        });
+        return read();
+    });
+}
+
+function copyCode() {
+    const codeText = document.getElementById('code-output').textContent;
+    navigator.clipboard.writeText(codeText).then(() => {
+        alert('Code copied to clipboard!');
+    });
+}
+
+function downloadCode() {
+    const language = document.getElementById('language-select').value;
+    const extensions = {
+        python: 'py',
+        javascript: 'js',
+        java: 'java',
+        cpp: 'cpp',
+        csharp: 'cs'
+    };
+    const codeText = document.getElementById('code-output').textContent;
+    const blob = new Blob([codeText], { type: 'text/plain' });
+    const url = URL.createObjectURL(blob);
+    const a = document.createElement('a');
+    a.href = url;
+    a.download = `algorithm.${extensions[language]}`;
+    a.click();
+}
+
+function toggleCodePanel() {
+    codePanel.classList.toggle('visible');
+}
+
+// RIG MODE FUNCTIONALITY (from previous version)
+function addRig(type) {
+    const rigId = `rig-${++rigCounter}`;
+    const rig = {
+        id: rigId,
+        type: type,
+        x: 100 + Math.random() * 300,
+        y: 100 + Math.random() * 200,
+        data: getRigDefaultData(type)
+    };
+    rigs.push(rig);
+    createRigElement(rig);
+    saveToBackend(rig, true);
+}
+
+function getRigDefaultData(type) {
+    switch(type) {
+        case 'table':
+            return { columns: ['Col 1', 'Col 2', 'Col 3'], rows: [['', '', ''], ['', '', '']] };
+        case 'function':
+            return { functionType: 'sum', language: 'python', code: '# input is the list of upstream outputs\nreturn input' };
+        case 'neural':
+            return { layers: [4, 6, 4, 2], activation: 'relu' };
+        case 'llm':
+            return { messages: [], model: 'gpt-4', temperature: 0.7 };
+        case 'chart':
+            return { chartType: 'line', data: [] };
+        case 'database':
+            return { database: '', query: '' };
+        default:
+            return {};
+    }
+}
+
+function createRigElement(rig) {
+    const rigEl = document.createElement('div');
+    rigEl.className = 'rig';
+    rigEl.id = rig.id;
+    rigEl.style.left = rig.x + 'px';
+    rigEl.style.top = rig.y + 'px';
+    rigEl.style.display = currentMode === 'rig' ? 'block' : 'none';
+
+    rigEl.innerHTML = `
+        <div class="rig-header">
+            <div class="rig-title">${getTypeIcon(rig.type)} ${rig.type}<span class="type-badge">${rig.type.toUpperCase()}</span></div>
+            <div><button class="rig-btn" onclick="minimizeRig('${rig.id}')">−</button>
+            <button class="rig-btn" onclick="removeRig('${rig.id}')">×</button></div>
+        </div>
+        <div class="rig-content" id="${rig.id}-content">${getRigContent(rig)}</div>
+    `;
+
+    const inputConnector = document.createElement('div');
+    inputConnector.className = 'connector input';
+    inputConnector.style.top = '20px';
+    inputConnector.onclick = (e) => handleConnectorClick(e, rig.id, 'input');
+    rigEl.appendChild(inputConnector);
+
+    const outputConnector = document.createElement('div');
+    outputConnector.className = 'connector output';
+    outputConnector.style.top = '20px';
+    outputConnector.onclick = (e) => handleConnectorClick(e, rig.id, 'output');
+    rigEl.appendChild(outputConnector);
+
+    const header = rigEl.querySelector('.rig-header');
+    header.addEventListener('mousedown', (e) => startDrag(e, rig));
+
+    rigEl.addEventListener('contextmenu', (e) => {
+        e.preventDefault();
+        showContextMenu(e, rig);
+    });
+
+    rigEl.addEventListener('click', () => selectRig(rig.id));
+    canvas.appendChild(rigEl);
+}
+
+function getRigContent(rig) {
+    switch(rig.type) {
+        case 'table': return createTableContent(rig);
+        case 'function': return createFunctionContent(rig);
+        case 'neural': return createNeuralContent(rig);
+        case 'llm': return createLLMContent(rig);
+        case 'chart': return createChartContent(rig);
+        case 'database': return createDatabaseContent(rig);
+        case 'data': return createDataContent(rig);
+        default: return '<p>Custom Rig - Add your content here</p>';
+    }
+}
+
+function createTableContent(rig) {
+    // Only the rows scrolled into view are rendered; the rest are
+    // fetched from the server a page at a time as they come into view.
+    let html = '<div>';
+    html += `<button class="add-column-btn" onclick="addColumn('${rig.id}')">+ Column</button>`;
+    html += `<button class="add-column-btn" onclick="addRow('${rig.id}')">+ Row</button></div>`;
+    html += `<div class="table-viewport" id="${rig.id}-viewport" style="max-height:${ROW_HEIGHT * VISIBLE_ROWS}px" onscroll="renderTableRows('${rig.id}')">`;
+    html += '<table class="data-table"><thead><tr>';
+    rig.data.columns.forEach((col, i) => {
+        html += `<th><input value="${col}" onchange="updateColumnName('${rig.id}', ${i}, this.value)" /></th>`;
+    });
+    html += `</tr></thead><tbody id="${rig.id}-rows"></tbody></table></div>`;
+    setTimeout(() => renderTableRows(rig.id));
+    return html;
+}
+
+function getRowCount(rig) {
+    return rig.data.rowCount ?? rig.data.rows.length;
+}
+
+function getTableRows(rig) {
+    if (!tableRows[rig.id]) tableRows[rig.id] = rig.data.rows || [];
+    return tableRows[rig.id];
+}
+
+function renderTableRows(rigId) {
+    const rig = rigs.find(r => r.id === rigId);
+    const viewport = document.getElementById(rigId + '-viewport');
+    const tbody = document.getElementById(rigId + '-rows');
+    if (!rig || !viewport || !tbody) return;
+    const total = getRowCount(rig);
+    const rows = getTableRows(rig);
+    const colspan = rig.data.columns.length;
+    const first = Math.max(0, Math.min(Math.floor(viewport.scrollTop / ROW_HEIGHT), total - VISIBLE_ROWS));
+    const last = Math.min(total, first + VISIBLE_ROWS + 2);
+    let html = `<tr style="height:${first * ROW_HEIGHT}px"><td colspan="${colspan}" style="padding:0;border:0"></td></tr>`;
+    for (let ri = first; ri < last; ri++) {
+        const row = rows[ri];
+        if (!row) {
+            fetchTableRows(rigId, ri);
+            html += `<tr style="height:${ROW_HEIGHT}px"><td colspan="${colspan}">Loading...</td></tr>`;
+            continue;
+        }
+        html += `<tr style="height:${ROW_HEIGHT}px">`;
+        rig.data.columns.forEach((_, ci) => {
+            html += `<td><input value="${row[ci] ?? ''}" onchange="updateCell('${rigId}', ${ri}, ${ci}, this.value)" /></td>`;
+        });
+        html += '</tr>';
+    }
+    html += `<tr style="height:${(total - last) * ROW_HEIGHT}px"><td colspan="${colspan}" style="padding:0;border:0"></td></tr>`;
+    tbody.innerHTML = html;
+}
+
+function fetchTableRows(rigId, rowIndex, limit = ROW_PAGE) {
+    const start = Math.floor(rowIndex / ROW_PAGE) * ROW_PAGE;
+    const key = `${rigId}:${start}:${limit}`;
+    if (!tableRowRequests[key]) {
+        tableRowRequests[key] = fetch(`${API}/rigs/${rigId}/rows?offset=${start}&limit=${limit}`)
+            .then(r => r.text()).then(text => {
+                const rows = tableRows[rigId] || (tableRows[rigId] = []);
+                text.split('\n').forEach((line, i) => {
+                    if (line) rows[start + i] = JSON.parse(line);
+                });
+                delete tableRowRequests[key];
+                renderTableRows(rigId);
+                return rows;
+            });
+    }
+    return tableRowRequests[key];
+}
+
+function loadAllTableRows(rig) {
+    if (rig.data.rowCount === undefined) return Promise.resolve(getTableRows(rig));
+    return fetchTableRows(rig.id, 0, getRowCount(rig));
+}
+
+function loadFunctionTypes() {
+    // The picker and parameter fields come from the server's registry
+    fetch('/api/function-types').then(r => r.json()).then(types => {
+        functionTypes = types;
+        rigs.filter(r => r.type === 'function').forEach(rig => {
+            const content = document.getElementById(rig.id + '-content');
+            if (content) content.innerHTML = getRigContent(rig);
+        });
+    }).catch(() => {});
+}
+
+function createFunctionParam(rig, param) {
+    const params = rig.data.params || {};
+    let value = params[param.name] ?? param.default ?? '';
+    if (Array.isArray(value)) value = value.join(', ');
+    const handler = `updateFunctionParam('${rig.id}', '${param.name}', this.value)`;
+    let field;
+    if (param.type === 'choice') {
+        field = `<select onchange="${handler}">` + param.choices.map(choice =>
+            `<option value="${choice}"${choice === value ? ' selected' : ''}>${choice}</option>`).join('') + '</select>';
+    } else {
+        const placeholder = param.type === 'columns' ? 'all numeric, or a, b, c' : param.type === 'column' ? 'column name' : '';
+        field = `<input type="${param.type === 'number' ? 'number' : 'text'}" value="${String(value).replace(/"/g, '&quot;')}" placeholder="${placeholder}" onchange="${handler}">`;
+    }
+    return `<div class="function-input"><label>${param.label}${param.required ? ' *' : ''}</label>${field}</div>`;
+}
+
+function createFunctionContent(rig) {
+    const type = functionTypes.find(t => t.name === rig.data.functionType);
+    const options = (functionTypes.length ? functionTypes : [{ name: rig.data.functionType, label: rig.data.functionType }])
+        .map(t => `<option value="${t.name}"${t.name === rig.data.functionType ? ' selected' : ''}>${t.label}</option>`).join('');
+    const usesCode = type ? type.code : rig.data.functionType === 'custom';
+    return `
+        <div class="function-input"><label>Function Type</label>
+        <select onchange="updateFunctionType('${rig.id}', this.value)">${options}</select></div>
+        ${type && type.inputs > 1 ? `<div class="function-input"><label>Takes ${type.inputs} inputs, in connection order</label></div>` : ''}
+        ${type ? type.params.map(param => createFunctionParam(rig, param)).join('') : ''}
+        ${usesCode ? `<div class="function-input"><label>Custom Code</label>
+        <select onchange="updateFunctionLanguage('${rig.id}', this.value)">
+            <option value="python"${rig.data.language === 'python' ? ' selected' : ''}>Python (server)</option>
+            <option value="javascript"${rig.data.language !== 'python' ? ' selected' : ''}>JavaScript (browser)</option>
+        </select>
+        <textarea onchange="updateFunctionCode('${rig.id}', this.value)">${rig.data.code}</textarea></div>` : ''}
+        <button class="execute-btn" onclick="executeFunction('${rig.id}')">Execute Function</button>
+        <div class="output-area" id="${rig.id}-output">Output will appear here...</div>
+    `;
+}
+
+function createNeuralContent(rig) {
+    let html = '<div class="function-input"><label>Network Architecture (comma-separated)</label>';
+    html += `<input value="${rig.data.layers.join(',')}" onchange="updateNeuralLayers('${rig.id}', this.value)" /></div>`;
+    rig.data.layers.forEach((count, i) => {
+        html += `<div class="neural-layer"><small>Layer ${i + 1} (${count} nodes)</small><br>`;
+        for(let j = 0; j < Math.min(count, 8); j++) {
+            html += '<div class="neural-node"></div>';
+        }
+        if(count > 8) html += `<span>... +${count - 8} more</span>`;
+        html += '</div>';
+    });
+    html += `<button class="execute-btn" onclick="trainNetwork('${rig.id}')">Train Network</button>`;
+    const model = rig.data.model;
+    html += `<div class="output-area" id="${rig.id}-output">${model
+        ? `Trained on ${model.rows} rows in ${model.seconds}s, loss ${model.finalLoss.toPrecision(4)}`
+        : 'Connect a table and train to fit the network'}</div>`;
+    return html;
+}
+
+function renderLossCurve(curve) {
+    // Loss per epoch as a small SVG line, scaled to its own range
+    if (!curve || curve.length < 2) return '';
+    const max = Math.max(...curve), min = Math.min(...curve), span = (max - min) || 1;
+    const points = curve.map((v, i) => `${(i / (curve.length - 1) * 200).toFixed(1)},${(60 - (v - min) / span * 56 - 2).toFixed(1)}`);
+    return `<svg width="200" height="60" style="display:block"><polyline points="${points.join(' ')}" fill="none" stroke="var(--accent)" stroke-width="2" /></svg>`;
+}
+
+function createLLMContent(rig) {
+    let html = `<div class="chat-container" id="${rig.id}-chat">`;
+    rig.data.messages.forEach(msg => {
+        html += `<div class="chat-message ${msg.role}">${msg.content}</div>`;
+    });
+    html += '</div><div class="chat-input-container">';
+    html += `<input type="text" id="${rig.id}-input" placeholder="Type a message..." onkeypress="if(event.key==='Enter') sendLLMMessage('${rig.id}')" />`;
+    html += `<button class="execute-btn" style="margin:0;width:auto;padding:6px 12px;" onclick="sendLLMMessage('${rig.id}')">Send</button></div>`;
+    return html;
+}
+
+function createChartContent(rig) {
+    return `<div class="function-input"><label>Chart Type</label>
+        <select onchange="updateChartType('${rig.id}', this.value)">
+            <option value="line">Line Chart</option><option value="bar">Bar Chart</option>
+            <option value="pie">Pie Chart</option><option value="scatter">Scatter Plot</option>
+        </select></div>
+        <div style="width:100%;height:150px;background:var(--bg-primary);border-radius:4px;display:flex;align-items:center;justify-content:center;">
+            Chart will render here
+        </div>`;
+}
+
+function createDatabaseContent(rig) {
+    // Without a database file, table rigs are queryable by id (rig-3 as rig_3)
+    const names = [...new Set([...databases, rig.data.database].filter(Boolean))];
+    const options = names.map(name => `<option value="${name}"${name === rig.data.database ? ' selected' : ''}>${name}</option>`).join('');
+    return `<div class="function-input"><label>Database</label>
+        <select onchange="updateDatabaseRig('${rig.id}', 'database', this.value)">
+            <option value="">Workspace tables</option>${options}
+        </select></div>
+        <div class="function-input"><label>SQL Query</label>
+        <textarea placeholder="SELECT * FROM rig_1" onchange="updateDatabaseRig('${rig.id}', 'query', this.value)">${escapeHtml(rig.data.query || '')}</textarea></div>
+        <button class="execute-btn" onclick="executeQuery('${rig.id}')">Run Query</button>
+        <div class="output-area" id="${rig.id}-query-output">Results will appear here...</div>`;
+}
+
+function createDataContent(rig) {
+    return `<div class="function-input"><label>Data Source</label>
+        <input type="text" placeholder="Enter data or URL" /></div>
+        <div class="function-input"><label>Format</label>
+        <select><option>JSON</option><option>CSV</option><option>XML</option></select></div>
+        <button class="execute-btn" onclick="loadData('${rig.id}')">Load Data</button>`;
+}
+
+function startDrag(e, rig) {
+    if (e.target.tagName === 'INPUT' || e.target.tagName === 'TEXTAREA' || e.target.tagName === 'SELECT') return;
+    draggedRig = rig;
+    const rigEl = document.getElementById(rig.id);
+    const rect = rigEl.getBoundingClientRect();
+    draggedRig.offsetX = e.clientX - rect.left;
+    draggedRig.offsetY = e.clientY - rect.top;
+    document.addEventListener('mousemove', doDrag);
+    document.addEventListener('mouseup', stopDrag);
+}
+
+function doDrag(e) {
+    if (!draggedRig) return;
+    const rigEl = document.getElementById(draggedRig.id);
+    draggedRig.x = e.clientX - draggedRig.offsetX - canvasOffset.x;
+    draggedRig.y = e.clientY - draggedRig.offsetY - canvasOffset.y;
+    rigEl.style.left = draggedRig.x + 'px';
+    rigEl.style.top = draggedRig.y + 'px';
+    updateConnections();
+}
+
+function stopDrag() {
+    if (draggedRig) patchRigOnBackend(draggedRig.id, { x: draggedRig.x, y: draggedRig.y });
+    draggedRig = null;
+    document.removeEventListener('mousemove', doDrag);
+    document.removeEventListener('mouseup', stopDrag);
+}
+
+function handleConnectorClick(e, rigId, type) {
+    e.stopPropagation();
+    if (!connectionStart) {
+        connectionStart = { rigId, type };
+    } else {
+        if (connectionStart.rigId !== rigId) {
+            createConnection(connectionStart.rigId, rigId);
+        }
+        connectionStart = null;
+    }
+}
+
+function createConnection(sourceId, targetId) {
+    const connId = `conn-${sourceId}-${targetId}`;
+    if (connections.find(c => c.id === connId)) return;
+    const connection = { id: connId, source: sourceId, target: targetId };
+    connections.push(connection);
+    updateConnections();
+    saveConnectionToBackend(connection);
+}
+
+function updateConnections() {
+    if (currentMode !== 'rig') return;
+    
+    const existingPaths = svg.querySelectorAll('path[data-type="rig"]');
+    existingPaths.forEach(path => path.remove());
+
+    connections.forEach(conn => {
+        const sourceRig = rigs.find(r => r.id === conn.source);
+        const targetRig = rigs.find(r => r.id === conn.target);
+        if (!sourceRig || !targetRig) return;
+        const sourceEl = document.getElementById(sourceRig.id);
+        const targetEl = document.getElementById(targetRig.id);
+        if (!sourceEl || !targetEl) return;
+        const sourceRect = sourceEl.getBoundingClientRect();
+        const targetRect = targetEl.getBoundingClientRect();
+        const canvasRect = canvas.getBoundingClientRect();
+        const x1 = sourceRect.right - canvasRect.left;
+        const y1 = sourceRect.top - canvasRect.top + 20;
+        const x2 = targetRect.left - canvasRect.left;
+        const y2 = targetRect.top - canvasRect.top + 20;
+        const path = document.createElementNS('http://www.w3.org/2000/svg', 'path');
+        const dx = Math.abs(x2 - x1);
+        const curve = `M ${x1} ${y1} C ${x1 + dx * 0.5} ${y1}, ${x2 - dx * 0.5} ${y2}, ${x2} ${y2}`;
+        path.setAttribute('d', curve);
+        path.setAttribute('stroke', '#007acc');
+        path.setAttribute('stroke-width', '2');
+        path.setAttribute('fill', 'none');
+        path.setAttribute('opacity', '0.6');
+        path.setAttribute('data-type', 'rig');
+        svg.appendChild(path);
+    });
+}
+
+function removeRig(rigId) {
+    const index = rigs.findIndex(r => r.id === rigId);
+    if (index > -1) {
+        rigs.splice(index, 1);
+        document.getElementById(rigId).remove();
+        connections = connections.filter(c => c.source !== rigId && c.target !== rigId);
+        updateConnections();
+        fetch(`${API}/rigs`, { method: 'DELETE', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ id: rigId }) });
+    }
+}
+
+function selectRig(rigId) {
+    document.querySelectorAll('.rig').forEach(r => r.classList.remove('selected'));
+    selectedRig = rigId;
+    document.getElementById(rigId).classList.add('selected');
+}
+
+function minimizeRig(rigId) {
+    const content = document.getElementById(rigId + '-content');
+    content.style.display = content.style.display === 'none' ? 'block' : 'none';
+}
+
+function updateRigContent(rigId) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        document.getElementById(rigId + '-content').innerHTML = getRigContent(rig);
+        saveToBackend(rig, true);
+    }
+}
+
+function addColumn(rigId) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        const name = `Col ${rig.data.columns.length + 1}`;
+        rig.data.columns.push(name);
+        getTableRows(rig).forEach(row => row.push(''));
+        document.getElementById(rigId + '-content').innerHTML = getRigContent(rig);
+        patchTableOnBackend(rigId, { addColumns: [name] });
+    }
+}
+
+function addRow(rigId) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        const count = getRowCount(rig);
+        getTableRows(rig)[count] = new Array(rig.data.columns.length).fill('');
+        if (rig.data.rowCount !== undefined) rig.data.rowCount = count + 1;
+        renderTableRows(rigId);
+        patchTableOnBackend(rigId, { appendRows: 1 });
+    }
+}
+
+function updateColumnName(rigId, colIndex, value) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data.columns[colIndex] = value;
+        patchTableOnBackend(rigId, { columns: [{ col: colIndex, name: value }] });
+    }
+}
+
+function updateCell(rigId, rowIndex, colIndex, value) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        getTableRows(rig)[rowIndex][colIndex] = value;
+        patchTableOnBackend(rigId, { cells: [{ row: rowIndex, col: colIndex, value }] });
+    }
+}
+
+function patchTableOnBackend(rigId, patch) {
+    fetch(`${API}/rigs/${rigId}/cells`, { method: 'PATCH', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(patch) })
+        .then(r => r.json()).then(data => {
+            if (data.status === 'success') {
+                Object.entries(data.results).forEach(([id, result]) => showExecutionResult(id, result));
+            }
+        });
+}
+
+function updateFunctionType(rigId, type) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data.functionType = type;
+        patchRigOnBackend(rigId, { data: { functionType: type } });
+        document.getElementById(rigId + '-content').innerHTML = getRigContent(rig);
+    }
+}
+
+function updateFunctionParam(rigId, name, value) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data.params = { ...(rig.data.params || {}), [name]: value };
+        patchRigOnBackend(rigId, { data: { params: rig.data.params } });
+    }
+}
+
+function updateFunctionLanguage(rigId, language) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data.language = language;
+        patchRigOnBackend(rigId, { data: { language } });
+    }
+}
+
+function updateFunctionCode(rigId, code) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data.code = code;
+        patchRigOnBackend(rigId, { data: { code } });
+    }
+}
+
+function executeFunction(rigId) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        const output = document.getElementById(rigId + '-output');
+        output.innerHTML = '<div class="spinner"></div> Executing...';
+        if (rig.data.functionType === 'custom' && rig.data.language !== 'python') {
+            executeCustomFunction(rig, output);
+            return;
+        }
+        startJob('execute', { rigs: [rigId] }, output, job => {
+            Object.entries(job.results || {}).forEach(([id, result]) => showExecutionResult(id, result));
+        });
+    }
+}
+
+function startJob(kind, params, output, onUpdate) {
+    // Runs in the background on the server; progress and partial
+    // results stream back until the job finishes or is cancelled
+    fetch(`${API}/jobs`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ kind, params }) })
+        .then(r => r.json()).then(job => {
+            if (!job.id) {
+                output.innerHTML = `<span style="color:var(--error)">Error: ${job.error}</span>`;
+                return;
+            }
+            output.innerHTML = `<div class="spinner"></div> Running... <button class="execute-btn" onclick="cancelJob('${job.id}')">Cancel</button>`;
+            watchJob(job.id, output, onUpdate);
+        }).catch(e => {
+            output.innerHTML = `<span style="color:var(--error)">Error: ${e.message}</span>`;
+        });
+}
+
+function watchJob(jobId, output, onUpdate) {
+    const stream = new EventSource(`${API}/jobs/${jobId}/events`);
+    stream.addEventListener('progress', e => onUpdate(JSON.parse(e.data)));
+    stream.addEventListener('done', e => {
+        stream.close();
+        const done = JSON.parse(e.data);
+        onUpdate(done);
+        if (done.status === 'failed') {
+            output.innerHTML = `<span style="color:var(--error)">Error: ${done.error}</span>`;
+        } else if (done.status === 'cancelled') {
+            output.innerHTML = `<span style="color:var(--error)">Cancelled</span>`;
+        }
+    });
+    // The browser gives up on a 503; try again once a slot may be free
+    stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED) setTimeout(() => watchJob(jobId, output, onUpdate), STREAM_RETRY_MS);
+    };
+}
+
+function cancelJob(jobId) {
+    fetch(`${API}/jobs/${jobId}`, { method: 'DELETE' });
+}
+
+function showExecutionResult(rigId, result) {
+    const output = document.getElementById(rigId + '-output');
+    if (!output) return;
+    if (result.status === 'success') {
+        output.innerHTML = `<pre>${JSON.stringify(result.output, null, 2)}</pre>`;
+    } else {
+        output.innerHTML = `<span style="color:var(--error)">Error: ${result.error}</span>`;
+    }
+}
+
+function executeCustomFunction(rig, output) {
+    const inputData = connections.filter(c => c.target === rig.id).map(c => {
+        const sourceRig = rigs.find(r => r.id === c.source);
+        return sourceRig ? sourceRig.data : null;
+    });
+    try {
+        const func = new Function('input', rig.data.code);
+        const result = func(inputData);
+        output.innerHTML = `<pre>${JSON.stringify(result, null, 2)}</pre>`;
+    } catch(e) {
+        output.innerHTML = `<span style="color:var(--error)">Error: ${e.message}</span>`;
+    }
+}
+
+function updateNeuralLayers(rigId, value) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data.layers = value.split(',').map(n => parseInt(n.trim()));
+        updateRigContent(rigId);
+    }
+}
+
+function trainNetwork(rigId) {
+    const output = document.getElementById(rigId + '-output');
+    output.innerHTML = '<div class="spinner"></div> Training...';
+    startJob('train', { rig: rigId }, output, job => {
+        const progress = job.progress || {};
+        if (job.status === 'succeeded') {
+            output.innerHTML = `Trained on ${progress.model.rows} rows in ${progress.model.seconds}s, loss ${progress.model.finalLoss.toPrecision(4)}` + renderLossCurve(progress.loss);
+        } else if (job.status === 'running' && progress.epoch) {
+            output.innerHTML = `<div class="spinner"></div> Epoch ${progress.epoch}/${progress.epochs}, loss ${progress.batchLoss.toPrecision(4)} <button class="execute-btn" onclick="cancelJob('${job.id}')">Cancel</button>` + renderLossCurve(progress.loss);
+        }
+    });
+}
+
+function sendLLMMessage(rigId) {
+    const rig = rigs.find(r => r.id === rigId);
+    const input = document.getElementById(rigId + '-input');
+    if (rig && input.value.trim()) {
+        rig.data.messages.push({ role: 'user', content: input.value });
+        setTimeout(() => {
+            rig.data.messages.push({ role: 'assistant', content: 'This is a simulated AI response. Connect to actual LLM API for real responses.' });
+            updateRigContent(rigId);
+        }, 1000);
+        updateRigContent(rigId);
+        input.value = '';
+    }
+}
+
+function updateChartType(rigId, type) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data.chartType = type;
+        patchRigOnBackend(rigId, { data: { chartType: type } });
+    }
+}
+
+function escapeHtml(value) {
+    return String(value).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+}
+
+function updateDatabaseRig(rigId, field, value) {
+    const rig = rigs.find(r => r.id === rigId);
+    if (rig) {
+        rig.data[field] = value;
+        patchRigOnBackend(rigId, { data: { [field]: value } });
+    }
+}
+
+function executeQuery(rigId, offset = 0) {
+    // Results come a page at a time; "More" appends the next page
+    const output = document.getElementById(rigId + '-query-output');
+    if (!offset) output.innerHTML = '<div class="spinner"></div> Querying...';
+    fetch(`${API}/rigs/${rigId}/query?offset=${offset}`).then(r => r.json()).then(page => {
+        if (page.error) {
+            output.innerHTML = `<span style="color:var(--error)">Error: ${escapeHtml(page.error)}</span>`;
+            return;
+        }
+        const rows = page.rows.map(row => '<tr>' + row.map(cell => `<td>${escapeHtml(cell)}</td>`).join('') + '</tr>').join('');
+        const more = page.more ? `<button class="execute-btn" onclick="executeQuery('${rigId}', ${page.offset + page.rows.length})">More</button>` : '';
+        const tbody = document.getElementById(rigId + '-query-rows');
+        if (offset && tbody) {
+            tbody.insertAdjacentHTML('beforeend', rows);
+            document.getElementById(rigId + '-query-more').innerHTML = more;
+            return;
+        }
+        output.innerHTML = `<div class="table-viewport" style="max-height:${ROW_HEIGHT * VISIBLE_ROWS}px"><table class="data-table">
+            <thead><tr>${page.columns.map(c => `<th>${escapeHtml(c)}</th>`).join('')}</tr></thead>
+            <tbody id="${rigId}-query-rows">${rows}</tbody></table></div>
+            <div>${page.ms} ms</div><div id="${rigId}-query-more">${more}</div>`;
+    });
+}
+
+function loadData(rigId) {
+    alert('Data loaded for ' + rigId);
+}
+
+function showContextMenu(e, item) {
+    contextMenuTarget = item;
+    contextMenu.style.left = e.clientX + 'px';
+    contextMenu.style.top = e.clientY + 'px';
+    contextMenu.style.display = 'block';
+}
+
+function duplicateItem() {
+    if (currentMode === 'rig' && contextMenuTarget && contextMenuTarget.type) {
+        const original = rigs.find(r => r.id === contextMenuTarget.id);
+        if (original && original.type === 'table') {
+            const id = `rig-${++rigCounter}`;
+            loadAllTableRows(original).then(rows => {
+                const data = { ...original.data, rows: rows.map(row => [...row]), rowCount: undefined, rowsRev: undefined };
+                const newRig = { ...original, id, x: original.x + 30, y: original.y + 30, data };
+                rigs.push(newRig);
+                createRigElement(newRig);
+                saveToBackend(newRig, true);
+            });
+        } else if (original) {
+            const newRig = { ...original, id: `rig-${++rigCounter}`, x: original.x + 30, y: original.y + 30 };
+            rigs.push(newRig);
+            createRigElement(newRig);
+            saveToBackend(newRig, true);
+        }
+    } else if (currentMode === 'coding' && contextMenuTarget) {
+        const original = codeBlocks.find(b => b.id === contextMenuTarget.id);
+        if (original) {
+            const newBlock = { ...original, id: `block-${++blockCounter}`, x: original.x + 30, y: original.y + 30 };
+            codeBlocks.push(newBlock);
+            createCodeBlockElement(newBlock);
+            saveBlockToBackend(newBlock);
+        }
+    }
+    contextMenu.style.display = 'none';
+}
+
+function deleteItem() {
+    if (currentMode === 'rig' && (contextMenuTarget || selectedRig)) {
+        const id = contextMenuTarget?.id || selectedRig;
+        removeRig(id);
+    } else if (currentMode === 'coding' && (contextMenuTarget || selectedBlock)) {
+        const id = contextMenuTarget?.id || selectedBlock;
+        const index = codeBlocks.findIndex(b => b.id === id);
+        if (index > -1) {
+            codeBlocks.splice(index, 1);
+            document.getElementById(id).remove();
+            blockConnections = blockConnections.filter(c => c.source !== id && c.target !== id);
+            updateBlockConnections();
+            fetch(`${API}/blocks`, { method: 'DELETE', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ id }) });
+        }
+    }
+    contextMenu.style.display = 'none';
+}
+
+function exportItem() {
+    if (contextMenuTarget) {
+        const data = JSON.stringify(contextMenuTarget, null, 2);
+        const blob = new Blob([data], { type: 'application/json' });
+        const url = URL.createObjectURL(blob);
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = `${contextMenuTarget.id}.json`;
+        a.click();
+    }
+    contextMenu.style.display = 'none';
+}
+
+function saveWorkspace() {
+    // The server holds the workspace; the local copy is only an offline
+    // fallback and a full localStorage must not stop the save
+    try {
+        localStorage.setItem(STORAGE_KEY, JSON.stringify({ rigs: rigs.map(withoutRows), connections, codeBlocks, blockConnections }));
+    } catch (err) {
+        localStorage.removeItem(STORAGE_KEY);
+    }
+    saveBatchToBackend({ rigs: rigs.map(withoutRows), connections, blocks: codeBlocks, blockConnections })
+        .then(() => fetch(`${API}/snapshots`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ offset: canvasOffset }) }))
+        .then(r => r.json())
+        .then(snapshot => alert(`Workspace saved successfully! (snapshot ${snapshot.id})`));
+}
+
+function loadWorkspace() {
+    // Rigs, code blocks and their connections all come from /changes; only
+    // the canvas offset is taken from the latest snapshot.
+    const first = lastRev === 0;
+    fetch(`${API}/changes?since=${lastRev}`).then(r => r.json()).then(changes => {
+        applyChanges(changes);
+        connectEvents();
+        if (first) {
+            fetch(`${API}/snapshots/latest`).then(r => r.ok ? r.json() : null).then(snapshot => {
+                if (snapshot) applyCanvas(snapshot);
+            });
+        }
+    }).catch(err => {
+        const saved = localStorage.getItem(STORAGE_KEY);
+        if (saved) {
+            const data = JSON.parse(saved);
+            rigs = data.rigs || [];
+            connections = data.connections || [];
+            codeBlocks = data.codeBlocks || [];
+            blockConnections = data.blockConnections || [];
+            canvas.innerHTML = '';
+            rigs.forEach(createRigElement);
+            codeBlocks.forEach(createCodeBlockElement);
+            updateConnections();
+            updateBlockConnections();
+        }
+    });
+}
+
+function connectEvents() {
+    // Other editors' changes arrive as deltas over Server-Sent Events
+    if (eventSource) return;
+    eventSource = new EventSource(`${API}/events?since=${lastRev}`);
+    eventSource.addEventListener('changes', e => applyChanges(JSON.parse(e.data)));
+    // The browser gives up on a 503; try again once a slot may be free
+    eventSource.onerror = () => {
+        if (eventSource.readyState !== EventSource.CLOSED) return;
+        eventSource = null;
+        setTimeout(connectEvents, STREAM_RETRY_MS);
+    };
+}
+
+function applyChanges(changes) {
+    // Saves are acknowledged before they are written; one the server could
+    // not store comes back here
+    if (changes.writeErrors && changes.writeErrors.length) {
+        alert('Some changes could not be saved:\n' +
+              changes.writeErrors.map(e => `${e.kind} ${e.id}: ${e.error}`).join('\n'));
+    }
+    // Only touch the DOM for rigs that changed since lastRev
+    const rigIndex = new Map(rigs.map((r, i) => [r.id, i]));
+    changes.rigs.forEach(rig => {
+        const counter = parseInt(rig.id.replace('rig-', ''));
+        if (counter > rigCounter) rigCounter = counter;
+        const rigEl = document.getElementById(rig.id);
+        if (rigIndex.has(rig.id)) {
+            if (rigs[rigIndex.get(rig.id)].data.rowsRev !== rig.data.rowsRev) delete tableRows[rig.id];
+            rigs[rigIndex.get(rig.id)] = rig;
+        } else {
+            rigIndex.set(rig.id, rigs.push(rig) - 1);
+        }
+        if (draggedRig && draggedRig.id === rig.id) {
+            // Keep following the mouse; the drop sends the final position
+            Object.assign(rig, { x: draggedRig.x, y: draggedRig.y, offsetX: draggedRig.offsetX, offsetY: draggedRig.offsetY });
+            draggedRig = rig;
+        }
+        if (rigEl) {
+            rigEl.style.left = rig.x + 'px';
+            rigEl.style.top = rig.y + 'px';
+            // Leave a field the user is typing in alone
+            if (!rigEl.contains(document.activeElement)) {
+                document.getElementById(rig.id + '-content').innerHTML = getRigContent(rig);
+            }
+        } else {
+            createRigElement(rig);
+        }
+    });
+    if (changes.deletedRigs.length) {
+        const deleted = new Set(changes.deletedRigs);
+        rigs = rigs.filter(r => !deleted.has(r.id));
+        deleted.forEach(id => document.getElementById(id)?.remove());
+    }
+
+    const changed = new Map(changes.connections.map(c => [c.id, c]));
+    const deletedConns = new Set(changes.deletedConnections);
+    if (changed.size || deletedConns.size) {
+        connections = connections.filter(c => !changed.has(c.id) && !deletedConns.has(c.id));
+        connections.push(...changed.values());
+        updateConnections();
+    }
+    applyBlockChanges(changes);
+    lastRev = changes.rev;
+}
+
+function applyBlockChanges(changes) {
+    // Blocks are updated in place: their elements' handlers hold the object
+    const blockIndex = new Map(codeBlocks.map((b, i) => [b.id, i]));
+    changes.blocks.forEach(block => {
+        const counter = parseInt(String(block.id).replace('block-', ''));
+        if (counter > blockCounter) blockCounter = counter;
+        if (draggedBlock && draggedBlock.id === block.id) {
+            // Keep following the mouse; the drop sends the final position
+            Object.assign(block, { x: draggedBlock.x, y: draggedBlock.y });
+        }
+        const blockEl = document.getElementById(block.id);
+        if (!blockIndex.has(block.id)) {
+            blockIndex.set(block.id, codeBlocks.push(block) - 1);
+            if (!blockEl) createCodeBlockElement(block);
+            return;
+        }
+        const current = codeBlocks[blockIndex.get(block.id)];
+        const dataChanged = JSON.stringify(current.data) !== JSON.stringify(block.data);
+        Object.assign(current, block);
+        if (!blockEl) {
+            createCodeBlockElement(current);
+        } else if (dataChanged && !blockEl.contains(document.activeElement)) {
+            // Leave a field the user is typing in alone
+            blockEl.remove();
+            createCodeBlockElement(current);
+            if (selectedBlock === current.id) document.getElementById(current.id).classList.add('selected');
+        } else {
+            blockEl.style.left = current.x + 'px';
+            blockEl.style.top = current.y + 'px';
+        }
+    });
+    if (changes.deletedBlocks.length) {
+        const deleted = new Set(changes.deletedBlocks);
+        codeBlocks = codeBlocks.filter(b => !deleted.has(b.id));
+        deleted.forEach(id => document.getElementById(id)?.remove());
+    }
+
+    const changed = new Map(changes.blockConnections.map(c => [c.id, c]));
+    const deletedConns = new Set(changes.deletedBlockConnections);
+    if (changed.size || deletedConns.size || changes.blocks.length || changes.deletedBlocks.length) {
+        blockConnections = blockConnections.filter(c => !changed.has(c.id) && !deletedConns.has(c.id));
+        blockConnections.push(...changed.values());
+        updateBlockConnections();
+    }
+}
+
+function applyCanvas(snapshot) {
+    canvasOffset = snapshot.offset || { x: 0, y: 0 };
+    canvas.style.transform = `translate(${canvasOffset.x}px, ${canvasOffset.y}px)`;
+    updateConnections();
+    updateBlockConnections();
+}
+
+function showSnapshots() {
+    fetch(`${API}/snapshots`).then(r => r.json()).then(list => {
+        if (!list.length) {
+            alert('No snapshots yet. Save the workspace to create one.');
+            return;
+        }
+        const lines = list.map(s => `${s.id}: ${new Date(s.created * 1000).toLocaleString()}${s.label ? ' - ' + s.label : ''}`);
+        const choice = prompt(`Restore which snapshot?\n${lines.join('\n')}`, list[0].id);
+        if (choice) restoreSnapshot(choice.trim());
+    });
+}
+
+function restoreSnapshot(snapshotId) {
+    fetch(`${API}/snapshots/${encodeURIComponent(snapshotId)}/restore`, { method: 'POST' })
+        .then(r => r.json())
+        .then(result => {
+            if (result.status !== 'success') {
+                alert(result.error);
+                return;
+            }
+            // Reload the graph from scratch; deletions since lastRev
+            // are easier to drop than to replay
+            rigs = [];
+            connections = [];
+            codeBlocks = [];
+            blockConnections = [];
+            lastRev = 0;
+            tableRows = {};
+            document.querySelectorAll('.rig, .code-block').forEach(el => el.remove());
+            fetch(`${API}/changes?since=0`).then(r => r.json()).then(changes => {
+                applyChanges(changes);
+                applyCanvas(result);
+            });
+        });
+}
+
+function clearCanvas() {
+    if (confirm('Clear all items?')) {
+        if (currentMode === 'rig') {
+            rigs = [];
+            connections = [];
+            lastRev = 0;
+            tableRows = {};
+            document.querySelectorAll('.rig').forEach(r => r.remove());
+        } else {
+            codeBlocks = [];
+            blockConnections = [];
+            document.querySelectorAll('.code-block').forEach(b => b.remove());
+        }
+        svg.innerHTML = '';
+    }
+}
+
+function saveToBackend(rig, withRows) {
+    // Table cells are saved through cell patches; only structural
+    // changes (new table, added row/column) resend the rows.
+    const body = withRows ? rig : withoutRows(rig);
+    fetch(`${API}/rigs`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(body) });
+}
+
+function patchRigOnBackend(rigId, fields) {
+    // Sends only what changed, so edits by others to other fields survive
+    fetch(`${API}/rigs/${rigId}`, { method: 'PATCH', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(fields) });
+}
+
+function withoutRows(rig) {
+    return rig.type === 'table' ? { ...rig, data: { ...rig.data, rows: undefined } } : rig;
+}
+
+function saveConnectionToBackend(connection) {
+    fetch(`${API}/connections`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(connection) });
+}
+
+function saveBlockToBackend(block) {
+    fetch(`${API}/blocks`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(block) });
+}
+
+function patchBlockOnBackend(blockId, fields) {
+    fetch(`${API}/blocks/${blockId}`, { method: 'PATCH', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(fields) });
+}
+
+function saveBlockConnectionToBackend(connection) {
+    fetch(`${API}/block-connections`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(connection) });
+}
+
+function saveBatchToBackend(changes) {
+    return fetch(`${API}/batch`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(changes) });
+}
+
+function setTheme(theme) {
+    document.documentElement.setAttribute('data-theme', theme);
+    document.querySelectorAll('.mode-btn').forEach(btn => btn.classList.remove('active'));
+    event.target.classList.add('active');
+}
+
+function getTypeIcon(type) {
+    const icons = { data: '📊', table: '📋', function: '⚙️', llm: '🤖', neural: '🧠', chart: '📈', database: '💾', custom: '✨' };
+    return icons[type] || '📦';
+}
+
+setTimeout(() => {
+    if (rigs.length === 0 && codeBlocks.length === 0) {
+        addRig('data');
+        addRig('function');
+    }
+}, 500);
@@ -0,0 +1,574 @@
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import tables
+
+DB_PATH = os.environ.get('RIGS_DB', 'rigs.db')
+# Every workspace other than the default one gets its own database file here
+WORKSPACE_DIR = os.environ.get('RIGS_WORKSPACE_DIR', 'workspaces')
+DEFAULT_WORKSPACE = 'default'
+MAX_OPEN_WORKSPACES = int(os.environ.get('RIGS_MAX_OPEN_WORKSPACES', 32))
+WORKSPACE_ID = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+# Coding-mode blocks that hold a body. A block connection leaves from its
+# source's 'body' port (the first statement inside) or 'next' port.
+COMPOUND_BLOCKS = ('condition', 'loop', 'function')
+BLOCK_PORTS = ('next', 'body')
+
+# How long a writer waits on a locked database before giving up, and how many
+# times BEGIN is retried on top of that when the lock is still held.
+BUSY_TIMEOUT = 5.0
+BUSY_RETRIES = 5
+STATEMENT_CACHE_SIZE = 256
+MAX_WRITE_ERRORS = 100
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA foreign_keys=ON',
+)
+
+_local = threading.local()
+# Called with the workspace id after each committed transaction()
+commit_listeners = []
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+class WorkspaceError(ValueError):
+    pass
+
+
+class MissingWorkspace(WorkspaceError):
+    pass
+
+
+class ItemError(ValueError):
+    pass
+
+
+def workspace_path(workspace):
+    if workspace == DEFAULT_WORKSPACE:
+        return DB_PATH
+    if not isinstance(workspace, str) or not WORKSPACE_ID.match(workspace):
+        raise WorkspaceError(f'Invalid workspace id {workspace!r}')
+    return os.path.join(WORKSPACE_DIR, workspace + '.db')
+
+
+def check_workspace(workspace):
+    # Only the default workspace exists without being created first
+    path = workspace_path(workspace)
+    if workspace != DEFAULT_WORKSPACE and not os.path.exists(path):
+        raise MissingWorkspace(f'Workspace {workspace!r} not found')
+    return path
+
+
+def create_workspace(workspace):
+    # True when the workspace did not exist before
+    created = workspace != DEFAULT_WORKSPACE and not os.path.exists(workspace_path(workspace))
+    get_db(workspace, create=True)
+    return created
+
+
+def list_workspaces():
+    names = [DEFAULT_WORKSPACE]
+    if os.path.isdir(WORKSPACE_DIR):
+        names += sorted(name[:-3] for name in os.listdir(WORKSPACE_DIR)
+                        if name.endswith('.db') and WORKSPACE_ID.match(name[:-3])
+                        and name[:-3] != DEFAULT_WORKSPACE)
+    return names
+
+
+def connect(path=DB_PATH):
+    # isolation_level=None leaves transaction control to atomic() below
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def get_db(workspace=DEFAULT_WORKSPACE, create=False):
+    # One connection per thread and workspace, kept in a small LRU and
+    # recreated after a fork so gunicorn workers never share a handle
+    # inherited from the master process. Only create=True makes a new
+    # workspace's file; otherwise an unknown one is MissingWorkspace.
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.conns = OrderedDict()
+        _local.pid = os.getpid()
+    conns = _local.conns
+    conn = conns.get(workspace)
+    if conn is not None:
+        conns.move_to_end(workspace)
+        return conn
+    if create:
+        path = workspace_path(workspace)
+        if workspace != DEFAULT_WORKSPACE:
+            os.makedirs(WORKSPACE_DIR, exist_ok=True)
+    else:
+        path = check_workspace(workspace)
+    conn = connect(path)
+    with _migrate_lock:
+        if path not in _migrated:
+            migrate(conn)
+            _migrated.add(path)
+    conns[workspace] = conn
+    while len(conns) > MAX_OPEN_WORKSPACES:
+        conns.popitem(last=False)[1].close()
+    return conn
+
+
+def close_db():
+    if getattr(_local, 'pid', None) == os.getpid():
+        for conn in _local.conns.values():
+            conn.close()
+    _local.conns = OrderedDict()
+    _local.pid = os.getpid()
+
+
+def _begin(conn):
+    for attempt in range(BUSY_RETRIES):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            if attempt == BUSY_RETRIES - 1:
+                raise
+            time.sleep(0.01 * (2 ** attempt) * (1 + random.random()))
+
+
+@contextmanager
+def atomic(conn):
+    # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers
+    # queue on busy_timeout instead of failing on a read->write upgrade.
+    _begin(conn)
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+
+@contextmanager
+def transaction(workspace=DEFAULT_WORKSPACE):
+    with atomic(get_db(workspace)) as conn:
+        yield conn
+    for listener in commit_listeners:
+        listener(workspace)
+
+
+def _migrate_base(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS rigs
+                    (id TEXT PRIMARY KEY, type TEXT, data TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS connections
+                    (id TEXT PRIMARY KEY, source TEXT, target TEXT, data TEXT)''')
+
+
+def _migrate_revisions(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS tombstones
+                    (kind TEXT, id TEXT, rev INTEGER, PRIMARY KEY (kind, id))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS meta
+                    (key TEXT PRIMARY KEY, value INTEGER)''')
+    conn.execute("INSERT OR IGNORE INTO meta VALUES ('rev', 0)")
+    _add_column(conn, 'rigs', 'rev', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'connections', 'rev', 'INTEGER NOT NULL DEFAULT 0')
+    conn.execute('CREATE INDEX IF NOT EXISTS rigs_rev ON rigs(rev)')
+    conn.execute('CREATE INDEX IF NOT EXISTS connections_rev ON connections(rev)')
+    conn.execute('CREATE INDEX IF NOT EXISTS tombstones_rev ON tombstones(rev)')
+
+
+def _migrate_connection_endpoints(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS connections_source ON connections(source)')
+    conn.execute('CREATE INDEX IF NOT EXISTS connections_target ON connections(target)')
+
+
+def _migrate_table_storage(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS table_columns
+                    (rig_id TEXT, col INTEGER, dtype TEXT, PRIMARY KEY (rig_id, col))''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS table_chunks
+                    (rig_id TEXT, col INTEGER, chunk INTEGER, data BLOB,
+                     PRIMARY KEY (rig_id, col, chunk))''')
+    rev = current_rev(conn)
+    for rig_id, data in conn.execute("SELECT id, data FROM rigs WHERE type = 'table'").fetchall():
+        rig = json.loads(data)
+        rig = _split_table(conn, rig, rev)
+        conn.execute('UPDATE rigs SET data = ? WHERE id = ?', (json.dumps(rig), rig_id))
+
+
+def _migrate_snapshots(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS snapshots
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT, rev INTEGER, created REAL,
+                     label TEXT, size INTEGER, data BLOB, tables BLOB)''')
+
+
+def _migrate_jobs(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                    (id TEXT PRIMARY KEY, kind TEXT, status TEXT, params TEXT,
+                     created REAL, started REAL, finished REAL, progress TEXT,
+                     results TEXT, error TEXT, cancel INTEGER NOT NULL DEFAULT 0,
+                     seq INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS jobs_created ON jobs(created)')
+
+
+def _migrate_models(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS models
+                    (rig_id TEXT PRIMARY KEY, meta TEXT, weights BLOB)''')
+
+
+def _migrate_code_blocks(conn):
+    # Coding-mode blocks get the same shape as rigs and connections. Until
+    # now they only lived in snapshots, so the latest one seeds the tables.
+    conn.execute('''CREATE TABLE IF NOT EXISTS code_blocks
+                    (id TEXT PRIMARY KEY, type TEXT, data TEXT, rev INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS block_connections
+                    (id TEXT PRIMARY KEY, source TEXT, target TEXT, data TEXT,
+                     rev INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS code_blocks_rev ON code_blocks(rev)')
+    conn.execute('CREATE INDEX IF NOT EXISTS block_connections_rev ON block_connections(rev)')
+    conn.execute('CREATE INDEX IF NOT EXISTS block_connections_source ON block_connections(source)')
+    conn.execute('CREATE INDEX IF NOT EXISTS block_connections_target ON block_connections(target)')
+    row = conn.execute('SELECT data FROM snapshots ORDER BY id DESC LIMIT 1').fetchone()
+    if row is not None:
+        document = json.loads(zlib.decompress(row[0]))
+        save_blocks(conn, document.get('codeBlocks') or [])
+        save_block_connections(conn, document.get('blockConnections') or [])
+
+
+def _migrate_job_owner(conn):
+    # The process that holds a job in its pool, so orphans can be failed
+    _add_column(conn, 'jobs', 'owner', 'TEXT')
+
+
+def _migrate_block_ports(conn):
+    # Block connections say which port they leave from. Before, the first
+    # connection out of a condition, loop or function was its body; rowid
+    # order is the closest record of which one that was.
+    types = dict(conn.execute('SELECT id, type FROM code_blocks'))
+    has_body = set()
+    updates = []
+    for conn_id, source, data in conn.execute('SELECT id, source, data FROM block_connections ORDER BY rowid'):
+        connection = json.loads(data)
+        body = types.get(source) in COMPOUND_BLOCKS and source not in has_body
+        if body:
+            has_body.add(source)
+        connection['port'] = 'body' if body else 'next'
+        updates.append((json.dumps(connection), conn_id))
+    conn.executemany('UPDATE block_connections SET data = ? WHERE id = ?', updates)
+
+
+def _migrate_write_errors(conn):
+    # Queued writes that could never be stored; reported through changes_since
+    conn.execute('CREATE TABLE IF NOT EXISTS write_errors (rev INTEGER, kind TEXT, id TEXT, error TEXT)')
+    conn.execute('CREATE INDEX IF NOT EXISTS write_errors_rev ON write_errors(rev)')
+    # Clients report errors only after a load (since > 0), so a loaded
+    # workspace must never still be at rev 0
+    if current_rev(conn) == 0:
+        _next_rev(conn)
+
+
+# Applied in order; PRAGMA user_version records how many have run. The first
+# steps are idempotent so databases created before versioning upgrade cleanly.
+MIGRATIONS = [
+    _migrate_base,
+    _migrate_revisions,
+    _migrate_connection_endpoints,
+    _migrate_table_storage,
+    _migrate_snapshots,
+    _migrate_jobs,
+    _migrate_models,
+    _migrate_code_blocks,
+    _migrate_job_owner,
+    _migrate_block_ports,
+    _migrate_write_errors,
+]
+
+
+def migrate(conn):
+    with atomic(conn):
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        for step in MIGRATIONS[version:]:
+            step(conn)
+        if version < len(MIGRATIONS):
+            conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
+
+
+def init_db():
+    get_db(DEFAULT_WORKSPACE)
+
+
+def _add_column(conn, table, column, decl):
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def current_rev(conn):
+    return conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0]
+
+
+def _next_rev(conn):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'rev'")
+    return current_rev(conn)
+
+
+def _bury(conn, kind, ids, rev):
+    conn.executemany('INSERT OR REPLACE INTO tombstones VALUES (?, ?, ?)',
+                     [(kind, item_id, rev) for item_id in ids])
+
+
+def _unbury(conn, kind, ids):
+    conn.executemany('DELETE FROM tombstones WHERE kind = ? AND id = ?',
+                     [(kind, item_id) for item_id in ids])
+
+
+def _split_table(conn, rig, rev):
+    # Table rows go to columnar storage; the rig JSON keeps the column names,
+    # the row count and the revision of the last content change.
+    data = dict(rig.get('data') or {})
+    if 'rows' in data:
+        data['rowCount'] = tables.save_table(conn, rig['id'], data.get('columns', []), data.pop('rows'))
+        data['rowsRev'] = rev
+    else:
+        # A save without rows (e.g. after a drag) keeps the stored content
+        stored = conn.execute('SELECT data FROM rigs WHERE id = ?', (rig['id'],)).fetchone()
+        old = (json.loads(stored[0]).get('data') or {}) if stored else {}
+        data['rowCount'] = old.get('rowCount', 0)
+        data['rowsRev'] = old.get('rowsRev', 0)
+    return dict(rig, data=data)
+
+
+def check_fields(fields, kind='rig'):
+    # Fields of a partial update; 'data' is merged key by key
+    if not isinstance(fields, dict):
+        raise ItemError(f'Expected an object of {kind} fields')
+    data = fields.get('data', {})
+    if not isinstance(data, dict):
+        raise ItemError(f'{kind.capitalize()} data must be an object')
+    if 'rows' in data and not isinstance(data['rows'], list):
+        raise ItemError('Table rows must be a list')
+    return fields
+
+
+def check_rig(rig, kind='rig'):
+    # Everything is checked before it is queued or written: a bad item in
+    # the write-behind queue would fail every flush of its workspace
+    if not isinstance(rig, dict) or not isinstance(rig.get('id'), str) or not isinstance(rig.get('type'), str):
+        raise ItemError(f'A {kind} needs a string id and type')
+    if not isinstance(rig.get('data'), dict):
+        raise ItemError(f'{kind.capitalize()} data must be an object')
+    return check_fields(rig, kind)
+
+
+def check_connection(connection):
+    if not isinstance(connection, dict) or not all(
+            isinstance(connection.get(key), str) for key in ('id', 'source', 'target')):
+        raise ItemError('A connection needs a string id, source and target')
+    return connection
+
+
+def check_block_connection(connection):
+    check_connection(connection)
+    if connection.setdefault('port', 'next') not in BLOCK_PORTS:
+        raise ItemError(f"A block connection's port is one of {', '.join(BLOCK_PORTS)}")
+    return connection
+
+
+def check_ids(ids, key):
+    # A string here would be deleted one character at a time
+    if not isinstance(ids, list) or not all(isinstance(item_id, str) for item_id in ids):
+        raise ItemError(f'{key} must be a list of ids')
+    return ids
+
+
+def save_rigs(conn, rigs):
+    if not rigs:
+        return
+    rev = _next_rev(conn)
+    rigs = [_split_table(conn, rig, rev) if rig['type'] == 'table' else rig for rig in rigs]
+    conn.executemany('INSERT OR REPLACE INTO rigs (id, type, data, rev) VALUES (?, ?, ?, ?)',
+                     [(rig['id'], rig['type'], json.dumps(rig), rev) for rig in rigs])
+    _unbury(conn, 'rig', [rig['id'] for rig in rigs])
+
+
+def patch_table(conn, rig, cells=(), columns=(), append_rows=0, add_columns=()):
+    # Rewrites only the chunks holding the edited cells; appended rows and
+    # added columns are implicit until written. Returns the old cell values.
+    rev = _next_rev(conn)
+    data = rig['data']
+    data.setdefault('columns', []).extend(add_columns)
+    data['rowCount'] = data.get('rowCount', 0) + append_rows
+    previous = tables.update_cells(conn, rig['id'], cells)
+    for col, name in columns:
+        data['columns'][col] = name
+    if cells or append_rows or add_columns:
+        data['rowsRev'] = rev
+    conn.execute('UPDATE rigs SET data = ?, rev = ? WHERE id = ?', (json.dumps(rig), rev, rig['id']))
+    return previous
+
+
+def load_table(conn, rig, columns=None, start=0, stop=None):
+    data = rig.get('data') or {}
+    return tables.load_table(conn, rig['id'], data.get('columns', []), data.get('rowCount', 0),
+                             columns, start, stop)
+
+
+def iter_table_rows(conn, rig, start=0, stop=None):
+    data = rig.get('data') or {}
+    return tables.iter_rows(conn, rig['id'], data.get('columns', []), data.get('rowCount', 0), start, stop)
+
+
+def load_rig(conn, rig_id):
+    row = conn.execute('SELECT data FROM rigs WHERE id = ?', (rig_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def iter_json_array(conn, sql):
+    # Stored rows are already JSON text; splice them into an array unparsed
+    yield '['
+    for i, (data,) in enumerate(conn.execute(sql)):
+        yield data if i == 0 else ',' + data
+    yield ']'
+
+
+def delete_rigs(conn, rig_ids):
+    if not rig_ids:
+        return
+    rev = _next_rev(conn)
+    conn_ids = []
+    for rig_id in rig_ids:
+        conn_ids += [row[0] for row in conn.execute(
+            'SELECT id FROM connections WHERE source = ? '
+            'UNION SELECT id FROM connections WHERE target = ?', (rig_id, rig_id))]
+    conn.executemany('DELETE FROM rigs WHERE id = ?', [(rig_id,) for rig_id in rig_ids])
+    conn.executemany('DELETE FROM connections WHERE id = ?', [(conn_id,) for conn_id in conn_ids])
+    tables.delete_tables(conn, rig_ids)
+    conn.executemany('DELETE FROM models WHERE rig_id = ?', [(rig_id,) for rig_id in rig_ids])
+    _bury(conn, 'rig', rig_ids, rev)
+    _bury(conn, 'connection', conn_ids, rev)
+
+
+def save_connections(conn, connections):
+    if not connections:
+        return
+    rev = _next_rev(conn)
+    conn.executemany('INSERT OR REPLACE INTO connections (id, source, target, data, rev) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     [(c['id'], c['source'], c['target'], json.dumps(c), rev) for c in connections])
+    _unbury(conn, 'connection', [c['id'] for c in connections])
+
+
+def delete_connections(conn, conn_ids):
+    if not conn_ids:
+        return
+    rev = _next_rev(conn)
+    conn.executemany('DELETE FROM connections WHERE id = ?', [(conn_id,) for conn_id in conn_ids])
+    _bury(conn, 'connection', conn_ids, rev)
+
+
+def load_block(conn, block_id):
+    row = conn.execute('SELECT data FROM code_blocks WHERE id = ?', (block_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_blocks(conn, blocks):
+    if not blocks:
+        return
+    rev = _next_rev(conn)
+    conn.executemany('INSERT OR REPLACE INTO code_blocks (id, type, data, rev) VALUES (?, ?, ?, ?)',
+                     [(block['id'], block['type'], json.dumps(block), rev) for block in blocks])
+    _unbury(conn, 'block', [block['id'] for block in blocks])
+
+
+def delete_blocks(conn, block_ids):
+    if not block_ids:
+        return
+    rev = _next_rev(conn)
+    conn_ids = []
+    for block_id in block_ids:
+        conn_ids += [row[0] for row in conn.execute(
+            'SELECT id FROM block_connections WHERE source = ? '
+            'UNION SELECT id FROM block_connections WHERE target = ?', (block_id, block_id))]
+    conn.executemany('DELETE FROM code_blocks WHERE id = ?', [(block_id,) for block_id in block_ids])
+    conn.executemany('DELETE FROM block_connections WHERE id = ?', [(conn_id,) for conn_id in conn_ids])
+    _bury(conn, 'block', block_ids, rev)
+    _bury(conn, 'block_connection', conn_ids, rev)
+
+
+def save_block_connections(conn, connections):
+    if not connections:
+        return
+    rev = _next_rev(conn)
+    conn.executemany('INSERT OR REPLACE INTO block_connections (id, source, target, data, rev) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     [(c['id'], c['source'], c['target'], json.dumps(c), rev) for c in connections])
+    _unbury(conn, 'block_connection', [c['id'] for c in connections])
+
+
+def delete_block_connections(conn, conn_ids):
+    if not conn_ids:
+        return
+    rev = _next_rev(conn)
+    conn.executemany('DELETE FROM block_connections WHERE id = ?', [(conn_id,) for conn_id in conn_ids])
+    _bury(conn, 'block_connection', conn_ids, rev)
+
+
+def record_write_errors(conn, errors):
+    # errors: (kind, id, message) of items a deferred write had to drop.
+    # They take a revision so change streams pick them up; only the latest
+    # MAX_WRITE_ERRORS are kept.
+    rev = _next_rev(conn)
+    conn.executemany('INSERT INTO write_errors VALUES (?, ?, ?, ?)',
+                     [(rev, kind, item_id, message) for kind, item_id, message in errors])
+    conn.execute('DELETE FROM write_errors WHERE rowid NOT IN '
+                 '(SELECT rowid FROM write_errors ORDER BY rev DESC LIMIT ?)', (MAX_WRITE_ERRORS,))
+
+
+# Tombstone kind -> key of the deleted ids in changes_since()
+DELETED_KEYS = {
+    'rig': 'deletedRigs',
+    'connection': 'deletedConnections',
+    'block': 'deletedBlocks',
+    'block_connection': 'deletedBlockConnections',
+}
+
+
+def changes_since(conn, since):
+    # since=0 is a full load: rows written before revisions existed carry
+    # rev 0, and tombstones and write errors only matter to clients that
+    # were already editing.
+    floor = since if since > 0 else -1
+    changes = {
+        'rev': current_rev(conn),
+        'rigs': [json.loads(row[0]) for row in conn.execute(
+            'SELECT data FROM rigs WHERE rev > ? ORDER BY rev', (floor,))],
+        'connections': [json.loads(row[0]) for row in conn.execute(
+            'SELECT data FROM connections WHERE rev > ? ORDER BY rev', (floor,))],
+        'blocks': [json.loads(row[0]) for row in conn.execute(
+            'SELECT data FROM code_blocks WHERE rev > ? ORDER BY rev', (floor,))],
+        'blockConnections': [json.loads(row[0]) for row in conn.execute(
+            'SELECT data FROM block_connections WHERE rev > ? ORDER BY rev', (floor,))],
+    }
+    changes.update((key, []) for key in DELETED_KEYS.values())
+    changes['writeErrors'] = []
+    if since > 0:
+        for kind, item_id in conn.execute(
+                'SELECT kind, id FROM tombstones WHERE rev > ?', (since,)):
+            changes[DELETED_KEYS[kind]].append(item_id)
+        changes['writeErrors'] = [{'kind': kind, 'id': item_id, 'error': error} for kind, item_id, error in
+                                  conn.execute('SELECT kind, id, error FROM write_errors WHERE rev > ? ORDER BY rev',
+                                               (since,))]
+    return changes
+
@@ -0,0 +1,229 @@
+import json
+import math
+
+import numpy as np
+
+# Table rig cells live column by column in fixed-size row chunks, so a cell
+# edit rewrites one chunk of one column and a projection reads only the
+# columns it needs. Columns whose cells are all numbers (written the way
+# Python would print them, so nothing is lost) are stored as float64 arrays
+# with NaN for empty cells; everything else is stored as JSON text.
+CHUNK_ROWS = 4096
+NUM = 'num'
+TEXT = 'text'
+
+
+def _number(cell):
+    if isinstance(cell, bool):
+        return None
+    if isinstance(cell, (int, float)):
+        return float(cell) if abs(cell) < 2 ** 53 else None
+    if isinstance(cell, str):
+        for cast in (int, float):
+            try:
+                value = cast(cell)
+            except ValueError:
+                continue
+            if str(value) == cell and abs(value) < 2 ** 53:
+                return float(value)
+            return None
+    return None
+
+
+def _is_empty(cell):
+    return cell is None or cell == ''
+
+
+def decode_number(value):
+    if math.isnan(value):
+        return ''
+    return int(value) if value.is_integer() else value
+
+
+def infer_column(cells):
+    values = np.empty(len(cells), dtype=np.float64)
+    for i, cell in enumerate(cells):
+        if _is_empty(cell):
+            values[i] = np.nan
+            continue
+        number = _number(cell)
+        if number is None:
+            return TEXT, ['' if cell is None else cell for cell in cells]
+        values[i] = number
+    return NUM, values
+
+
+class ColumnTable:
+    def __init__(self, names, dtypes, columns):
+        self.names = list(names)
+        self.dtypes = list(dtypes)
+        self.columns = list(columns)
+
+    @classmethod
+    def from_rows(cls, names, rows):
+        dtypes, columns = [], []
+        for i in range(len(names)):
+            dtype, column = infer_column([row[i] if i < len(row) else '' for row in rows])
+            dtypes.append(dtype)
+            columns.append(column)
+        return cls(names, dtypes, columns)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def cells(self, i, start=0, stop=None):
+        column = self.columns[i][start:stop]
+        if self.dtypes[i] == NUM:
+            return [decode_number(v) for v in column.tolist()]
+        return list(column)
+
+    def rows(self, start=0, stop=None):
+        return [list(row) for row in zip(*(self.cells(i, start, stop) for i in range(len(self.names))))]
+
+    def take(self, selector):
+        # selector is a boolean mask or an index array
+        columns = []
+        for dtype, column in zip(self.dtypes, self.columns):
+            if dtype == NUM:
+                columns.append(column[selector])
+            else:
+                picked = np.flatnonzero(selector) if np.asarray(selector).dtype == bool else selector
+                columns.append([column[i] for i in picked])
+        return ColumnTable(self.names, self.dtypes, columns)
+
+    def to_json(self):
+        return {'columns': self.names, 'rows': self.rows()}
+
+
+def encode_chunk(dtype, values):
+    if dtype == NUM:
+        return np.ascontiguousarray(values, dtype='<f8').tobytes()
+    return json.dumps(values, separators=(',', ':')).encode()
+
+
+def decode_chunk(dtype, blob):
+    if dtype == NUM:
+        return np.frombuffer(blob, dtype='<f8')
+    return json.loads(blob)
+
+
+def _write_column(conn, rig_id, col, dtype, values):
+    conn.execute('DELETE FROM table_chunks WHERE rig_id = ? AND col = ?', (rig_id, col))
+    conn.execute('INSERT OR REPLACE INTO table_columns VALUES (?, ?, ?)', (rig_id, col, dtype))
+    conn.executemany('INSERT INTO table_chunks VALUES (?, ?, ?, ?)',
+                     [(rig_id, col, start // CHUNK_ROWS,
+                       encode_chunk(dtype, values[start:start + CHUNK_ROWS]))
+                      for start in range(0, len(values), CHUNK_ROWS)])
+
+
+def save_table(conn, rig_id, names, rows):
+    delete_tables(conn, [rig_id])
+    table = ColumnTable.from_rows(names, rows)
+    for col, (dtype, values) in enumerate(zip(table.dtypes, table.columns)):
+        _write_column(conn, rig_id, col, dtype, values)
+    return len(rows)
+
+
+def delete_tables(conn, rig_ids):
+    conn.executemany('DELETE FROM table_chunks WHERE rig_id = ?', [(rig_id,) for rig_id in rig_ids])
+    conn.executemany('DELETE FROM table_columns WHERE rig_id = ?', [(rig_id,) for rig_id in rig_ids])
+
+
+def _dtypes(conn, rig_id):
+    return dict(conn.execute('SELECT col, dtype FROM table_columns WHERE rig_id = ?', (rig_id,)))
+
+
+def _pad(dtype, values, size):
+    if len(values) >= size:
+        return values
+    if dtype == NUM:
+        return np.concatenate([values, np.full(size - len(values), np.nan)])
+    return values + [''] * (size - len(values))
+
+
+def load_table(conn, rig_id, names, row_count, columns=None, start=0, stop=None):
+    # columns optionally projects by name; start/stop select a row range.
+    # Rows appended or columns added since the last write read as empty.
+    stop = row_count if stop is None else min(stop, row_count)
+    start = min(start, stop)
+    wanted = [names.index(name) for name in columns] if columns is not None else range(len(names))
+    dtypes = _dtypes(conn, rig_id)
+    first, last = start // CHUNK_ROWS, max(stop - 1, start) // CHUNK_ROWS
+    out_dtypes, out_columns = [], []
+    for col in wanted:
+        dtype = dtypes.get(col, TEXT)
+        found = dict(conn.execute(
+            'SELECT chunk, data FROM table_chunks WHERE rig_id = ? AND col = ? AND chunk BETWEEN ? AND ?',
+            (rig_id, col, first, last)))
+        chunks = [_pad(dtype, decode_chunk(dtype, found[chunk]) if chunk in found else
+                       (np.empty(0) if dtype == NUM else []), CHUNK_ROWS)
+                  for chunk in range(first, last + 1)]
+        values = np.concatenate(chunks) if dtype == NUM else [cell for chunk in chunks for cell in chunk]
+        offset = first * CHUNK_ROWS
+        out_dtypes.append(dtype)
+        out_columns.append(values[start - offset:stop - offset])
+    return ColumnTable([names[col] for col in wanted], out_dtypes, out_columns)
+
+
+def iter_rows(conn, rig_id, names, row_count, start=0, stop=None):
+    # One chunk's worth of rows in memory at a time
+    stop = row_count if stop is None else min(stop, row_count)
+    while start < stop:
+        end = min(stop, (start // CHUNK_ROWS + 1) * CHUNK_ROWS)
+        yield from load_table(conn, rig_id, names, row_count, None, start, end).rows()
+        start = end
+
+
+def update_cells(conn, rig_id, cells):
+    # cells: (row, col, value) triples. Returns the previous values in order.
+    dtypes = _dtypes(conn, rig_id)
+    for row, col, value in cells:
+        if dtypes.get(col) == NUM and not _is_empty(value) and _number(value) is None:
+            _widen_column(conn, rig_id, col)
+            dtypes[col] = TEXT
+    chunks = {}
+    previous = []
+    for row, col, value in cells:
+        dtype = dtypes.get(col, TEXT)
+        key = (col, row // CHUNK_ROWS)
+        if key not in chunks:
+            found = conn.execute('SELECT data FROM table_chunks WHERE rig_id = ? AND col = ? AND chunk = ?',
+                                 (rig_id, col, key[1])).fetchone()
+            if found is None:
+                values = np.empty(0) if dtype == NUM else []
+            elif dtype == NUM:
+                values = decode_chunk(dtype, found[0]).copy()
+            else:
+                values = decode_chunk(dtype, found[0])
+            chunks[key] = values
+        values = chunks[key]
+        offset = row % CHUNK_ROWS
+        if offset >= len(values):
+            values = chunks[key] = _pad(dtype, values, offset + 1)
+        if dtype == NUM:
+            previous.append(decode_number(float(values[offset])))
+            values[offset] = np.nan if _is_empty(value) else _number(value)
+        else:
+            previous.append(values[offset])
+            values[offset] = '' if value is None else value
+    for (col, chunk), values in chunks.items():
+        dtype = dtypes.get(col, TEXT)
+        conn.execute('INSERT OR IGNORE INTO table_columns VALUES (?, ?, ?)', (rig_id, col, dtype))
+        conn.execute('INSERT OR REPLACE INTO table_chunks VALUES (?, ?, ?, ?)',
+                     (rig_id, col, chunk, encode_chunk(dtype, values)))
+    return previous
+
+
+def _widen_column(conn, rig_id, col):
+    # Each chunk is converted under its own index, so chunks missing after
+    # appended rows, or short ones, leave every row where it was
+    chunks = conn.execute('SELECT chunk, data FROM table_chunks WHERE rig_id = ? AND col = ?',
+                          (rig_id, col)).fetchall()
+    conn.execute('INSERT OR REPLACE INTO table_columns VALUES (?, ?, ?)', (rig_id, col, TEXT))
+    conn.executemany('INSERT OR REPLACE INTO table_chunks VALUES (?, ?, ?, ?)',
+                     [(rig_id, col, chunk, encode_chunk(TEXT, [decode_number(v) for v in
+                                                              decode_chunk(NUM, blob).tolist()]))
+                      for chunk, blob in chunks])
@@ -0,0 +1,14 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def client(tmp_path_factory):
+    # app opens rigs.db and workspaces/ relative to the working directory
+    os.chdir(tmp_path_factory.mktemp('app'))
+    import app
+    return app.app.test_client()
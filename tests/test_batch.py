@@ -0,0 +1,31 @@
+import pytest
+
+
+def _rig(rig_id):
+    return {'id': rig_id, 'type': 'data', 'x': 0, 'y': 0, 'data': {}}
+
+
+@pytest.mark.parametrize('changes', [
+    {'deleteRigs': 'rig-12'},
+    {'deleteBlocks': [1, 2]},
+    {'deleteConnections': {'id': 'c'}},
+    {'rigs': 'rig-1'},
+    ['rig-1'],
+])
+def test_malformed_batches_are_rejected_whole(client, changes):
+    wid = 'batch-bad'
+    client.post('/api/workspaces', json={'id': wid})
+    client.post(f'/api/workspaces/{wid}/batch', json={'rigs': [_rig('1'), _rig('rig-12')]})
+    response = client.post(f'/api/workspaces/{wid}/batch', json=changes)
+    assert response.status_code == 400
+    ids = {rig['id'] for rig in client.get(f'/api/workspaces/{wid}/rigs').json}
+    assert ids == {'1', 'rig-12'}
+
+
+def test_batch_deletes_listed_ids(client):
+    wid = 'batch-ok'
+    client.post('/api/workspaces', json={'id': wid})
+    client.post(f'/api/workspaces/{wid}/batch', json={'rigs': [_rig('rig-1'), _rig('rig-2')]})
+    response = client.post(f'/api/workspaces/{wid}/batch', json={'deleteRigs': ['rig-1']})
+    assert response.status_code == 200
+    assert [rig['id'] for rig in client.get(f'/api/workspaces/{wid}/rigs').json] == ['rig-2']
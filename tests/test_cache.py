@@ -0,0 +1,25 @@
+def _workspace(client, wid, value):
+    client.post('/api/workspaces', json={'id': wid})
+    rigs = [
+        {'id': 'rig-1', 'type': 'table', 'x': 0, 'y': 0,
+         'data': {'columns': ['a'], 'rows': [[value]]}},
+        {'id': 'rig-2', 'type': 'database', 'x': 0, 'y': 0,
+         'data': {'query': 'SELECT a FROM rig_1'}},
+        {'id': 'rig-3', 'type': 'function', 'x': 0, 'y': 0,
+         'data': {'functionType': 'sum'}},
+    ]
+    for rig in rigs:
+        assert client.post(f'/api/workspaces/{wid}/rigs', json=rig).status_code == 200
+    connection = {'id': 'conn-1', 'source': 'rig-2', 'target': 'rig-3'}
+    assert client.post(f'/api/workspaces/{wid}/connections', json=connection).status_code == 200
+
+
+def test_results_downstream_of_a_database_stay_in_their_workspace(client):
+    # Same ids and same revisions in both workspaces; only the cells differ
+    _workspace(client, 'cache-a', 1)
+    _workspace(client, 'cache-b', 2)
+    outputs = {}
+    for wid in ('cache-a', 'cache-b'):
+        response = client.post(f'/api/workspaces/{wid}/execute', json={'rigs': ['rig-3']})
+        outputs[wid] = response.json['results']['rig-3']['output']
+    assert outputs['cache-a'] != outputs['cache-b'], outputs
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+import codegen
+import sandbox
+import storage
+
+DEFAULTS = {
+    'variable': {'name': 'x', 'value': '0'},
+    'input': {'variable': 'answer', 'prompt': 'Enter value'},
+    'output': {'expression': 'result'},
+    'operation': {'left': 'a', 'operator': '+', 'right': 'b', 'result': 'c'},
+    'condition': {'condition': 'x > 0'},
+    'loop': {'type': 'for', 'variable': 'i', 'start': '0', 'end': '10', 'step': '1'},
+    'function': {'name': 'myFunction', 'params': 'x, y'},
+}
+
+
+def _program(*blocks):
+    blocks = [{'id': f'b{i}', 'type': kind, 'data': data} for i, (kind, data) in enumerate(blocks)]
+    connections = [{'source': a['id'], 'target': b['id']} for a, b in zip(blocks, blocks[1:])]
+    return blocks, connections
+
+
+@pytest.mark.parametrize('language', codegen.LANGUAGES)
+def test_default_blocks_generate(language):
+    code, _ = codegen.codegen(language, *_program(*DEFAULTS.items()))
+    assert 'myFunction' in code
+
+
+@pytest.mark.parametrize('kind, field, value', [
+    ('variable', 'value', '0\nimport os'),
+    ('variable', 'value', '().__class__'),
+    ('variable', 'value', '__import__("os")'),
+    ('variable', 'value', 'f"{open}"'),
+    ('variable', 'value', '1; x = 2'),
+    ('variable', 'name', 'os = 1\nx'),
+    ('output', 'expression', 'x)\nprint(1'),
+    ('condition', 'condition', 'lambda: 1'),
+    ('operation', 'operator', '+ 1 +'),
+    ('function', 'params', 'x=__builtins__'),
+])
+def test_fields_outside_their_role_are_rejected(kind, field, value):
+    with pytest.raises(codegen.CodegenError):
+        codegen.codegen('python', *_program((kind, dict(DEFAULTS[kind], **{field: value}))))
+
+
+def test_prompt_is_quoted():
+    prompt = 'a") or print("owned'
+    code, _ = codegen.codegen('python', *_program(('input', {'variable': 'x', 'prompt': prompt})))
+    compiled = compile(code, '<program>', 'exec')
+    assert prompt in compiled.co_consts
+
+
+def test_run_is_disabled_by_default(client):
+    assert not sandbox.RUN_PROGRAMS
+    response = client.post('/api/run', json={'blocks': [], 'connections': []})
+    assert response.status_code == 403
+
+
+def _graph(blocks, connections):
+    blocks = [{'id': block_id, 'type': kind, 'data': DEFAULTS.get(kind, {})} for block_id, kind in blocks]
+    connections = [{'source': source, 'target': target, 'port': port} for source, target, port in connections]
+    return blocks, connections
+
+
+def test_body_follows_the_port_not_the_connection_order():
+    blocks, connections = _graph(
+        [('if', 'condition'), ('inside', 'output'), ('after', 'variable')],
+        [('if', 'after', 'next'), ('if', 'inside', 'body')])
+    code, _ = codegen.codegen('python', blocks, connections)
+    assert code == 'if x > 0:\n    print(result)\nx = 0\n'
+    code, _ = codegen.codegen('python', blocks, connections[::-1])
+    assert code == 'if x > 0:\n    print(result)\nx = 0\n'
+
+
+def test_nested_bodies():
+    blocks, connections = _graph(
+        [('f', 'function'), ('outer', 'loop'), ('if', 'condition'), ('inside', 'output'),
+         ('in-loop', 'variable'), ('after', 'operation')],
+        [('outer', 'in-loop', 'next'), ('f', 'outer', 'body'), ('if', 'inside', 'body'),
+         ('f', 'after', 'next'), ('outer', 'if', 'body')])
+    code, _ = codegen.codegen('python', blocks, connections)
+    assert code == ('def myFunction(x, y):\n'
+                    '    for i in range(0, 10):\n'
+                    '        if x > 0:\n'
+                    '            print(result)\n'
+                    '    x = 0\n'
+                    'c = a + b\n')
+
+
+def test_empty_body_and_connections_without_ports():
+    blocks, connections = _graph([('loop', 'loop'), ('after', 'output')], [('loop', 'after', 'next')])
+    code, _ = codegen.codegen('python', blocks, connections)
+    assert code == 'for i in range(0, 10):\n    pass\nprint(result)\n'
+    # Saved before ports existed: the first connection out is the body
+    code, _ = codegen.codegen('python', blocks, [{'source': 'loop', 'target': 'after'}])
+    assert code == 'for i in range(0, 10):\n    print(result)\n'
+
+
+def test_migration_gives_stored_connections_ports():
+    conn = storage.connect(':memory:')
+    storage.migrate(conn)
+    with storage.atomic(conn):
+        storage.save_blocks(conn, [{'id': 'if', 'type': 'condition', 'data': {}},
+                                   {'id': 'a', 'type': 'output', 'data': {}}])
+        for source, target in [('if', 'a'), ('if', 'b'), ('a', 'c')]:
+            conn.execute('INSERT INTO block_connections (id, source, target, data) VALUES (?, ?, ?, ?)',
+                         (target, source, target, json.dumps({'id': target, 'source': source, 'target': target})))
+    conn.execute(f'PRAGMA user_version = {storage.MIGRATIONS.index(storage._migrate_block_ports)}')
+    storage.migrate(conn)
+    ports = {json.loads(data)['id']: json.loads(data)['port']
+             for (data,) in conn.execute('SELECT data FROM block_connections')}
+    assert ports == {'a': 'body', 'b': 'next', 'c': 'next'}
@@ -0,0 +1,13 @@
+def test_table_names_with_quotes_are_escaped(client):
+    wid = 'database-quotes'
+    client.post('/api/workspaces', json={'id': wid})
+    rigs = [
+        {'id': 'rig-"q', 'type': 'table', 'x': 0, 'y': 0, 'data': {'columns': ['a"b'], 'rows': [[1], [2]]}},
+        # The trailing comment names the table as the id-derived rig_"q so it is loaded
+        {'id': 'rig-d', 'type': 'database', 'x': 0, 'y': 0,
+         'data': {'query': 'SELECT sum("a""b") AS total FROM "rig_""q" -- rig_"q'}},
+    ]
+    client.post(f'/api/workspaces/{wid}/batch', json={'rigs': rigs})
+    result = client.post(f'/api/workspaces/{wid}/execute', json={'rigs': ['rig-d']}).json['results']['rig-d']
+    assert result['status'] == 'success', result
+    assert result['output'] == {'columns': ['total'], 'rows': [[3]]}
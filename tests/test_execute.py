@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.mark.parametrize('options', [
+    {'maxWorkers': '4'},
+    {'maxWorkers': 0},
+    {'maxWorkers': True},
+    {'backend': 'fork'},
+    {'backend': 1},
+])
+def test_bad_run_options_are_rejected(client, options):
+    assert client.post('/api/execute', json=options).status_code == 400
+    response = client.post('/api/jobs', json={'kind': 'execute', 'params': options})
+    assert response.status_code == 400
+
+
+def test_run_options_pass_through(client):
+    response = client.post('/api/execute', json={'maxWorkers': 2, 'backend': 'thread'})
+    assert response.status_code == 200
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+
+def _table(client, wid, rows):
+    client.post('/api/workspaces', json={'id': wid})
+    rigs = [{'id': 'rig-t', 'type': 'table', 'x': 0, 'y': 0,
+             'data': {'columns': ['a', 'b'], 'rows': rows}}]
+    connections = []
+    for function_type in ('sum', 'average'):
+        rigs.append({'id': f'rig-{function_type}', 'type': 'function', 'x': 0, 'y': 0,
+                     'data': {'functionType': function_type}})
+        connections.append({'id': f'conn-{function_type}', 'source': 'rig-t', 'target': f'rig-{function_type}'})
+    client.post(f'/api/workspaces/{wid}/batch', json={'rigs': rigs, 'connections': connections})
+
+
+@pytest.mark.parametrize('body', [
+    [{'row': 0, 'col': 0, 'value': 1}],
+    {'cells': ['x']},
+    {'cells': {'row': 0, 'col': 0}},
+    {'columns': [3]},
+    {'addColumns': 'c'},
+    {'addColumns': [['c']]},
+])
+def test_malformed_patches_are_rejected(client, body):
+    _table(client, 'patch-bad', [[1, 2]])
+    assert client.patch('/api/workspaces/patch-bad/rigs/rig-t/cells', json=body).status_code == 400
+
+
+def test_incremental_aggregates_match_a_full_recompute(client):
+    wid = 'patch-sums'
+    rows = [[i, i * 0.5] for i in range(50)]
+    _table(client, wid, rows)
+    client.post(f'/api/workspaces/{wid}/execute', json={})
+    values = [3, -7.25, '', 'text', '12', None, 0, 1e6]
+    randomly = random.Random(8)
+    for _ in range(40):
+        cells = [{'row': randomly.randrange(50), 'col': randomly.randrange(2), 'value': randomly.choice(values)}
+                 for _ in range(randomly.randrange(1, 4))]
+        response = client.patch(f'/api/workspaces/{wid}/rigs/rig-t/cells', json={'cells': cells})
+        assert response.status_code == 200
+        patched = response.json['results']
+        client.delete('/api/cache')
+        full = client.post(f'/api/workspaces/{wid}/execute', json={}).json['results']
+        for rig_id in ('rig-sum', 'rig-average'):
+            assert patched[rig_id]['output']['columns'] == full[rig_id]['output']['columns']
+            assert patched[rig_id]['output']['rows'][0] == pytest.approx(full[rig_id]['output']['rows'][0])
@@ -0,0 +1,16 @@
+import pytest
+
+import engine
+import jobs
+
+
+def test_training_without_inputs_runs_nothing(client, monkeypatch):
+    wid = 'jobs-lonely'
+    client.post('/api/workspaces', json={'id': wid})
+    rig = {'id': 'rig-n', 'type': 'neural', 'x': 0, 'y': 0, 'data': {}}
+    client.post(f'/api/workspaces/{wid}/batch', json={'rigs': [rig]})
+    ran = []
+    monkeypatch.setattr(engine, 'run', lambda *args, **kwargs: ran.append(args))
+    with pytest.raises(jobs.JobError):
+        jobs.run_train(jobs.Job(wid, 'job-1', {'rig': 'rig-n'}))
+    assert ran == []
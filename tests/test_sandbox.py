@@ -0,0 +1,63 @@
+import os
+import pwd
+
+import pytest
+
+import sandbox
+
+
+def test_run_returns_output_and_stdout():
+    output, stdout = sandbox.pool.run('print("hi")\nreturn sum(len(x) for x in input)', [[1, 2], [3]])
+    assert output == 3
+    assert stdout == 'hi\n'
+
+
+def test_run_reports_errors():
+    with pytest.raises(sandbox.SandboxError):
+        sandbox.pool.run('return 1 / 0', [])
+
+
+def test_stream_program_yields_output():
+    program = sandbox.pool.stream_program('print(input())', ['x'])
+    assert ''.join(program) == 'x\n'
+
+
+@pytest.mark.parametrize('code', [
+    "import statistics\nstatistics.sys.modules['_socket'].socket()",
+    "import random\nrandom._os.listdir('/')",
+    "import random\nrandom._os.remove('/tmp/nothing-here')",
+    "import statistics\nstatistics.sys.modules['builtins'].open('/tmp/sandbox-escape', 'w')",
+])
+def test_program_cannot_reach_outside(code):
+    with pytest.raises(sandbox.SandboxError, match='PermissionError'):
+        ''.join(sandbox.pool.stream_program(code))
+
+
+@pytest.mark.parametrize('code', [
+    # Rebinding the module's blocklist must not loosen the hook
+    "import statistics\nstatistics.sys.modules['__main__'].BLOCKED_EVENTS = ()\n"
+    "statistics.sys.modules['_socket'].socket()",
+    "import statistics\nstatistics.sys.modules['__main__'].BLOCKED_EVENTS = ()\n"
+    "statistics.sys.modules['os'].system('true')",
+    "import statistics\nstatistics.sys.modules['builtins'].PermissionError = KeyError\n"
+    "statistics.sys.modules['os'].listdir('/')",
+    # Reads outside the standard library
+    "import statistics\nstatistics.sys.modules['builtins'].open('/etc/hostname').read()",
+    "import random\nrandom._os.open('/proc/self/environ', 0)",
+    "import random\nrandom._os.open(random._os.path.dirname(random.__file__) + '/../../../etc/hostname', 0)",
+    "import random\nrandom._os.open('/proc/' + str(random._os.getppid()) + '/cwd/app.py', 0)",
+    # Frames lead to the hook's closure
+    "try:\n    1 / 0\nexcept ZeroDivisionError as e:\n    e.__traceback__.tb_frame",
+])
+def test_program_cannot_loosen_the_hook(code):
+    with pytest.raises(sandbox.SandboxError, match='PermissionError'):
+        ''.join(sandbox.pool.stream_program(code))
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason='workers only switch user when started by root')
+def test_worker_runs_unprivileged(caplog):
+    pool = sandbox.SandboxPool(size=1)
+    output = ''.join(pool.stream_program('import random\nprint(random._os.getuid())'))
+    if 'cannot run as' in caplog.text:
+        pytest.skip('this interpreter is not reachable by the sandbox user')
+    assert int(output) == pwd.getpwnam(sandbox.USER).pw_uid
@@ -0,0 +1,18 @@
+import scheduler
+
+
+def test_cache_hits_are_not_rerun_after_a_wait():
+    # a and b go through the pool one at a time; h is a hit that becomes
+    # ready after the first wait()
+    upstream = {'a': [], 'b': [], 'h': ['a']}
+    ran = []
+
+    def fn(payload, inputs):
+        ran.append(payload)
+        return {'status': 'success', 'output': payload}
+
+    cached = {'status': 'success', 'output': 'cached'}
+    results = scheduler.run_dag(upstream, ['a', 'b', 'h'], fn, {n: n for n in upstream},
+                                backend='thread', max_workers=1, done={'h': cached})
+    assert results['h'] == cached
+    assert sorted(ran) == ['a', 'b']
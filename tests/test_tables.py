@@ -0,0 +1,23 @@
+import storage
+
+
+def _table(rows):
+    conn = storage.connect(':memory:')
+    storage.migrate(conn)
+    rig = {'id': 'rig-1', 'type': 'table', 'data': {'columns': ['a'], 'rows': rows}}
+    with storage.atomic(conn):
+        storage.save_rigs(conn, [rig])
+    return conn, storage.load_rig(conn, 'rig-1')
+
+
+def test_widening_keeps_rows_after_gaps_in_place():
+    conn, rig = _table([[1], [2], [3]])
+    with storage.atomic(conn):
+        storage.patch_table(conn, rig, append_rows=5000)
+        storage.patch_table(conn, rig, cells=[(4500, 0, 7)])
+        storage.patch_table(conn, rig, cells=[(0, 0, 'hello')])
+    column = storage.load_table(conn, rig).columns[0]
+    assert column[:3] == ['hello', 2, 3]
+    assert column[4500] == 7
+    assert column[407] == ''
+    assert len(column) == 5003
@@ -0,0 +1,20 @@
+import os
+
+import storage
+
+
+def test_reads_do_not_create_workspaces(client):
+    for path in ('rigs', 'changes', 'events', 'jobs', 'snapshots'):
+        assert client.get(f'/api/workspaces/never-made/{path}').status_code == 404
+    assert client.post('/api/workspaces/never-made/rigs', json={'id': 'r', 'type': 'data', 'data': {}}).status_code == 404
+    assert not os.path.exists(storage.workspace_path('never-made'))
+    assert 'never-made' not in client.get('/api/workspaces').json
+
+
+def test_post_creates_a_workspace_once(client):
+    assert client.post('/api/workspaces', json={'id': 'made'}).status_code == 201
+    assert client.post('/api/workspaces', json={'id': 'made'}).status_code == 200
+    assert client.get('/api/workspaces/made/rigs').json == []
+    assert 'made' in client.get('/api/workspaces').json
+    assert client.post('/api/workspaces', json={'id': '../x'}).status_code == 400
+    assert client.post('/api/workspaces', json=['made']).status_code == 400
@@ -0,0 +1,24 @@
+import writeback
+
+
+def test_dropped_writes_are_reported_in_changes(client, monkeypatch):
+    wid = 'writeback-drop'
+    client.post('/api/workspaces', json={'id': wid})
+    since = client.get(f'/api/workspaces/{wid}/changes').json['rev']
+    load, save = writeback.KINDS['rig']
+
+    def save_or_fail(conn, rigs):
+        if any(rig['id'] == 'rig-bad' for rig in rigs):
+            raise ValueError('cannot store rig-bad')
+        save(conn, rigs)
+
+    monkeypatch.setitem(writeback.KINDS, 'rig', (load, save_or_fail))
+    for rig_id in ('rig-good', 'rig-bad'):
+        rig = {'id': rig_id, 'type': 'data', 'x': 0, 'y': 0, 'data': {}}
+        assert client.post(f'/api/workspaces/{wid}/rigs', json=rig).status_code == 200
+    changes = client.get(f'/api/workspaces/{wid}/changes?since={since}').json
+    assert [rig['id'] for rig in changes['rigs']] == ['rig-good']
+    assert changes['writeErrors'] == [{'kind': 'rig', 'id': 'rig-bad', 'error': 'cannot store rig-bad'}]
+    # Reported once: later changes start after it
+    later = client.get(f"/api/workspaces/{wid}/changes?since={changes['rev']}").json
+    assert later['writeErrors'] == []
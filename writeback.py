@@ -0,0 +1,220 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import storage
+
+# Autosave traffic (drags, typing) resends the same rig or code block many
+# times a second. Upserts are held for WINDOW seconds per workspace, later
+# copies of an item replace or merge into earlier ones, and each workspace is
+# flushed in one transaction.
+# RIG_WRITE_BEHIND_MS=0 writes straight through.
+#
+# Requests read their own writes because each one flushes its workspace's
+# queue first (app.flush_queued_rigs). The queue belongs to one process, so
+# this holds for a single gunicorn worker, which is how gunicorn.conf.py
+# runs the app. With more workers, a read served by another worker can miss
+# queued writes for up to WINDOW seconds; set RIG_WRITE_BEHIND_MS=0 first.
+# The client has already been answered when its item is written, so an item
+# that can never be stored is reported as a write error in the workspace's
+# changes (storage.record_write_errors) rather than to the request.
+WINDOW = int(os.environ.get('RIG_WRITE_BEHIND_MS', 250)) / 1000.0
+
+log = logging.getLogger(__name__)
+
+# Kinds of queued item: how to load a stored one and save a list of them
+KINDS = {
+    'rig': (storage.load_rig, storage.save_rigs),
+    'block': (storage.load_block, storage.save_blocks),
+}
+
+
+def apply_fields(rig, fields):
+    # Top-level fields replace, 'data' is merged key by key
+    merged = dict(rig, **{k: v for k, v in fields.items() if k not in ('id', 'type', 'data')})
+    if 'data' in fields:
+        merged['data'] = dict(rig.get('data') or {}, **(fields['data'] or {}))
+    return merged
+
+
+def _merge(old, new):
+    # Entries are ('put', rig) or ('merge', fields); a merge folds into
+    # whatever is queued before it. A table save without rows must not drop
+    # rows still waiting to be written.
+    if old is None:
+        return new
+    (old_kind, old_value), (kind, value) = old, new
+    if kind == 'merge':
+        return old_kind, apply_fields(old_value, value)
+    if old_kind == 'put' and value['type'] == 'table' and 'rows' in (old_value.get('data') or {}) \
+            and 'rows' not in (value.get('data') or {}):
+        value = dict(value, data=dict(value.get('data') or {}, rows=old_value['data']['rows']))
+    return kind, value
+
+
+class WriteBehind:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.pending = {}  # workspace -> (first queued at, {(kind, id): entry})
+        self.lock = threading.Condition()
+        self.flush_locks = {}
+        self.thread = None
+        self.pid = None
+        self.stats = {'queued': 0, 'coalesced': 0, 'persisted': 0, 'flushes': 0, 'failures': 0,
+                      'dropped': 0}
+
+    def _start(self):
+        # Called with the lock held; a forked worker starts its own thread
+        if self.pid != os.getpid():
+            self.pending = {}
+            self.flush_locks = {}
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self.thread.start()
+
+    def put(self, workspace, item, kind='rig'):
+        self._queue(workspace, (kind, item['id']), ('put', item))
+
+    def merge(self, workspace, item_id, fields, kind='rig'):
+        # Only the given fields change, so concurrent editors of different
+        # fields of one rig do not overwrite each other
+        self._queue(workspace, (kind, item_id), ('merge', fields))
+
+    def _queue(self, workspace, key, entry):
+        if self.window <= 0:
+            with storage.transaction(workspace) as conn:
+                self._write(conn, {key: entry})
+            with self.lock:
+                self.stats['queued'] += 1
+                self.stats['persisted'] += 1
+            return
+        with self.lock:
+            self._start()
+            self.flush_locks.setdefault(workspace, threading.Lock())
+            queued_at, items = self.pending.setdefault(workspace, (time.monotonic(), {}))
+            old = items.pop(key, None)
+            items[key] = _merge(old, entry)
+            self.stats['queued'] += 1
+            if old is not None:
+                self.stats['coalesced'] += 1
+            self.lock.notify()
+
+    def _write(self, conn, entries):
+        # Merges apply to the stored item; one whose item is gone is dropped
+        items = {kind: [] for kind in KINDS}
+        for (kind, item_id), (action, value) in entries.items():
+            if action == 'put':
+                items[kind].append(value)
+                continue
+            stored = KINDS[kind][0](conn, item_id)
+            if stored is not None:
+                items[kind].append(apply_fields(stored, value))
+        for kind, (_, save) in KINDS.items():
+            save(conn, items[kind])
+
+    def flush(self, workspace):
+        # Also called before any other request touches the workspace, so
+        # reads and later writes always see the queued items.
+        with self.lock:
+            flush_lock = self.flush_locks.get(workspace) if self.pid == os.getpid() else None
+        if flush_lock is None:
+            return
+        # Taken even when nothing is pending, to wait out a flush in progress
+        with flush_lock:
+            with self.lock:
+                _, items = self.pending.pop(workspace, (None, {}))
+            if not items:
+                return
+            try:
+                with storage.transaction(workspace) as conn:
+                    self._write(conn, items)
+            except sqlite3.OperationalError:
+                # Locked or busy: worth retrying on the next flush
+                self._requeue(workspace, items)
+                raise
+            except Exception:
+                # Some item can never be written; find it instead of
+                # failing every flush (and request) of the workspace
+                log.exception('write-behind flush of %s failed, writing items one by one', workspace)
+            else:
+                with self.lock:
+                    self.stats['flushes'] += 1
+                    self.stats['persisted'] += len(items)
+                return
+            self._write_each(workspace, items)
+
+    def _requeue(self, workspace, items):
+        # Put them back unless a newer copy arrived meanwhile
+        with self.lock:
+            self.stats['failures'] += 1
+            queued_at, newer = self.pending.setdefault(workspace, (time.monotonic(), {}))
+            for key, entry in items.items():
+                newer[key] = _merge(entry, newer[key]) if key in newer else entry
+
+    def _write_each(self, workspace, items):
+        # Each item in its own transaction; one that fails other than on a
+        # lock is logged and dropped
+        retry, error, dropped = {}, None, []
+        for key, entry in items.items():
+            try:
+                with storage.transaction(workspace) as conn:
+                    self._write(conn, {key: entry})
+            except sqlite3.OperationalError as e:
+                retry[key], error = entry, e
+                continue
+            except Exception as e:
+                log.exception('write-behind dropped %s %r of %s', key[0], key[1], workspace)
+                with self.lock:
+                    self.stats['dropped'] += 1
+                dropped.append((key[0], key[1], str(e)))
+                continue
+            with self.lock:
+                self.stats['persisted'] += 1
+        if dropped:
+            try:
+                with storage.transaction(workspace) as conn:
+                    storage.record_write_errors(conn, dropped)
+            except Exception:
+                log.exception('could not record write errors of %s', workspace)
+        if retry:
+            self._requeue(workspace, retry)
+            raise error
+
+    def flush_all(self):
+        with self.lock:
+            workspaces = list(self.pending) if self.pid == os.getpid() else []
+        for workspace in workspaces:
+            try:
+                self.flush(workspace)
+            except Exception:
+                log.exception('write-behind flush of %s failed', workspace)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                due = [ws for ws, (queued_at, _) in self.pending.items() if now - queued_at >= self.window]
+                if not due:
+                    waits = [queued_at + self.window - now for queued_at, _ in self.pending.values()]
+                    self.lock.wait(min(waits) if waits else None)
+                    continue
+            for workspace in due:
+                try:
+                    self.flush(workspace)
+                except Exception:
+                    log.exception('write-behind flush of %s failed', workspace)
+                    time.sleep(self.window)
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats, window=self.window,
+                         pending=sum(len(items) for _, items in self.pending.values()))
+        stats['coalesceRate'] = round(stats['coalesced'] / stats['queued'], 4) if stats['queued'] else 0.0
+        return stats
+
+
+writes = WriteBehind()
+atexit.register(writes.flush_all)